@@ -0,0 +1,120 @@
+"""HTML export parsing benchmark of extract dl.
+
+Generates a synthetic Covidence HTML export and compares the former full
+BeautifulSoup tree with the streaming parser of slh_sh.utils.html, in time,
+peak Python memory and time to the first (ID, URL) pair.
+
+    python benchmarks/html_parse.py --studies 20000 --output html_parse.json
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+
+STUDY = """<div class="study">
+  <div class="study-header"><span>Study</span> #{id} Smith 2020 &amp; co</div>
+  <div class="study-body"><p>{text}</p>
+    <ul><li>Author A</li><li>Author B</li></ul>
+    <a class="download" href="https://files.example.org/{id}.pdf?token=abc">Download</a>
+  </div>
+</div>
+"""
+
+
+def make_export(path: str, studies: int):
+    """Writes a Covidence like HTML export with one study header and download link per study
+
+    Args:
+        path (str): Target file
+        studies (int): Number of studies
+    """
+    text = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+    with open(path, "w") as f:
+        f.write("<html><head><title>Export</title></head><body>\n")
+        for id in range(1, studies + 1):
+            f.write(STUDY.format(id=id, text=text))
+        f.write("</body></html>\n")
+
+
+def soup_links(html: str, html_id_element: str, html_dl_class: str):
+    """The former extract_dl parsing, a full html.parser tree of the export"""
+    from bs4 import BeautifulSoup
+
+    with open(html, "r") as f:
+        html_string = f.read()
+    soup = BeautifulSoup(html_string, "html.parser")
+    for study_header in soup.find_all("div", class_=html_id_element):
+        id = re.findall(r"#(\d+)", study_header.text)[0]
+        yield id, study_header.parent.find("a", class_=html_dl_class)["href"]
+
+
+def measure(name: str, parse) -> dict:
+    """Runs a parser twice, timed, then under tracemalloc for its peak memory
+
+    Args:
+        name (str): Name of the parser
+        parse (Callable): Returns a fresh (ID, URL) iterator
+
+    Returns:
+        dict: parser, links, first_link_s, total_s and peak_mb
+    """
+    # the garbage of the previous parser is not counted
+    gc.collect()
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in parse():
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in parse():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "parser": name,
+        "links": count,
+        "first_link_s": round(first or 0, 4),
+        "total_s": round(total, 4),
+        "peak_mb": round(peak / 2**20, 1),
+    }
+
+
+def main():
+    from slh_sh.utils.html import iter_download_links
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--studies", type=int, default=5000)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        html = os.path.join(tmp, "export.html")
+        make_export(html, args.studies)
+        size_mb = os.path.getsize(html) / 2**20
+        results = [
+            measure("soup", lambda: soup_links(html, "study-header", "download")),
+            measure("stream", lambda: iter_download_links(html, "study-header", "download")),
+        ]
+
+    print(f"export: {args.studies} studies, {size_mb:.1f} MB")
+    for res in results:
+        print(
+            f"{res['parser']:<8} {res['total_s']:>8.3f}s  first link {res['first_link_s']:.4f}s"
+            f"  peak {res['peak_mb']:.1f} MB  ({res['links']} links)"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
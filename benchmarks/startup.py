@@ -0,0 +1,75 @@
+"""Startup benchmark of the slh-sh CLI.
+
+Measures, in a fresh interpreter per sample, the time to import the CLI and
+resolve each registered command, i.e. the import cost a shell loop pays for
+`slh-sh <command>`.
+
+    python benchmarks/startup.py --runs 5 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import sys, time
+start = time.perf_counter()
+from slh_sh.main import app, SlhGroup
+import typer
+group = typer.main.get_group(app)
+name = sys.argv[1]
+if name != "--help":
+    group.load(name)
+print(time.perf_counter() - start)
+"""
+
+
+def measure(name: str, runs: int) -> dict:
+    """Returns the import timings of a command in seconds.
+
+    Args:
+        name (str): Registered command name, or --help for the bare CLI
+        runs (int): Number of fresh interpreters to sample
+
+    Returns:
+        dict: command, median and min import time
+    """
+    samples = []
+    for _ in range(runs):
+        res = subprocess.run(
+            [sys.executable, "-c", SNIPPET, name],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(float(res.stdout.strip().splitlines()[-1]))
+    return {
+        "command": name,
+        "median_s": round(statistics.median(samples), 4),
+        "min_s": round(min(samples), 4),
+    }
+
+
+def main():
+    from slh_sh.main import SlhGroup
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [measure("--help", args.runs)]
+    for name in SlhGroup.lazy_commands:
+        results.append(measure(name, args.runs))
+
+    for res in results:
+        print(f"{res['command']:<10} {res['median_s']:>8.4f}s  (min {res['min_s']:.4f}s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
 import typer
 import sqlite3 as sql
-import csv as csvimport
 
 from typing_extensions import Annotated
 from rich import print
 
 from slh_sh.utils.file import get_conf
+from slh_sh.modules.add import import_csv
 from slh_sh.utils.log import logger
 
 app = typer.Typer(no_args_is_help=True)
@@ -43,73 +43,90 @@ def csv(
         """
     )
 
-    with open(get_conf("csv_export"), "r") as f:
-        reader = csvimport.reader(f)
-        # Read the first line of the file to get the CSV headers
-        headers = next(reader)
-
-        headers = [header.replace(" ", "_").replace("_#", "") for header in headers]
-
-        conn = sql.connect(get_conf("sqlite_db"))
-        curr = conn.cursor()
-
-        # check if default_id is not empty in config.yaml
-        if get_conf("default_id") == "":
-            print(
-                "default_id is empty in config.yaml incremental number will be used as id."
-            )
-            # Create a new table in the SQLite database with the same columns as the CSV file headers and add an id column
-            curr.execute(
-                f"""CREATE TABLE IF NOT EXISTS studies (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                {", ".join(headers)}
-            )"""
-            )
-        else:
-            # Create a new table in the SQLite database with the same columns as the CSV file headers
-            curr.execute(
-                f"""CREATE TABLE IF NOT EXISTS studies (
-                {", ".join(headers)}
-            )"""
-            )
-
-            # Iterate over the rows of the CSV file and insert each row into the table in the database
-            rows = []
-            for row in reader:
-                rows.append(tuple(row))
-
-            # check if the study is already in the database based on the covidence number as id if not insert it
-            for row in rows:
-                curr.execute(
-                    f"SELECT * FROM studies WHERE ? = ?",
-                    (
-                        get_conf("default_id"),
-                        row[12],
-                    ),
-                )
-                if len(curr.fetchall()) > 0:
-                    print(
-                        f":information_desk_person: {row[12]} is already in the database."
-                    )
-                else:
-                    curr.execute(
-                        # insert row into sqlite db
-                        f"INSERT INTO studies ({', '.join(headers.lower())}) VALUES ({', '.join([f'?' for i in range(len(headers.lower()))])})",
-                        row,
-                    )
-                    print(f":star: {row[12]} added to the database.")
-
+    try:
+        counts = import_csv(csv, get_conf("default_id"))
+    except sql.IntegrityError:
+        print(
+            f"""
+        [bold red]Error[/bold red]: the studies table has duplicate {get_conf("default_id")} values,
+        remove the duplicates and try again.
+        """
+        )
+        raise typer.Exit(code=1)
+    except ValueError as e:
+        print(f"[bold red]Error[/bold red]: {e}")
+        raise typer.Exit(code=1)
+
+    if get_conf("default_id") == "":
+        print(
+            "default_id is empty in config.yaml incremental number will be used as id."
+        )
+
+    total = sum(counts.values())
     print(
         f"""
-        :tada: {len(rows)} studies processed.
+        :tada: {total} studies processed.
+
+        :star: {counts["inserted"]} added to the database.
+        :pencil: {counts["updated"]} updated.
+        :information_desk_person: {counts["unchanged"]} already in the database.
 
         """
     )
 
-    f.close()
-    conn.commit()
-    conn.close()
+    logger().info(
+        f"{total} studies processed from {csv} to {get_conf('sqlite_db')}: {counts}"
+    )
+
+
+@app.command("pdfs")
+def pdfs(
+    link: Annotated[
+        bool,
+        typer.Option(
+            help="Replace duplicates by links to one file to free disk space, annotating one of them in place changes all"
+        ),
+    ] = False,
+    prune: Annotated[
+        bool,
+        typer.Option(help="Remove the stored PDFs no ID named file links to any more"),
+    ] = False,
+):
+    """Adds the PDFs to the content-addressed store and reports duplicates."""
+    from slh_sh.modules.batch import pdf_tasks
+    from slh_sh.utils.file import get_pdf_dir
+    from slh_sh.utils.store import prune_store, store_files
+
+    pdf_dir = get_pdf_dir()
+    print(f"Adding the PDFs of {pdf_dir} to the store...")
+
+    report = store_files(pdf_dir, [pdf_path for _, pdf_path in pdf_tasks(pdf_dir)], link)
+    counts = {
+        status: sum(stored.status == status for stored in report.files)
+        for status in ("added", "linked", "duplicate", "stored")
+    }
+    print(
+        f"""
+        :tada: {len(report.files)} PDFs processed.
+
+        :star: {counts["added"]} added to the store.
+        :link: {counts["linked"]} duplicates replaced by a link, {counts["duplicate"]} kept as copies.
+        :information_desk_person: {counts["stored"]} already in the store.
+        """
+    )
+    if counts["linked"]:
+        print(
+            "[yellow]Warning[/yellow]: linked PDFs share one file, a viewer saving annotations in place changes all of them."
+        )
+    for sha256, names in report.duplicates.items():
+        print(f"[yellow]Same file[/yellow] {sha256[:12]}: {', '.join(names)}")
+    for pdf_path, error in report.errors.items():
+        print(f"[bold red]Failed:[/bold red] {pdf_path}: {error}")
+
+    if prune:
+        removed = prune_store(pdf_dir)
+        print(f":wastebasket: {len(removed)} unused PDFs removed from the store.")
 
     logger().info(
-        f"{len(rows)} studies processed from {csv} to {get_conf('sqlite_db')}"
+        f"{len(report.files)} PDFs of {pdf_dir} stored: {counts}, {len(report.duplicates)} duplicate groups, {len(report.errors)} failed."
     )
@@ -1,5 +1,4 @@
 import typer
-import os
 
 from rich import print
 from pathlib import Path
@@ -7,20 +6,27 @@ from typing_extensions import Annotated
 
 from slh_sh.utils.file import get_pdf_dir, get_file_path, get_conf
 from slh_sh.utils.log import logger
-from slh_sh.modules.extract import (
-    extract_cit,
-    extract_bib,
-    extract_dl,
-    extract_filename,
-    extract_keywords,
-    extract_annots,
-    extract_dist,
-    extract_total_dist_sheet_sync,
-    extract_dist_ws_sheet_sync,
-)
+
+# slh_sh.modules.extract pulls in fitz, pandas and gspread,
+# it is imported inside the commands so `slh-sh extract --help` stays fast.
 
 app = typer.Typer(no_args_is_help=True)
 
+
+def print_failed(summary):
+    """Prints the PDFs of a batch that could not be extracted"""
+    for r in summary.failed:
+        print(f"[bold red]Failed:[/bold red] {r.pdf_path}: {r.error}")
+
+
+def print_skipped(summary):
+    """Prints the number of PDFs of a batch skipped as unchanged"""
+    if summary.skipped:
+        print(
+            f"Skipped {len(summary.skipped)} unchanged PDFs, use --force to extract them again."
+        )
+
+
 ##
 ## Citation
 ##
@@ -29,8 +35,15 @@ app = typer.Typer(no_args_is_help=True)
 @app.command("cit")
 def cit(
     db: Annotated[bool, typer.Option(help="Save to SQLite database file")] = False,
+    changed_only: Annotated[
+        bool,
+        typer.Option(help="Only studies whose authors or year changed since the last run"),
+    ] = False,
 ):
     """Extracts the citations from the database"""
+    from slh_sh.modules.extract import extract_cit
+    from slh_sh.utils.db import session_scope
+
     input(
         f"""
         Press Enter to generate citations:
@@ -44,7 +57,8 @@ def cit(
 
     print(f"Extracting citations from db...")
 
-    citations, authorNoneRemoved = extract_cit()
+    with session_scope():
+        citations, authorNoneRemoved = extract_cit(db, changed_only)
 
     print(citations)
     print(f"{len(citations)} citations added to the database")
@@ -63,8 +77,15 @@ def bib(
         "csv_export"
     ),
     db: Annotated[bool, typer.Option(help="Save to SQLite database file")] = False,
+    changed_only: Annotated[
+        bool,
+        typer.Option(help="Only studies whose source columns changed since the last run"),
+    ] = False,
 ):
     """Extracts the bibliographies from the CSV export"""
+    from slh_sh.modules.extract import extract_bib
+    from slh_sh.utils.db import session_scope
+
     input(
         f"""
         Press Enter to generate bibliographies:
@@ -77,7 +98,8 @@ def bib(
         """
     )
 
-    bibs = extract_bib(csv, db)
+    with session_scope():
+        bibs = extract_bib(csv, db, changed_only)
 
     print("Bibliographies added to the database:")
     print(bibs)
@@ -112,8 +134,23 @@ def dl(
             help="Class name of the 'a' element containing the URL of the PDF"
         ),
     ] = get_conf("html_dl_class"),
+    workers: Annotated[
+        int, typer.Option(help="Number of parallel downloads", min=1)
+    ] = 8,
+    per_host: Annotated[
+        int, typer.Option(help="Parallel downloads from the same host", min=1)
+    ] = 2,
+    delay: Annotated[
+        float,
+        typer.Option(help="Seconds between two downloads from the same host", min=0),
+    ] = 1.0,
+    retries: Annotated[
+        int, typer.Option(help="Retries of a failed download, with exponential backoff", min=0)
+    ] = 3,
 ):
     """Downloads the PDFs from the HTML export"""
+    from slh_sh.modules.extract import extract_dl
+
     input(
         f"""
         Press Enter to download PDFs:
@@ -133,13 +170,43 @@ def dl(
     pdf_dir = Path.cwd() / pdfdir
     if not pdf_dir.is_dir():
         pdf_dir.mkdir()
-    study_headers = extract_dl(html, pdf_dir, html_id_element, html_dl_class)
+
+    def print_result(result):
+        if result.duplicate:
+            print(
+                f":link: PDF with ID {result.id} downloaded, same file as an earlier one: {result.path}"
+            )
+        elif result.status == "downloaded":
+            print(f":runner: PDF with ID {result.id} downloaded: {result.path}")
+        elif result.status == "exists":
+            print(f"PDF already exists: {result.path}")
+        else:
+            print(
+                f"[bold red]Error[/bold red]: {result.error}, failed to download PDF with ID {result.id}: {result.url}"
+            )
+
+    report = extract_dl(
+        html,
+        pdf_dir,
+        html_id_element,
+        html_dl_class,
+        workers=workers,
+        per_host=per_host,
+        delay=delay,
+        retries=retries,
+        on_result=print_result,
+    )
     print(
         f"""
-        :tada: {len(study_headers)} PDFs from {html} to {pdf_dir} downloaded.
+        :tada: {len(report.downloaded)} PDFs from {html} to {pdf_dir} downloaded, {len(report.exists)} already existed, {len(report.failed)} failed.
+        :link: {len(report.duplicates)} duplicates of an identical PDF, extracted once.
         """
     )
-    logger().info(f"{len(study_headers)} PDFs from {html} to {pdf_dir} downloaded.")
+    for result in report.failed:
+        print(f"[bold red]Failed:[/bold red] {result.id} {result.url}: {result.error}")
+    logger().info(
+        f"{len(report.downloaded)} PDFs from {html} to {pdf_dir} downloaded, {len(report.failed)} failed."
+    )
 
 
 ##
@@ -156,9 +223,12 @@ def filename(
     db: Annotated[bool, typer.Option(help="Save to SQLite database file")] = False,
 ):
     """Extracts the filenames from the PDFs"""
+    from slh_sh.modules.extract import extract_filename
+    from slh_sh.utils.db import session_scope
 
     print(f"Extracting filenames from {csv}...")
-    fileNames = extract_filename(csv, rename, db)
+    with session_scope():
+        fileNames = extract_filename(csv, rename, db)
     print(fileNames)
     print(
         f"Updated database with {len(fileNames)} filenames on studies Table, Filenames column..."
@@ -188,32 +258,50 @@ def keywords(
         typer.Option(help="Extract keywords from all PDFs in pdf_path folder"),
     ] = False,
     db: Annotated[bool, typer.Option(help="SQLite database file")] = False,
+    jobs: Annotated[
+        int, typer.Option(help="Number of worker processes for --all", min=1)
+    ] = 1,
+    force: Annotated[
+        bool,
+        typer.Option(help="With --db, also extract PDFs unchanged since the last run"),
+    ] = False,
 ):
     """Extracts the keywords from the PDFs"""
+    from slh_sh.modules.extract import extract_keywords
+    from slh_sh.utils.db import session_scope
+
     print(f"Keywords {id}...")
 
     pdf_dir = get_pdf_dir()
     pdf_path = None
 
-    if all:
-        for file_name in os.listdir(pdf_dir):
-            id = file_name.split("_")[0].remove("#")
+    with session_scope():
+        if all:
+            from slh_sh.modules.batch import pdf_tasks, run_batch
+
+            pdf_path = pdf_dir
+            summary = run_batch(
+                "keywords", pdf_tasks(pdf_dir), jobs, force=force, db=db
+            )
+            keywords = [
+                f"{r.id} {r.result}" for r in summary.results if r.error is None
+            ]
+            print(keywords)
+            print_failed(summary)
+            print_skipped(summary)
+            print(
+                f"Extracted keywords from {len(keywords)} PDFs and added them to the Database..."
+            )
+        elif id != "":
             pdf_path = get_file_path(id)
-            all_keywords = extract_keywords(id, pdf_path, db)
-        print(all_keywords)
-        print(
-            f"Extracted keywords from {len(all_keywords)} PDFs and added them to the Database..."
-        )
-    elif id != "":
-        pdf_path = get_file_path(id)
-        keywords = extract_keywords(id, pdf_path, db)
-        print(
-            f"Extracted keywords {keywords} from {pdf_path} and added them to the Database..."
-        )
-    else:
-        print(
-            "Please enter an ID, e.g. covidence number using --id [Covidence Number] or use --all"
-        )
+            keywords = extract_keywords(id, pdf_path, db)
+            print(
+                f"Extracted keywords {keywords} from {pdf_path} and added them to the Database..."
+            )
+        else:
+            print(
+                "Please enter an ID, e.g. covidence number using --id [Covidence Number] or use --all"
+            )
     logger().info(
         f"Extracted keywords {keywords} from {pdf_path} and added them to the Database..."
     )
@@ -236,29 +324,70 @@ def annots(
         bool, typer.Option(help="Extract annotations from all PDFs in pdf_path folder")
     ] = False,
     db: Annotated[bool, typer.Option(help="Save to SQLite database file")] = False,
+    words: Annotated[
+        bool,
+        typer.Option(
+            help="Exactly the highlighted words, --no-words for the whole blocks touching the highlight"
+        ),
+    ] = True,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            help="Number of worker processes, large PDFs are split across them", min=1
+        ),
+    ] = 1,
+    force: Annotated[
+        bool,
+        typer.Option(help="With --db, also extract PDFs unchanged since the last run"),
+    ] = False,
 ):
     """Extracts the annotations from the PDFs"""
+    from slh_sh.modules.extract import extract_annots
+    from slh_sh.utils.db import session_scope
+
     print(f"Fetching Annotations of {color} (themes,topic,colored texts) from {id}...")
 
     pdf_dir = get_pdf_dir()
     pdf_path = None
 
-    if all:
-        for file_name in os.listdir(pdf_dir):
-            id = file_name.split("_")[0].remove("#")
+    with session_scope():
+        if all or (id != "" and jobs > 1):
+            # a single large PDF is also split across the workers
+            from slh_sh.modules.batch import pdf_tasks, run_batch
+
+            if all:
+                pdf_path = pdf_dir
+                tasks = pdf_tasks(pdf_dir)
+            else:
+                pdf_path = get_file_path(id)
+                tasks = [(id, pdf_path)]
+
+            def print_annots(r):
+                if r.error is None:
+                    print(r.result)
+
+            summary = run_batch(
+                "annots",
+                tasks,
+                jobs,
+                on_result=print_annots,
+                force=force,
+                db=db,
+                color=color,
+                words=words,
+            )
+            print_failed(summary)
+            print_skipped(summary)
+        elif id != "":
             pdf_path = get_file_path(id)
-            res = extract_annots(id, color, pdf_path, db)
+            res = extract_annots(id, color, pdf_path, db, words)
             print(res)
-    elif id != "":
-        pdf_path = get_file_path(id)
-        res = extract_annots(id, color, pdf_path, db)
-        print(res)
-    else:
-        print(
-            """
+        else:
+            print(
+                """
 [bold red]Please enter an ID, e.g. Covidence Number using --id [Covidence Number] or use --all[/bold red]
             """
-        )
+            )
     logger().info(
         f"Extracted annotations from {pdf_path} and added them to the Database..."
     )
@@ -288,53 +417,119 @@ def dist(
     wsdsheet: Annotated[
         bool, typer.Option(help="Apply to Distribution Worksheet on Google Sheet")
     ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            help="Number of worker processes, large PDFs are split across them", min=1
+        ),
+    ] = 1,
+    themes: Annotated[
+        bool,
+        typer.Option(
+            help="Search the terms of all themes in config.yaml in one pass instead of one term"
+        ),
+    ] = False,
+    index: Annotated[
+        bool,
+        typer.Option(
+            help="Fill the distribution from the search index instead of opening the PDFs, terms match whole words"
+        ),
+    ] = False,
+    force: Annotated[
+        bool,
+        typer.Option(help="With --db, also extract PDFs unchanged since the last run"),
+    ] = False,
 ):
     """Extracts the distribution of a search term in the PDFs"""
+    from slh_sh.modules.extract import (
+        extract_dist,
+        extract_dists,
+        extract_total_dist_sheet_sync,
+        extract_dist_ws_sheet_sync,
+        get_theme_terms,
+    )
+    from slh_sh.utils.db import session_scope
 
-    if tdsheet == True and all == True and term == "" and id == "":
-        res_total_dist_col = extract_total_dist_sheet_sync()
-        print(
-            f"Total distribution column update on Google Sheet Studies worksheet from db, {res_total_dist_col}"
-        )
-    elif wsdsheet == True and all == True and term == "" and id == "":
-        res_dist_ws = extract_dist_ws_sheet_sync()
-        print(
-            f"Total distribution worksheet update on Google Sheet from db, {res_dist_ws}"
-        )
-        # res_dist_ws = extract_dist_ws_sheet_sync()
-    elif all and id == "" and term != "":
-        pdf_dir: str = get_pdf_dir()
-        for file_name in os.listdir(pdf_dir):
-            id = file_name.split("_")[0].replace("#", "")
-            pdf_path: str = get_file_path(id)
-            if pdf_path.endswith(".pdf"):
-                total_count, dist_list = extract_dist(pdf_path, term, id, db)
-                msg = {
-                    "total_count": total_count,
-                    "dist_list": dist_list,
-                }
-                print(msg)
+    pdf_path = None
+    search = {"terms": get_theme_terms()} if themes else {"term": term}
+    searching = themes or term != ""
+
+    def dist_msg(result):
+        if themes:
+            return {
+                t: {"total_count": total_count, "dist_list": dist_list}
+                for t, (total_count, dist_list) in result.items()
+            }
+        total_count, dist_list = result
+        return {"total_count": total_count, "dist_list": dist_list}
+
+    with session_scope():
+        if tdsheet == True and all == True and term == "" and id == "":
+            res_total_dist_col = extract_total_dist_sheet_sync()
+            print(
+                f"Total distribution column update on Google Sheet Studies worksheet from db, {res_total_dist_col}"
+            )
+        elif wsdsheet == True and all == True and term == "" and id == "":
+            res_dist_ws = extract_dist_ws_sheet_sync()
+            print(
+                f"Total distribution worksheet update on Google Sheet from db, {res_dist_ws}"
+            )
+            # res_dist_ws = extract_dist_ws_sheet_sync()
+        elif searching and index and (all or id != ""):
+            from slh_sh.modules.search import extract_index_dists
+
+            pdf_path = "the search index"
+            results = extract_index_dists(
+                search.get("terms", [term]), id if id != "" else None, db
+            )
+            for result in results.values():
+                print(dist_msg(result if themes else result[term]))
+        elif searching and (
+            (all and id == "") or (id != "" and not all and jobs > 1)
+        ):
+            # a single large PDF is also split across the workers
+            from slh_sh.modules.batch import pdf_tasks, run_batch
+
+            if all:
+                pdf_path = get_pdf_dir()
+                tasks = pdf_tasks(pdf_path)
             else:
-                logger().info(f"{pdf_path} is not a PDF file.")
-    elif id != "" and term != "" and all == False:
-        pdf_path = get_file_path(id)
-        total_count, dist_list = extract_dist(pdf_path, term, id, db)
-        msg = {
-            "total_count": total_count,
-            "dist_list": dist_list,
-        }
-        print(msg)
-    elif id != "" and term == "" and all == False and wsdsheet == True:
-        res_dist_ws = extract_dist_ws_sheet_sync(id)
-        print(
-            f"Total distribution worksheet update on Google Sheet from db, {res_dist_ws}"
-        )
-    else:
-        print(
-            """
+                pdf_path = get_file_path(id)
+                tasks = [(id, pdf_path)]
+
+            def print_dist(r):
+                if r.error is None:
+                    print(dist_msg(r.result))
+
+            summary = run_batch(
+                "dist",
+                tasks,
+                jobs,
+                on_result=print_dist,
+                force=force,
+                db=db,
+                **search,
+            )
+            print_failed(summary)
+            print_skipped(summary)
+        elif id != "" and searching and all == False:
+            pdf_path = get_file_path(id)
+            if themes:
+                result = extract_dists(pdf_path, search["terms"], id, db)
+            else:
+                result = extract_dist(pdf_path, term, id, db)
+            print(dist_msg(result))
+        elif id != "" and term == "" and all == False and wsdsheet == True:
+            res_dist_ws = extract_dist_ws_sheet_sync(id)
+            print(
+                f"Total distribution worksheet update on Google Sheet from db, {res_dist_ws}"
+            )
+        else:
+            print(
+                """
 [bold red]Please enter an ID, e.g. covidence number using --id [Covidence Number] or use --all[/bold red]
             """
-        )
+            )
     logger().info(
         f"Extracted distribution from {pdf_path} and added them to the Database..."
     )
@@ -1,14 +1,13 @@
 import typer
-import os
 import json
-import sqlite3 as sql
 import pyperclip
 
 from rich import print
 from typing_extensions import Annotated
 
 # from scholarly import scholarly
-from slh_sh.utils.file import get_conf
+from slh_sh.utils.file import get_conf, load_pdf_index
+from slh_sh.utils.sqlite import connect
 
 app = typer.Typer()
 
@@ -27,18 +26,19 @@ def info(
     """Get info about a study and its Citation and Bibliography from a database table by ID."""
 
     if id == "":
-        for file_name in os.listdir(get_conf("pdf_path")):
-            if not file_name.startswith("."):
-                print(file_name)
+        index = load_pdf_index()
+        file_names = sorted(name for names in index.files.values() for name in names)
+        for file_name in file_names:
+            print(file_name)
         print(
             f"""
 
-There are {len(os.listdir(get_conf("pdf_path")))} PDFs in {get_conf("pdf_path")}
+There are {len(file_names)} PDFs in {get_conf("pdf_path")}
 
 """
         )
     else:
-        conn = sql.connect(get_conf("sqlite_db"))
+        conn = connect()
         curr = conn.cursor()
 
         curr.execute(f"SELECT * FROM {table} WHERE {idcol} = {id}")
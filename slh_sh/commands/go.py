@@ -1,12 +1,12 @@
 import typer
 import webbrowser
-import sqlite3 as sql
 
 from pathlib import Path
 from rich import print
 from typing_extensions import Annotated
 
 from slh_sh.utils.file import get_file_path, get_conf
+from slh_sh.utils.sqlite import connect
 from slh_sh.utils.log import logger
 
 app = typer.Typer()
@@ -76,7 +76,7 @@ def doi(
 ):
     """Opens the DOI of a study by ID in browser."""
 
-    conn = sql.connect(get_conf("sqlite_db"))
+    conn = connect()
     curr = conn.cursor()
     curr.execute(f"SELECT doi FROM studies WHERE {get_conf('default_id')} = {id}")
     doi = curr.fetchone()
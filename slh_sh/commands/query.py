@@ -1,5 +1,4 @@
 import typer
-import sqlite3 as sql
 import pyperclip
 import json
 
@@ -7,6 +6,7 @@ from rich import print
 from typing_extensions import Annotated
 
 from slh_sh.utils.file import get_conf
+from slh_sh.utils.sqlite import connect
 from slh_sh.utils.log import logger
 
 app = typer.Typer()
@@ -32,12 +32,35 @@ e.g. slh-sh query themes John,120,192 Stage_1 Derogation or a direct SQL query w
     copy: Annotated[
         bool, typer.Option("-c", "--copy", help="Copy to clipboard")
     ] = False,
+    fts: Annotated[
+        bool,
+        typer.Option(
+            help="""Full-text search of titles, abstracts, keywords, full texts, annotations and distribution, best matches of each first,
+e.g. [red]slh-sh query --fts "social media" NEAR(children, 10)[/red]"""
+        ),
+    ] = False,
+    limit: Annotated[int, typer.Option(help="Maximal number of hits per source of --fts", min=1)] = 20,
 ):
     """Get themes about a study from a database table by ID."""
 
+    # FULL-TEXT SEARCH
+    if fts:
+        from slh_sh.modules.fts import fts_search
+
+        conn = connect()
+        hits = fts_search(conn, " ".join(terms), idcol, limit)
+        conn.close()
+        json_data = json.dumps(hits, indent=4)
+        print(json_data)
+        if copy:
+            pyperclip.copy(json_data)
+            print("Copied to clipboard!")
+        logger().info(f"Full-text search executed: {' '.join(terms)}")
+        exit()
+
     # SQL QUERY
     if sqlquery != False:
-        conn = sql.connect(get_conf("sqlite_db"))
+        conn = connect()
         curr = conn.cursor()
         print(terms[0])
         curr.execute(terms[0])
@@ -90,7 +113,7 @@ to query sql database directly use -s/--sqlquery option, e.g.:
         exit()
 
     results = {}
-    conn = sql.connect(get_conf("sqlite_db"))
+    conn = connect()
     curr = conn.cursor()
 
     if authors[0] == "ALL" or authors[0] == "all":
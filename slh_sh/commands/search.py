@@ -0,0 +1,54 @@
+import time
+import typer
+
+from rich import print
+from rich.markup import escape
+from typing_extensions import Annotated
+
+from slh_sh.utils.log import logger
+
+app = typer.Typer()
+
+
+@app.command()
+def search(
+    query: Annotated[
+        str,
+        typer.Argument(
+            help="Phrase to search for in all PDFs, a word ending with * matches every word it starts, e.g. [red]slh-sh search \"social med*\"[/red]"
+        ),
+    ],
+    near: Annotated[
+        int,
+        typer.Option(
+            help="Match the words in any order within this many words of each other instead of the exact phrase",
+            min=0,
+        ),
+    ] = 0,
+    limit: Annotated[
+        int, typer.Option(help="Maximal number of hits, 0 for all", min=0)
+    ] = 20,
+    update: Annotated[
+        bool, typer.Option(help="Index new and changed PDFs before searching")
+    ] = True,
+):
+    """Search a phrase in all PDFs, prints page numbers and snippets."""
+    from slh_sh.modules.search import search_index, update_index
+    from slh_sh.utils.db import session_scope
+
+    with session_scope():
+        if update:
+            counts = update_index()
+            if counts["added"] or counts["updated"] or counts["removed"]:
+                print(f"Search index updated: {counts}")
+        start = time.perf_counter()
+        hits = search_index(query, near, limit)
+        elapsed = (time.perf_counter() - start) * 1000
+
+    for hit in hits:
+        print(
+            f"[bold]{escape(hit.study)}[/bold] page {hit.page_number}: "
+            f"...{escape(hit.before)} [yellow]{escape(hit.text)}[/yellow] {escape(hit.after)}..."
+        )
+    print(f"{len(hits)} hits in {elapsed:.1f} ms")
+    logger().info(f"Searched {query}, {len(hits)} hits")
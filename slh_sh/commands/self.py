@@ -8,8 +8,8 @@ from rich import print
 
 from slh_sh.utils.config import saveConfigFile
 from slh_sh.utils.log import logger
-from slh_sh.utils.file import get_pdf_dir
-from slh_sh.utils.update import get_remote_version
+from slh_sh.utils.file import get_conf, get_pdf_dir, load_pdf_index
+from slh_sh.utils.sqlite import connect
 
 slh_version: str = "0.1.12"
 
@@ -48,6 +48,7 @@ def list():
             Commands:
                 - add
                     - csv       # Loads studies.csv into sqlite database.
+                    - pdfs      # Adds the PDFs to the content-addressed store and reports duplicates.
                 - extract
                     - cit       # Extracts and generates APA 7 citation from the file name in db and updates the citation column in the studies table.
                     - bib       # Extracts the bibliography from the csv file and updates the bibliography column in the studies table.
@@ -67,6 +68,7 @@ def list():
                 - version   # Shows the version
                 - info      # Get info about a study and its Citation and Bibliography from a database table by ID.
                 - query     # Get themes about a study from a database table by ID.
+                - search    # Search a phrase in all PDFs, prints page numbers and snippets.
                 - gd        # Opens the Google Drive folder.
                 - gs        # Opens the Google Sheet.
                 - pdf       # Opens a PDF file in the default PDF reader.
@@ -79,6 +81,7 @@ def list():
 @app.command()
 def check():
     """Check the status of the project."""
+    from slh_sh.utils.update import get_remote_version
 
     print("\n[red]Config file:[/red]")
     config_file = Path.cwd() / "config.yaml"
@@ -121,9 +124,27 @@ def check():
     if pdf_dir.is_dir():
         pdf_count = 0
         for pdf in pdf_dir.iterdir():
-            pdf_count += 1
+            # not the .store folder of the pdf store or other files
+            if pdf.suffix.lower() == ".pdf" and not pdf.name.startswith("."):
+                pdf_count += 1
         print(f"\n[red]PDF Count:[/red] {pdf_count}")
 
+        # IDs with several pdf files, and pdf files of no study
+        index = load_pdf_index(pdf_dir)
+        for id, names in index.duplicates.items():
+            print(f"[red]Duplicate ID {id}:[/red] {', '.join(names)}")
+        default_id = get_conf("default_id")
+        if default_id:
+            try:
+                conn = connect()
+                ids = [row[0] for row in conn.execute(f'SELECT "{default_id}" FROM studies')]
+                conn.close()
+            except sqlite3.Error:
+                ids = None
+            if ids is not None:
+                for name in index.orphans(ids):
+                    print(f"[red]No study for PDF:[/red] {name}")
+
     # check if pypi version is the same as the local version
     pypi_version = get_remote_version()
     print("\n[red]slh-sh version:[/red]")
@@ -11,19 +11,10 @@ from typing_extensions import Annotated
 
 from slh_sh.utils.log import logger
 from slh_sh.utils.file import get_conf
-from slh_sh.modules.sync import (
-    get_worksheet_by_name,
-    update_sheet_cell,
-    sync_studies_sheet,
-    sync_studies_column_sheet,
-    get_worksheet_id_col_index_values,
-    get_worksheet_updating_col_index_header,
-    get_worksheet_headers_row_values,
-)
-from slh_sh.utils.db import get_db
-from slh_sh.data.models import (
-    Study,
-)
+from slh_sh.utils.sqlite import connect, bulk_execute
+
+# slh_sh.modules.sync (gspread, oauth2client) and the sqlalchemy models are
+# imported inside the commands so `slh-sh sync --help` stays fast.
 
 app = typer.Typer(no_args_is_help=True)
 
@@ -52,51 +43,79 @@ def update(
 
     --id <default_id> --gs <sheet_name> --col <column_name>
     """
-    if alltable == "" and apply:
+    from slh_sh.modules.sync import (
+        get_worksheet_by_name,
+        update_sheet_cell,
+        sync_studies_sheet,
+        sync_studies_column_sheet,
+        get_studies_column_values,
+        get_worksheet_id_col_index_values,
+        get_worksheet_updating_col_index_header,
+        get_worksheet_headers_row_values,
+    )
+
+    if alltable == "" and (apply or allcol):
         ws = get_worksheet_by_name(gs, sheet)
     if id != "" and sheetcol != "" and "," not in id and "-" not in id:
-        # get Google Sheet's Worksheet's id column index values
-        headers_row_values = get_worksheet_headers_row_values(ws)
-        id_col_values = get_worksheet_id_col_index_values(ws, idcol)
-        updating_col_index_header = get_worksheet_updating_col_index_header(
-            headers_row_values, sheetcol
-        )
-        # curr.execute(f"SELECT {sheetcol} FROM studies WHERE Covidence = '{id}'")
-        # db_res: str = curr.fetchone()
-        dbs = get_db()
-        # select [idcol = covidence] from database where idcol is id_col_value
-        db_res = dbs.query(Study).filter_by(idcol=id_col_values).first()
-        if db_res == None:
+        conn = connect()
+        try:
+            db_res = get_studies_column_values(conn, idcol, sheetcol, [id])
+        finally:
+            conn.close()
+        if id not in db_res:
             print(f"Study {id} not found in database!")
             sys.exit()
-        elif db_res[0] != None:
+        elif db_res[id] != None:
             if apply:
+                # get Google Sheet's Worksheet's id column index values
+                headers_row_values = get_worksheet_headers_row_values(ws)
+                id_col_values = get_worksheet_id_col_index_values(ws, idcol)
+                updating_col_index_header = get_worksheet_updating_col_index_header(
+                    headers_row_values, sheetcol
+                )
                 update_sheet_cell(
-                    ws, id_col_values, id, updating_col_index_header, db_res[0]
+                    ws, id_col_values, id, updating_col_index_header, db_res[id]
                 )
                 print(
-                    """
+                    f"""
             :tada: Sync finished successfully from database to Google Sheet:
-            Column: {col}
+            Column: {sheetcol}
             Sheet: {sheet}
             Study: {id}
             Google Sheet {gs}...
                     """
                 )
             else:
-                print(f"Would update {id} with '{db_res[0]}'")
+                print(f"Would update {id} with '{db_res[id]}'")
         else:
             print(f"Empty {sheetcol} for {id}, skipping...")
     elif allcol and sheetcol != "":
-        res = sync_studies_column_sheet(gs, idcol, sheetcol)
-        print(
-            f"""
+        counts = sync_studies_column_sheet(ws, idcol, sheetcol, apply)
+        if counts is None:
+            print(
+                "[bold red]Error[/bold red]: Google API rate limit reached, or other API error, please try again later!"
+            )
+            raise typer.Exit(code=1)
+        if apply:
+            print(
+                f"""
             :tada: Sync finished successfully from database to Google Sheet:
             Column: {sheetcol}
             Sheet: {sheet}
             Google Sheet {gs}...
+
+            :pencil: {counts["updated"]} cells updated.
+            :information_desk_person: {counts["unchanged"]} already up to date, {counts["empty"]} empty in the database.
+            :x: {counts["missing"]} studies not found in database.
             """
-        )
+            )
+        else:
+            print(
+                f"""
+                {counts["updated"]} cells would be updated, {counts["unchanged"]} are up to date.
+                By adding --apply the changes are written to Google Sheet.
+                """
+            )
     elif alltable != "":
         if apply:
             print(f"Appending all data in the {alltable} to a new Worksheet...")
@@ -155,7 +174,7 @@ def config():
     """
     print(f"Syncing config.yaml to database: {get_conf('sqlite_db')}...")
 
-    conn: sql.connect = sql.connect(get_conf("sqlite_db"))
+    conn: sql.Connection = connect()
     curr: sql.Cursor = conn.cursor()
 
     # iterate over Themes in config_data and insert into database
@@ -171,7 +190,6 @@ def config():
             curr.execute(
                 f"INSERT INTO themes (color, hex, term) VALUES ('{theme}', '{hex}', '{term}');"
             )
-            conn.commit()
             print(f"Theme {theme} inserted in database!")
         else:
             print(f"Theme {theme} already exists in database!")
@@ -187,7 +205,6 @@ def config():
             curr.execute(
                 f"INSERT INTO searches (name, description) VALUES ('{search}', '{description}');"
             )
-            conn.commit()
             print(f"Search {search} inserted in database!")
         else:
             print(f"Search {search} already exists in database!")
@@ -203,11 +220,12 @@ def config():
             curr.execute(
                 f"INSERT INTO sources (name, description) VALUES ('{source}', '{description}');"
             )
-            conn.commit()
             print(f"Source {source} inserted in database!")
         else:
             print(f"Source {source} already exists in database!")
 
+    # one transaction for all themes, searches and sources
+    conn.commit()
     conn.close()
     logger().info(f"Sync finished successfully from config.yaml to database!")
 
@@ -226,6 +244,7 @@ def fetch(
     gs: Annotated[str, typer.Option(help="Google Sheet URL")] = get_conf("gs_url"),
 ):
     """Fetch data from Google Sheet to a new database table."""
+    from slh_sh.modules.sync import get_worksheet_by_name
 
     print(f"Fetching Google Sheet to database...")
 
@@ -246,7 +265,7 @@ def fetch(
     # replace empty string with None in ws_data
     ws_data = [["None" if cell == "" else cell for cell in row] for row in ws_data]
 
-    conn = sql.connect(get_conf("sqlite_db"))
+    conn = connect()
     curr = conn.cursor()
 
     curr.execute(
@@ -254,13 +273,13 @@ def fetch(
     )
     conn.commit()
 
-    for row in ws_data:
-        print(row)
-        curr.execute(
-            f"INSERT INTO {dbtable} ({', '.join(ws_headers)}) VALUES ({', '.join([f'?' for i in range(len(ws_headers))])})",
-            row,
-        )
-        conn.commit()
+    # insert all rows in batched transactions instead of a commit per row
+    count = bulk_execute(
+        conn,
+        f"INSERT INTO {dbtable} ({', '.join(ws_headers)}) VALUES ({', '.join([f'?' for i in range(len(ws_headers))])})",
+        ws_data,
+    )
+    print(f"{count} rows inserted into {dbtable}")
 
     conn.close()
 
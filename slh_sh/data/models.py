@@ -1,9 +1,9 @@
 from __future__ import annotations
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
 
 
-from slh_sh.utils.db import BaseModel
+from slh_sh.utils.db import Base, BaseModel
 
 
 class Study(BaseModel):
@@ -33,6 +33,7 @@ class Study(BaseModel):
     filename: Mapped[str] = mapped_column(index=True, nullable=True)
     keywords: Mapped[str] = mapped_column(index=True, nullable=True)
     citation: Mapped[str] = mapped_column(index=True, nullable=True)
+    citation_key: Mapped[str] = mapped_column(index=True, nullable=True)
     bibliography: Mapped[str] = mapped_column(index=True, nullable=True)
     full_text: Mapped[str] = mapped_column(index=True, nullable=True)
     total_annotations: Mapped[int] = mapped_column(index=True, nullable=True)
@@ -83,3 +84,114 @@ class Distribution(BaseModel):
     page_number: Mapped[int] = mapped_column(index=True, nullable=False)
     term: Mapped[str] = mapped_column(index=True, nullable=False)
     text: Mapped[str] = mapped_column(index=True, nullable=False)
+
+
+class SourceHash(BaseModel):
+    __tablename__ = "source_hashes"
+    __table_args__ = (UniqueConstraint("study", "target"),)
+
+    id: Mapped[int] = mapped_column(
+        index=True, primary_key=True, autoincrement=True, nullable=False
+    )
+    created_at: BaseModel.created_at
+    updated_at: BaseModel.updated_at
+    study: Mapped[str] = mapped_column(index=True, nullable=False)
+    target: Mapped[str] = mapped_column(index=True, nullable=False)
+    hash: Mapped[str] = mapped_column(nullable=False)
+
+
+class PdfPage(BaseModel):
+    __tablename__ = "pdf_pages"
+    __table_args__ = (UniqueConstraint("sha256", "page_number"),)
+
+    id: Mapped[int] = mapped_column(
+        index=True, primary_key=True, autoincrement=True, nullable=False
+    )
+    created_at: BaseModel.created_at
+    updated_at: BaseModel.updated_at
+    sha256: Mapped[str] = mapped_column(index=True, nullable=False)
+    page_number: Mapped[int] = mapped_column(nullable=False)
+    page_count: Mapped[int] = mapped_column(nullable=False)
+    text: Mapped[str] = mapped_column(nullable=False)
+    blocks: Mapped[str] = mapped_column(nullable=False)
+    words: Mapped[str] = mapped_column(nullable=False)
+    annots: Mapped[str] = mapped_column(nullable=False)
+
+
+class PdfFile(BaseModel):
+    __tablename__ = "pdf_files"
+
+    # ID named pdf file to the SHA-256 of its content, the caches key on the hash
+    id: Mapped[int] = mapped_column(
+        index=True, primary_key=True, autoincrement=True, nullable=False
+    )
+    created_at: BaseModel.created_at
+    updated_at: BaseModel.updated_at
+    study: Mapped[str] = mapped_column(index=True, nullable=False)
+    pdf_path: Mapped[str] = mapped_column(unique=True, nullable=False)
+    size: Mapped[int] = mapped_column(nullable=False)
+    mtime_ns: Mapped[int] = mapped_column(nullable=False)
+    # None if the file could not be read
+    sha256: Mapped[str] = mapped_column(index=True, nullable=True)
+    # None until the pages are cached, a document without pages has no pdf_pages rows
+    page_count: Mapped[int] = mapped_column(nullable=True)
+
+
+class SearchDocument(BaseModel):
+    __tablename__ = "search_documents"
+
+    # one per content, identical pdf files share it through pdf_files
+    id: Mapped[int] = mapped_column(
+        index=True, primary_key=True, autoincrement=True, nullable=False
+    )
+    created_at: BaseModel.created_at
+    updated_at: BaseModel.updated_at
+    sha256: Mapped[str] = mapped_column(unique=True, nullable=False)
+
+
+# the vocabulary and postings of the search index hold millions of rows,
+# they skip the timestamps of BaseModel
+
+
+class SearchTerm(Base):
+    __tablename__ = "search_terms"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    term: Mapped[str] = mapped_column(unique=True, nullable=False)
+
+
+class SearchPosting(Base):
+    __tablename__ = "search_postings"
+    __table_args__ = (
+        Index("ix_search_postings_document_id", "document_id"),
+        {"sqlite_with_rowid": False},
+    )
+
+    term_id: Mapped[int] = mapped_column(
+        ForeignKey("search_terms.id"), primary_key=True
+    )
+    document_id: Mapped[int] = mapped_column(
+        ForeignKey("search_documents.id"), primary_key=True
+    )
+    page_number: Mapped[int] = mapped_column(primary_key=True)
+    # offset of the token on the page, consecutive tokens of a phrase differ by 1
+    position: Mapped[int] = mapped_column(primary_key=True)
+    # index of the fitz word holding the token, for rects and snippets
+    word_number: Mapped[int] = mapped_column(nullable=False)
+
+
+class ExtractionManifest(BaseModel):
+    __tablename__ = "extraction_manifest"
+    __table_args__ = (UniqueConstraint("sha256", "study", "extractor", "options"),)
+
+    id: Mapped[int] = mapped_column(
+        index=True, primary_key=True, autoincrement=True, nullable=False
+    )
+    created_at: BaseModel.created_at
+    updated_at: BaseModel.updated_at
+    sha256: Mapped[str] = mapped_column(nullable=False)
+    # the results are saved per study, a duplicate pdf file is recorded for every ID
+    study: Mapped[str] = mapped_column(index=True, nullable=False)
+    extractor: Mapped[str] = mapped_column(nullable=False)
+    options: Mapped[str] = mapped_column(nullable=False)
+    version: Mapped[int] = mapped_column(nullable=False)
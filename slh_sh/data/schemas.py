@@ -22,6 +22,7 @@ class StudySchema(BaseModel):
     filename: str
     keywords: str
     citation: str
+    citation_key: str
     bibliography: str
     full_text: str
     total_annotations: int
@@ -3,37 +3,111 @@ import typer
 from pathlib import Path
 from rich import print
 
-import slh_sh.commands.add as add
-import slh_sh.commands.extract as extract
-import slh_sh.commands.sync as sync
+from slh_sh.utils.lazy import LazyCommand, LazyGroup
 
-from slh_sh.commands.self import version, list, logs, init, check
-from slh_sh.commands.go import gd, gs, pdf, db, doi
-from slh_sh.commands.query import query
-from slh_sh.commands.get import info
+
+class SlhGroup(LazyGroup):
+    # Commands are imported only when invoked, heavy dependencies (fitz, pandas,
+    # pdfminer, bs4, gspread) stay out of `slh-sh --help`, `version`, `pdf`, etc.
+    lazy_commands = {
+        "add": LazyCommand(
+            "slh_sh.commands.add", rich_help_panel="Database Import"
+        ),
+        "extract": LazyCommand(
+            "slh_sh.commands.extract", rich_help_panel="Data Extraction"
+        ),
+        "sync": LazyCommand(
+            "slh_sh.commands.sync",
+            rich_help_panel="Sheet to Database Syncronization",
+        ),
+        "version": LazyCommand(
+            "slh_sh.commands.self",
+            "version",
+            help="Prints the version.",
+            rich_help_panel="slh-sh",
+        ),
+        "list": LazyCommand(
+            "slh_sh.commands.self",
+            "list",
+            help="List all available commands and their descriptions.",
+            rich_help_panel="slh-sh",
+        ),
+        "logs": LazyCommand(
+            "slh_sh.commands.self",
+            "logs",
+            help="Prints the logs.",
+            rich_help_panel="slh-sh",
+        ),
+        "init": LazyCommand(
+            "slh_sh.commands.self",
+            "init",
+            help="Initializes the project, questionaire or default config file.",
+            rich_help_panel="slh-sh",
+        ),
+        "check": LazyCommand(
+            "slh_sh.commands.self",
+            "check",
+            help="Check the status of the project.",
+            rich_help_panel="slh-sh",
+        ),
+        "pdf": LazyCommand(
+            "slh_sh.commands.go",
+            "pdf",
+            help="Opens a PDF file in the default PDF reader.",
+            rich_help_panel="Shortcuts",
+        ),
+        "doi": LazyCommand(
+            "slh_sh.commands.go",
+            "doi",
+            help="Opens the DOI of a study by ID in browser.",
+            rich_help_panel="Shortcuts",
+        ),
+        "gd": LazyCommand(
+            "slh_sh.commands.go",
+            "gd",
+            help="Opens the Google Drive folder in browser.",
+            rich_help_panel="Shortcuts",
+        ),
+        "gs": LazyCommand(
+            "slh_sh.commands.go",
+            "gs",
+            help="Opens the Google Sheet in browser.",
+            rich_help_panel="Shortcuts",
+        ),
+        "db": LazyCommand(
+            "slh_sh.commands.go",
+            "db",
+            help="Opens the SQLite database in the default database viewer.",
+            rich_help_panel="Shortcuts",
+        ),
+        "info": LazyCommand(
+            "slh_sh.commands.get",
+            "info",
+            help="Get info about a study and its Citation and Bibliography from a database table by ID.",
+            rich_help_panel="Data Query",
+        ),
+        "query": LazyCommand(
+            "slh_sh.commands.query",
+            "query",
+            help="Get themes about a study from a database table by ID.",
+            rich_help_panel="Data Query",
+        ),
+        "search": LazyCommand(
+            "slh_sh.commands.search",
+            "search",
+            help="Search a phrase in all PDFs, prints page numbers and snippets.",
+            rich_help_panel="Data Query",
+        ),
+    }
 
 
 app = typer.Typer(
-    no_args_is_help=True, rich_markup_mode="rich", epilog="Made with [red]:heart:[/red]"
+    cls=SlhGroup,
+    no_args_is_help=True,
+    rich_markup_mode="rich",
+    epilog="Made with [red]:heart:[/red]",
 )
 
-app.add_typer(add.app, name="add", rich_help_panel="Database Import")
-app.add_typer(extract.app, name="extract", rich_help_panel="Data Extraction")
-app.add_typer(sync.app, name="sync", rich_help_panel="Sheet to Database Syncronization")
-
-app.command(rich_help_panel="slh-sh")(version)
-app.command(rich_help_panel="slh-sh")(list)
-app.command(rich_help_panel="slh-sh")(logs)
-app.command(rich_help_panel="slh-sh")(init)
-app.command(rich_help_panel="slh-sh")(check)
-app.command(rich_help_panel="Shortcuts")(pdf)
-app.command(rich_help_panel="Shortcuts")(doi)
-app.command(rich_help_panel="Shortcuts")(gd)
-app.command(rich_help_panel="Shortcuts")(gs)
-app.command(rich_help_panel="Shortcuts")(db)
-app.command(rich_help_panel="Data Query")(info)
-app.command(rich_help_panel="Data Query")(query)
-
 
 @app.callback()
 def callback(ctx: typer.Context):
@@ -0,0 +1,193 @@
+import sqlite3 as sql
+
+from slh_sh.utils.file import read_csv_chunks
+from slh_sh.utils.sqlite import connect, bulk_execute
+
+
+def normalize_headers(headers: list[str]) -> list[str]:
+    """Turns CSV headers into column names, e.g. 'Covidence #' to Covidence
+
+    Args:
+        headers (list): Header row of the CSV file
+
+    Returns:
+        list: Column names
+    """
+    return [header.replace(" ", "_").replace("_#", "") for header in headers]
+
+
+def ensure_study_ids(conn: sql.Connection) -> bool:
+    """Gives a studies table without an id column one, as its INTEGER PRIMARY KEY
+
+    A studies table imported keyed on default_id used to have implicit rowids
+    only, which VACUUM may renumber. The table is copied with every rowid as id,
+    so the annotations, distribution and FTS rows keep pointing at their study.
+
+    Args:
+        conn (sqlite3.Connection): Database connection
+
+    Returns:
+        bool: True if the table got an id column
+    """
+    info = conn.execute("PRAGMA table_info(studies)").fetchall()
+    if not info or "id" in {row[1] for row in info}:
+        return False
+    # indexes and triggers are dropped with the old table, recreated from their SQL
+    schema = [
+        row[0]
+        for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = 'studies' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+        )
+    ]
+    definitions = ", ".join(f'"{row[1]}" {row[2]}'.rstrip() for row in info)
+    columns = ", ".join(f'"{row[1]}"' for row in info)
+    conn.execute(
+        f"CREATE TABLE studies_with_id (id INTEGER PRIMARY KEY AUTOINCREMENT, {definitions})"
+    )
+    conn.execute(
+        f"INSERT INTO studies_with_id (id, {columns}) SELECT rowid, {columns} FROM studies"
+    )
+    conn.execute("DROP TABLE studies")
+    conn.execute("ALTER TABLE studies_with_id RENAME TO studies")
+    for statement in schema:
+        conn.execute(statement)
+    return True
+
+
+def create_studies_table(conn: sql.Connection, headers: list[str], default_id: str):
+    """Creates the studies table with an id and the CSV headers as columns if it doesn't exist.
+
+    With a default_id a unique index is created on it, so studies can be upserted by ID.
+
+    Args:
+        conn (sqlite3.Connection): Database connection
+        headers (list): Normalized CSV headers
+        default_id (str): ID column from config.yaml, empty for an incremental id
+
+    Raises:
+        sqlite3.IntegrityError: The studies table already has duplicate IDs
+    """
+    columns = ", ".join(f'"{header}"' for header in headers)
+    # the id is the stable key of the annotations, distribution and FTS rows
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS studies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        {columns}
+    )"""
+    )
+    ensure_study_ids(conn)
+    if default_id != "":
+        conn.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS studies_{default_id}_unique ON studies ("{default_id}")'
+        )
+
+
+def upsert_studies(
+    conn: sql.Connection, headers: list[str], rows: list[tuple], default_id: str
+) -> dict[str, int]:
+    """Inserts new studies and updates changed ones keyed on default_id, in one transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection
+        headers (list): Normalized CSV headers
+        rows (list): CSV rows
+        default_id (str): ID column from config.yaml, empty for an incremental id
+
+    Returns:
+        dict: Number of inserted, updated and unchanged studies
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    width = len(headers)
+    # pad or cut ragged rows to the header width
+    rows = [tuple(row[:width]) + ("",) * (width - len(row)) for row in rows]
+
+    columns = ", ".join(f'"{header}"' for header in headers)
+    placeholders = ", ".join("?" for _ in headers)
+
+    if default_id == "":
+        counts["inserted"] = bulk_execute(
+            conn, f"INSERT INTO studies ({columns}) VALUES ({placeholders})", rows
+        )
+        return counts
+
+    key_index = headers.index(default_id)
+    # last row wins when the same ID is in the CSV more than once
+    by_id = {row[key_index]: row for row in rows}
+
+    existing = {}
+    ids = list(by_id)
+    # look up the studies of this import by ID, a batch at a time
+    for i in range(0, len(ids), 500):
+        batch = ids[i : i + 500]
+        res = conn.execute(
+            f'SELECT {columns} FROM studies WHERE "{default_id}" IN ({", ".join("?" for _ in batch)})',
+            batch,
+        )
+        for db_row in res:
+            existing[str(db_row[key_index])] = tuple(
+                None if value is None else str(value) for value in db_row
+            )
+
+    changed = []
+    for id, row in by_id.items():
+        if id not in existing:
+            counts["inserted"] += 1
+            changed.append(row)
+        elif existing[id] != row:
+            counts["updated"] += 1
+            changed.append(row)
+        else:
+            counts["unchanged"] += 1
+
+    updates = ", ".join(
+        f'"{header}" = excluded."{header}"' for header in headers if header != default_id
+    )
+    bulk_execute(
+        conn,
+        f"""INSERT INTO studies ({columns}) VALUES ({placeholders})
+        ON CONFLICT("{default_id}") DO UPDATE SET {updates}""",
+        changed,
+    )
+
+    return counts
+
+
+def import_csv(
+    csv_path: str, default_id: str, chunk_size: int | None = None
+) -> dict[str, int]:
+    """Imports a CSV export of studies into the studies table.
+
+    The file is streamed in chunks, each chunk is written to the database before
+    the next one is read so memory stays flat regardless of the file size.
+
+    Args:
+        csv_path (str): Path to the CSV file
+        default_id (str): ID column from config.yaml, empty for an incremental id
+        chunk_size (int, optional): Rows per chunk. Defaults to import_chunk_size from config.yaml.
+
+    Returns:
+        dict: Number of inserted, updated and unchanged studies
+
+    Raises:
+        ValueError: The CSV file has no default_id column
+    """
+    headers, chunks = read_csv_chunks(csv_path, chunk_size)
+    # normalized once, shared by every chunk
+    headers = normalize_headers(headers)
+    if default_id != "" and default_id not in headers:
+        raise ValueError(
+            f"{csv_path} has no {default_id} column, check default_id in config.yaml."
+        )
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    conn = connect()
+    try:
+        create_studies_table(conn, headers, default_id)
+        for rows in chunks:
+            chunk_counts = upsert_studies(conn, headers, rows, default_id)
+            for key, value in chunk_counts.items():
+                counts[key] += value
+    finally:
+        conn.close()
+
+    return counts
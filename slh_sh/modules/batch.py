@@ -0,0 +1,487 @@
+import os
+import json
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Iterator
+
+from slh_sh.utils.log import logger
+from slh_sh.utils.config import load_config
+from slh_sh.utils.db import get_db, get_engine, remove_session
+from slh_sh.utils.file import pdf_file_id
+from slh_sh.utils.textcache import (
+    file_sha256,
+    get_full_text,
+    get_page_count,
+    is_cached,
+    load_pages,
+    parse_pdf,
+    read_pdf_files,
+    record_pdf_file,
+    recorded_sha256,
+    store_pages,
+)
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert
+
+from slh_sh.data.models import ExtractionManifest, PdfFile, PdfPage
+from slh_sh.modules.extract import (
+    ensure_study_columns,
+    find_annots,
+    find_dist,
+    find_dists,
+    find_keywords,
+    get_citation,
+    get_theme_classifier,
+    save_annots,
+    save_dist,
+    save_dists,
+    save_keywords,
+)
+
+# results persisted per transaction by the writer
+DEFAULT_WRITE_BATCH_SIZE = 50
+
+# uncached pdf files with at least this many pages are parsed by several workers
+DEFAULT_PAGE_SHARD_THRESHOLD = 200
+
+EXTRACTORS = ("keywords", "annots", "dist")
+
+# bump the version of an extractor when its results change, the next
+# --all run extracts every pdf file again
+EXTRACTOR_VERSIONS = {"keywords": 1, "annots": 1, "dist": 1}
+
+
+@dataclass
+class BatchResult:
+    """Plain result record of one pdf file, returned by a worker to the writer
+
+    Args:
+        index (int): Position of the pdf file in the batch
+        id (str): ID, e.g. Covidence number
+        pdf_path (str): Path to the pdf file
+        result (Any): Result of the extractor, e.g. (total_count, return_list)
+        text (str): Full text of the pdf file, keywords only
+        sha256 (str): SHA-256 of the pdf file
+        pages (list): Freshly parsed pages for the text cache, None if they came from the cache
+        error (str): Error message if the extraction failed
+    """
+
+    index: int
+    id: str
+    pdf_path: str
+    result: Any = None
+    text: str | None = None
+    sha256: str | None = None
+    pages: list | None = None
+    error: str | None = None
+
+
+@dataclass
+class BatchSummary:
+    """Results of a batch, in the order of the pdf files
+
+    Args:
+        results (list): BatchResult of every pdf file
+        skipped (list): (ID, path) of the pdf files skipped as unchanged
+    """
+
+    results: list[BatchResult] = field(default_factory=list)
+    skipped: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def failed(self) -> list[BatchResult]:
+        return [result for result in self.results if result.error is not None]
+
+
+def pdf_tasks(pdf_dir: str) -> list[tuple[str, str]]:
+    """Lists the pdf files of a folder with their ID, sorted by file name
+
+    Args:
+        pdf_dir (str): Folder of the pdf files, e.g. pdf_path from config.yaml
+
+    Returns:
+        list: (ID, path) of every pdf file, the ID is the file name up to the first _ without #
+    """
+    return [
+        (pdf_file_id(file_name), os.path.join(pdf_dir, file_name))
+        for file_name in sorted(os.listdir(pdf_dir))
+        if file_name.lower().endswith(".pdf")
+    ]
+
+
+# True in worker processes, False when the batch runs in the writer process
+_in_worker = False
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+    # a forked worker must not reuse the session or the pooled connections of the
+    # parent, the parent holds no connection when the workers start, see _results()
+    remove_session()
+    get_engine().dispose(close=False)
+
+
+def get_page_shard_threshold() -> int:
+    """Returns the page count from which an uncached pdf file is split across workers."""
+    config = load_config()
+    if config is not None and config.page_shard_threshold:
+        return int(config.page_shard_threshold)
+    return DEFAULT_PAGE_SHARD_THRESHOLD
+
+
+def page_shards(
+    pdf_path: str, jobs: int, threshold: int, sha256: str | None = None
+) -> list[tuple[int, int]] | None:
+    """Splits a large uncached pdf file into page ranges, one per worker
+
+    Only a file of threshold pages or more is hashed to look it up in the
+    text cache, the others are never read in full by this process.
+
+    Args:
+        pdf_path (str): Path to the pdf file
+        jobs (int): Number of worker processes
+        threshold (int): Smallest page count that is split
+        sha256 (str, optional): SHA-256 of the file if already known, e.g. from pdf_files
+
+    Returns:
+        list: (start, stop) page ranges in page order, None to extract the file in one piece
+    """
+    if jobs <= 1:
+        return None
+    try:
+        page_count = get_page_count(pdf_path)
+        if page_count < threshold:
+            return None
+        sha256 = sha256 or file_sha256(pdf_path)
+        # not through the session, the workers are forked while this runs
+        with get_engine().connect() as conn:
+            if is_cached(conn, sha256):
+                return None
+    except Exception:
+        # the worker extracting the file in one piece reports the error
+        return None
+    size = -(-page_count // jobs)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def manifest_options(extractor: str, options: dict) -> str:
+    """Serializes the options that change the results of an extractor
+
+    Args:
+        extractor (str): keywords, annots or dist
+        options (dict): Options of run_batch()
+
+    Returns:
+        str: JSON of the options, part of the key of the manifest
+    """
+    if extractor == "annots":
+        key = {"color": options.get("color", ""), "words": options.get("words", True)}
+    elif extractor == "dist" and "terms" in options:
+        key = {"terms": sorted(options["terms"])}
+    elif extractor == "dist":
+        key = {"term": options["term"]}
+    else:
+        key = {}
+    return json.dumps(key, sort_keys=True)
+
+
+def pending_tasks(
+    dbs, extractor: str, tasks: list[tuple[str, str]], options: dict, force: bool = False
+):
+    """Splits pdf files into the ones to extract and the unchanged ones, from the manifest
+
+    The hash of a pdf file comes from the pdf_files table while its size and
+    modification time are unchanged, new files are not hashed here but by the
+    workers. A pdf file is unchanged when the same extractor version already
+    ran on its content for its ID with the same options.
+
+    Args:
+        dbs (Session): Database session
+        extractor (str): keywords, annots or dist
+        tasks (list): (ID, path) of the pdf files
+        options (dict): Options of run_batch()
+        force (bool, optional): Extract every pdf file. Defaults to False.
+
+    Returns:
+        list, list, dict, dict: Tasks to extract, skipped tasks, os.stat and known SHA-256 of the pdf files by path
+    """
+    stats = {}
+    for _, pdf_path in tasks:
+        try:
+            stats[pdf_path] = os.stat(pdf_path)
+        except OSError:
+            # the worker reports the error
+            pass
+    rows = read_pdf_files(dbs.connection(), [pdf_path for _, pdf_path in tasks])
+    hashes = {}
+    for id, pdf_path in tasks:
+        if pdf_path in stats:
+            sha256 = recorded_sha256(rows.get(pdf_path), id, pdf_path, stats[pdf_path])
+            if sha256 is not None:
+                hashes[pdf_path] = sha256
+    if force:
+        return list(tasks), [], stats, hashes
+
+    manifest = ExtractionManifest.__table__
+    done = set(
+        dbs.execute(
+            select(manifest.c.sha256, manifest.c.study).where(
+                manifest.c.extractor == extractor,
+                manifest.c.options == manifest_options(extractor, options),
+                manifest.c.version == EXTRACTOR_VERSIONS[extractor],
+            )
+        ).all()
+    )
+    todo, skipped = [], []
+    for id, pdf_path in tasks:
+        unchanged = pdf_path in hashes and (hashes[pdf_path], id) in done
+        (skipped if unchanged else todo).append((id, pdf_path))
+    return todo, skipped, stats, hashes
+
+
+def _record_manifest(dbs, extractor: str, key: str, record):
+    manifest = ExtractionManifest.__table__
+    values = {"version": EXTRACTOR_VERSIONS[extractor], "updated_at": func.now()}
+    dbs.execute(
+        insert(manifest)
+        .values(sha256=record.sha256, study=record.id, extractor=extractor, options=key, **values)
+        .on_conflict_do_update(
+            index_elements=["sha256", "study", "extractor", "options"], set_=values
+        )
+    )
+
+
+def _extract(
+    extractor: str,
+    options: dict,
+    task: tuple[int, str, str],
+    parsed: tuple[str, list] | None = None,
+    sha256: str | None = None,
+) -> BatchResult:
+    """Runs an extractor on one pdf file, reads from the database but never writes
+
+    Args:
+        extractor (str): keywords, annots or dist
+        options (dict): Options of the extractor, color and words for annots, term or terms for dist
+        task (tuple): (index, ID, path)
+        parsed (tuple, optional): (SHA-256, pages) of a pdf file parsed in shards
+        sha256 (str, optional): SHA-256 of the pdf file if already known, it is not hashed again
+
+    Returns:
+        BatchResult: The result or the error
+    """
+    index, id, pdf_path = task
+    record = BatchResult(index, id, pdf_path)
+    dbs = get_db()
+    try:
+        if parsed is not None:
+            record.sha256, pages = parsed
+            record.pages = pages
+        else:
+            record.sha256, pages, cached = load_pages(pdf_path, sha256)
+            if not cached:
+                record.pages = pages
+        if extractor == "keywords":
+            record.text = get_full_text(pages)
+            record.result = find_keywords(record.text)
+        elif extractor == "annots":
+            record.result = find_annots(
+                id,
+                pages,
+                get_theme_classifier(dbs),
+                options.get("color", ""),
+                options.get("words", True),
+            )
+        elif extractor == "dist" and "terms" in options:
+            record.result = find_dists(
+                id, pages, options["terms"], get_citation(dbs, id)
+            )
+        elif extractor == "dist":
+            record.result = find_dist(
+                id, pages, options["term"], get_citation(dbs, id)
+            )
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {e}"
+    finally:
+        if _in_worker:
+            # end the read transaction, the writer needs the database
+            dbs.rollback()
+    return record
+
+
+def _save(dbs, extractor: str, options: dict, record: BatchResult):
+    if record.pages is not None:
+        store_pages(dbs.connection(), record.sha256, record.pages)
+    if not options.get("db"):
+        return
+    if extractor == "keywords" and record.result is not None:
+        save_keywords(dbs, record.id, record.result, record.text)
+    elif extractor == "annots":
+        save_annots(dbs, record.id, record.result[1], record.pdf_path)
+    elif extractor == "dist" and "terms" in options:
+        save_dists(dbs, record.id, record.result)
+    elif extractor == "dist":
+        save_dist(dbs, record.id, options["term"], *record.result)
+
+
+def _merge_shards(extractor, options, task, futures, sha256=None) -> BatchResult:
+    # pages of the shards in page order, then the extractor over the whole document
+    pages = []
+    try:
+        for future in futures:
+            pages.extend(future.result())
+        sha256 = sha256 or file_sha256(task[2])
+    except Exception as e:
+        return BatchResult(*task, error=f"{type(e).__name__}: {e}")
+    return _extract(extractor, options, task, (sha256, pages))
+
+
+def _inode(pdf_path: str) -> tuple[int, int] | None:
+    # the ID named files of one blob of the pdf store share the inode of the blob
+    try:
+        stat = os.stat(pdf_path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _results(extractor, options, tasks, jobs, hashes=None) -> Iterator[BatchResult]:
+    hashes = hashes or {}
+    work = partial(_extract, extractor, options)
+    indexed = [(index, id, pdf_path) for index, (id, pdf_path) in enumerate(tasks)]
+    if jobs <= 1:
+        # a later identical pdf file is read from the text cache
+        for task in indexed:
+            yield work(task, None, hashes.get(task[2]))
+        return
+    threshold = get_page_shard_threshold()
+    # release the connection of the session, a worker forked with it checked out
+    # would share the sqlite3 handle, the pool forks all workers at the first submit
+    get_db().rollback()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+        contents = set()
+
+        def submit(task):
+            sha256 = hashes.get(task[2])
+            content = sha256 or _inode(task[2])
+            if content is not None and content in contents:
+                # identical to a pdf file already submitted, extracted from the text cache once it is saved
+                return None
+            contents.add(content)
+            shards = page_shards(task[2], jobs, threshold, sha256)
+            if shards is None:
+                return executor.submit(work, task, None, sha256)
+            # every worker opens the file itself and parses a range of pages
+            return [executor.submit(parse_pdf, task[2], start, stop) for start, stop in shards]
+
+        # a bounded window of pdf files in flight, a slow pdf file holds back
+        # at most 2 * jobs parsed results instead of the whole folder
+        tasks = iter(indexed)
+        pending = deque((task, submit(task)) for task in islice(tasks, 2 * jobs))
+        # results in task order, whatever order the workers finish in
+        while pending:
+            task, future = pending.popleft()
+            if future is None:
+                record = work(task, None, hashes.get(task[2]))
+            elif isinstance(future, list):
+                record = _merge_shards(extractor, options, task, future, hashes.get(task[2]))
+            else:
+                record = future.result()
+            # refill before handing the result to the writer, the workers keep busy meanwhile
+            next_task = next(tasks, None)
+            if next_task is not None:
+                pending.append((next_task, submit(next_task)))
+            yield record
+
+
+def run_batch(
+    extractor: str,
+    tasks: list[tuple[str, str]],
+    jobs: int = 1,
+    write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+    on_result: Callable[[BatchResult], None] | None = None,
+    force: bool = False,
+    **options,
+) -> BatchSummary:
+    """Runs an extractor over many pdf files in worker processes, with a single writer
+
+    The workers parse the pdf files (or read them from the text cache) and return
+    plain records, at most 2 * jobs pdf files are in flight. An uncached pdf file of page_shard_threshold pages or more is
+    split in page ranges parsed by several workers and merged in page order. This process is the only one writing to SQLite, it stores the
+    parsed pages and, with db=True, the results, one transaction per
+    write_batch_size pdf files. A pdf file that fails to extract or to save is
+    logged and skipped.
+
+    The hash of every saved pdf file is recorded in the pdf_files table, known
+    hashes are passed to the workers instead of hashing the files again, and
+    identical pdf files are parsed once. With db=True the content and ID of
+    every saved pdf file is recorded in the extraction_manifest table, pdf
+    files unchanged since the last run of the same extractor version and
+    options are skipped unless force is set.
+
+    Args:
+        extractor (str): keywords, annots or dist
+        tasks (list): (ID, path) of the pdf files, e.g. from pdf_tasks()
+        jobs (int, optional): Number of worker processes, 1 runs in this process. Defaults to 1.
+        write_batch_size (int, optional): PDF files per write transaction. Defaults to DEFAULT_WRITE_BATCH_SIZE.
+        on_result (Callable, optional): Called with every BatchResult, in task order
+        force (bool, optional): Extract unchanged pdf files too. Defaults to False.
+        **options: db, and color and words for annots, term or terms (all in one pass) for dist
+
+    Raises:
+        ValueError: Unknown extractor
+
+    Returns:
+        BatchSummary: Results in task order
+    """
+    if extractor not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor {extractor}, use one of {EXTRACTORS}.")
+
+    dbs = get_db()
+    # created before the workers start, they only read
+    for model in (PdfPage, PdfFile, ExtractionManifest):
+        model.__table__.create(dbs.connection(), checkfirst=True)
+    if extractor == "dist":
+        # the citation is read by the workers, e.g. from a studies table created by add csv
+        ensure_study_columns(dbs, ["citation", "total_distribution"])
+    dbs.commit()
+
+    summary = BatchSummary()
+    key = manifest_options(extractor, options)
+    tasks, summary.skipped, stats, hashes = pending_tasks(
+        dbs, extractor, tasks, options, force or not options.get("db")
+    )
+    dbs.commit()
+    pending = 0
+    for record in _results(extractor, options, tasks, jobs, hashes):
+        summary.results.append(record)
+        if record.error is None:
+            try:
+                # a savepoint, a failing pdf file does not roll back the others
+                with dbs.begin_nested():
+                    # recorded first, storing the pages sets its page count
+                    if record.pdf_path in stats:
+                        record_pdf_file(
+                            dbs.connection(), record.id, record.pdf_path, stats[record.pdf_path], record.sha256
+                        )
+                    _save(dbs, extractor, options, record)
+                    if record.pdf_path in stats and options.get("db"):
+                        _record_manifest(dbs, extractor, key, record)
+            except Exception as e:
+                record.error = f"{type(e).__name__}: {e}"
+            pending += 1
+            if pending >= write_batch_size:
+                dbs.commit()
+                pending = 0
+        if record.error is not None:
+            logger().error(f"{extractor} failed for {record.pdf_path}: {record.error}")
+        if on_result is not None:
+            on_result(record)
+    dbs.commit()
+
+    return summary
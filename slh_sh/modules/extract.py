@@ -1,23 +1,32 @@
 import os
 import time
 import re
-import fitz
-import requests
+import numpy as np
 import pandas as pd
 
 import sys
 
-from bs4 import BeautifulSoup
-from pdfminer.high_level import extract_text
+from types import SimpleNamespace
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from slh_sh.utils.log import logger
+from slh_sh.utils.config import load_config
 from slh_sh.utils.db import get_db
-from slh_sh.utils.file import file_name_generator, get_conf, get_random_string
+from slh_sh.utils.file import (
+    get_conf,
+    get_import_chunk_size,
+    get_random_string,
+)
+from slh_sh.utils.html import iter_download_links
 from slh_sh.utils.pdf import (
+    DEFAULT_THEME_COLOR_THRESHOLD,
+    ThemeClassifier,
     rgb_to_hex,
-    get_pdf_text,
-    is_color_close,
 )
+from slh_sh.utils.textcache import get_pages, get_full_text
+from slh_sh.modules.add import ensure_study_ids
 from slh_sh.modules.sync import (
     update_sheet_cell,
     get_spreadsheet_by_url,
@@ -32,109 +41,400 @@ from slh_sh.data.models import (
     Theme,
     Annotation,
     Distribution,
+    SourceHash,
 )
 
 
+##
+## Studies
+##
+
+
+def column_as_str(column: pd.Series) -> pd.Series:
+    """Converts a CSV column to strings, whole numbers without a trailing .0 and missing values as None
+
+    Args:
+        column (pd.Series): Column of the CSV export, e.g. Published Year
+
+    Returns:
+        pd.Series: Column as strings
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        column = column.round().astype("Int64")
+    return column.astype("string").fillna("None").astype(object)
+
+
+def blank_as_na(column: pd.Series) -> pd.Series:
+    """Treats empty and whitespace only values of a CSV column as missing
+
+    Args:
+        column (pd.Series): Column of the CSV export, e.g. Published Year
+
+    Returns:
+        pd.Series: Column with blank values as NA
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        return column
+    blank = column.astype("string").str.strip().eq("").fillna(False).astype(bool)
+    return column.mask(blank)
+
+
+def author_last_names(authors: pd.Series) -> pd.DataFrame:
+    """Splits the Authors column into the last names used by file names and citations
+
+    Args:
+        authors (pd.Series): Authors column, e.g. "Smith, J.; Doe, K."
+
+    Returns:
+        pd.DataFrame: first and second last names and the number of authors
+    """
+    authors = authors.fillna("None").astype(str)
+    parts = authors.str.split(";", n=2, expand=True).reindex(columns=[0, 1], fill_value="")
+    return pd.DataFrame(
+        {
+            "first": parts[0].astype(str).str.split(",", n=1).str[0].str.strip(),
+            "second": parts[1].fillna("").astype(str).str.split(",", n=1).str[0].str.strip(),
+            "count": authors.str.count(";") + 1,
+        },
+        index=authors.index,
+    )
+
+
+def generate_file_names(ids: pd.Series, authors: pd.Series, years: pd.Series) -> pd.Series:
+    """Generates the file names of all studies at once, same format as file_name_generator
+
+    e.g. 12_Smith_2020, 12_Smith_Doe_2020 or 12_Smith_et_al_2020
+
+    Args:
+        ids (pd.Series): ID column e.g. Covidence Number
+        authors (pd.Series): Authors column
+        years (pd.Series): Publication year column
+
+    Returns:
+        pd.Series: File names
+    """
+    names = author_last_names(authors)
+    ids = column_as_str(ids)
+    years = column_as_str(years)
+    prefix = ids + "_" + names["first"] + "_"
+    return pd.Series(
+        np.select(
+            [names["count"] == 1, names["count"] == 2],
+            [prefix + years, prefix + names["second"] + "_" + years],
+            prefix + "et_al_" + years,
+        ),
+        index=ids.index,
+    )
+
+
+def load_studies(dbs, columns: list[str]) -> pd.DataFrame:
+    """Loads columns of the whole studies table in one query
+
+    Args:
+        dbs (Session): Database session
+        columns (list): Column names of the studies table
+
+    Returns:
+        pd.DataFrame: One row per study
+    """
+    table = Study.__table__
+    return pd.read_sql(
+        select(*[table.c[column] for column in columns]), dbs.connection()
+    )
+
+
+def source_hashes(studies: pd.DataFrame, source_columns: list[str]) -> pd.Series:
+    """Fingerprints the source columns of every study
+
+    Args:
+        studies (pd.DataFrame): Studies with the source columns
+        source_columns (list): Columns a generated column is built from
+
+    Returns:
+        pd.Series: Hex hash per study
+    """
+    return pd.util.hash_pandas_object(
+        studies[source_columns].astype(str), index=False
+    ).map("{:016x}".format)
+
+
+def changed_studies(dbs, studies: pd.DataFrame, target: str, hashes: pd.Series):
+    """Selects the studies whose source columns changed since target was last generated
+
+    Args:
+        dbs (Session): Database session
+        studies (pd.DataFrame): Studies with a Covidence column
+        target (str): Generated column e.g. citation
+        hashes (pd.Series): Current source hashes from source_hashes()
+
+    Returns:
+        pd.DataFrame: The changed studies
+    """
+    conn = dbs.connection()
+    SourceHash.__table__.create(conn, checkfirst=True)
+    stored = pd.read_sql(
+        select(SourceHash.study, SourceHash.hash).where(SourceHash.target == target),
+        conn,
+    )
+    stored = studies["Covidence"].astype(str).map(dict(zip(stored.study, stored.hash)))
+    return studies[hashes != stored]
+
+
+def save_generated(
+    dbs, target: str, studies: pd.DataFrame, values: pd.Series | pd.DataFrame, hashes: pd.Series
+):
+    """Writes generated columns back to the studies table in one executemany
+
+    Args:
+        dbs (Session): Database session
+        target (str): Generated column e.g. citation, the source hashes are remembered under this name
+        studies (pd.DataFrame): Studies with a Covidence column
+        values (pd.Series | pd.DataFrame): Generated values, same index as studies, a DataFrame writes one column per DataFrame column
+        hashes (pd.Series): Source hashes to remember for --changed-only
+    """
+    if isinstance(values, pd.Series):
+        values = values.to_frame(target)
+    table = Study.__table__
+    conn = dbs.connection()
+    params = [
+        {"b_id": id, **{f"b_{column}": value for column, value in zip(values.columns, row)}}
+        for id, row in zip(studies["Covidence"], values.itertuples(index=False))
+    ]
+    if params:
+        conn.execute(
+            update(table)
+            .where(table.c.Covidence == bindparam("b_id"))
+            .values({column: bindparam(f"b_{column}") for column in values.columns}),
+            params,
+        )
+    SourceHash.__table__.create(conn, checkfirst=True)
+    stmt = sqlite_insert(SourceHash.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["study", "target"],
+        set_={"hash": stmt.excluded.hash, "updated_at": func.now()},
+    )
+    rows = [
+        {"study": str(id), "target": target, "hash": hashes[i]}
+        for i, id in zip(studies.index, studies["Covidence"])
+    ]
+    if rows:
+        conn.execute(stmt, rows)
+
+
+def ensure_study_columns(dbs, columns: list[str]):
+    """Adds generated columns missing from a studies table created from an older CSV import
+
+    A table without an id column gets one first, see ensure_study_ids().
+
+    Args:
+        dbs (Session): Database session
+        columns (list): Column names of the Study model
+    """
+    conn = dbs.connection()
+    ensure_study_ids(conn.connection.driver_connection)
+    existing = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(studies)")}
+    for column in columns:
+        if column not in existing:
+            conn.exec_driver_sql(f'ALTER TABLE studies ADD COLUMN "{column}" VARCHAR')
+            conn.exec_driver_sql(
+                f'CREATE INDEX IF NOT EXISTS ix_studies_{column} ON studies ("{column}")'
+            )
+
+
 ##
 ## Extract Citation
 ##
 
+CITATION_SOURCE_COLUMNS = ["authors", "published_year", "title"]
+
+
+def year_suffixes(counts: pd.Series) -> pd.Series:
+    """Turns positions within a group into year suffixes, 0 to a, 25 to z, 26 to aa
+
+    Args:
+        counts (pd.Series): 0 based position of each study in its group
+
+    Returns:
+        pd.Series: Suffixes
+    """
+
+    def letters(n: int) -> str:
+        suffix = ""
+        n += 1
+        while n:
+            n, rest = divmod(n - 1, 26)
+            suffix = chr(ord("a") + rest) + suffix
+        return suffix
+
+    # only as many conversions as the largest group, not one per study
+    return counts.map({n: letters(n) for n in counts.unique()})
+
 
-def extract_cit(db=False):
-    """Extracts and generates APA 7 citation from the file name in db and updates the citation column in the studies table
+def generate_citations(studies: pd.DataFrame) -> pd.DataFrame:
+    """Generates the APA 7 in-text citations and citation keys of all studies at once
+
+    e.g. (Smith, 2020), (Smith & Doe, 2020) or (Smith et al., 2020). Studies that
+    would get the same citation are told apart by a year suffix, (Smith, 2020a) and
+    (Smith, 2020b), assigned in title order, then ID order. A missing or blank year
+    is cited as n.d., (Smith, n.d.) or (Smith, n.d.-a).
+
+    Args:
+        studies (pd.DataFrame): Studies with Covidence and the CITATION_SOURCE_COLUMNS
 
     Returns:
-        list, list: List of citations, List of rows with None values
+        pd.DataFrame: citation and citation_key columns, e.g. smithdoe2020a
     """
+    names = author_last_names(studies["authors"])
+    no_date = blank_as_na(studies["published_year"]).isna()
+    years = column_as_str(studies["published_year"]).where(~no_date, "n.d.")
+    cited = pd.Series(
+        np.select(
+            [names["count"] == 1, names["count"] == 2],
+            [names["first"], names["first"] + " & " + names["second"]],
+            names["first"] + " et al.",
+        ),
+        index=studies.index,
+    )
+    author_key = (
+        cited.str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[^a-z0-9]", "", regex=True)
+    )
 
+    ordered = pd.DataFrame(
+        {
+            "author_key": author_key,
+            "year": years,
+            "title": studies["title"].fillna("").astype(str).str.casefold(),
+            "id": studies["Covidence"],
+        }
+    ).sort_values(["author_key", "year", "title", "id"], kind="stable")
+    group = ordered.groupby(["author_key", "year"], sort=False)
+    # no suffix for a study that is alone in its group
+    suffix = year_suffixes(group.cumcount()).where(group["id"].transform("size") > 1, "")
+    suffix = suffix.reindex(studies.index)
+    key_years = years.where(~no_date, "nd") + suffix
+    years = years + suffix.where(~no_date | (suffix == ""), "-" + suffix)
+
+    return pd.DataFrame(
+        {
+            "citation": "(" + cited + ", " + years + ")",
+            "citation_key": author_key + key_years,
+        },
+        index=studies.index,
+    )
+
+
+def extract_cit(db=False, changed_only=False):
+    """Generates the APA 7 citations of all studies and updates the citation and citation_key columns in the studies table
+
+    Args:
+        db (bool, optional): Save to the database? Defaults to False.
+        changed_only (bool, optional): Only studies whose source columns or citation key changed since the last run. Defaults to False.
+
+    Returns:
+        list, list: List of citations, List of IDs of studies without authors
+    """
     dbs = get_db()
-    rows = dbs.query(Study).all()
+    ensure_study_columns(dbs, ["citation", "citation_key"])
+    studies = load_studies(dbs, ["Covidence", "citation_key"] + CITATION_SOURCE_COLUMNS)
+
+    # a study without a year is cited as n.d., one without authors can't be cited
+    missing = blank_as_na(studies["authors"]).isna()
+    authorNoneRemoved = studies.loc[missing, "Covidence"].tolist()
+    studies = studies[~missing]
+
+    # always the whole corpus, a changed study can shift the suffixes of the others
+    citations = generate_citations(studies)
+
+    hashes = source_hashes(studies, CITATION_SOURCE_COLUMNS)
+    if changed_only:
+        changed = changed_studies(dbs, studies, "citation", hashes).index
+        stale = studies.index.isin(changed) | (
+            citations["citation_key"] != studies["citation_key"]
+        )
+        studies, citations = studies[stale], citations[stale]
 
-    citations = []
-    authorNoneRemoved = []
-    for row in rows:
-        if None in row:
-            print(f"{row} is none")
-            authorNoneRemoved.append(row)
-        else:
-            fileName: str = file_name_generator(row[0], row[1], row[2])
-
-            fileName = fileName.split("_")
-
-            year = fileName[-1]
-            if len(fileName) == 3:  # 1 author
-                authorsName = fileName[1]
-                citation = f"({authorsName}, {year})"
-            elif len(fileName) == 4:  # 2 authors
-                authorsName = f"{fileName[1]} & {fileName[2]}"
-                citation = f"({authorsName}, {year})"
-            elif len(fileName) == 5:  # more than 2 authors using first author and et al
-                authorsName = f"{fileName[1]} et al."
-                citation = f"({authorsName}, {year})"
-
-            citation = f"({authorsName}, {row[2]})"
-
-            if db:
-                dbs.query(Study).filter(Study.Covidence == fileName[0]).update(
-                    {Study.citation: citation}
-                )
-                dbs.commit()
-            citations.append(citation)
+    if db:
+        save_generated(dbs, "citation", studies, citations, hashes)
+        dbs.flush()
 
-    return citations, authorNoneRemoved
+    return citations["citation"].tolist(), authorNoneRemoved
 
 
 ##
 ## Extract Bibliography
 ##
 
+BIBLIOGRAPHY_SOURCE_COLUMNS = [
+    "authors",
+    "published_year",
+    "title",
+    "journal",
+    "volume",
+    "issue",
+    "pages",
+]
+
 
-def extract_bib(csv, db=False):
-    """Extracts the bibliography from the csv file and updates the bibliography column in the studies table
+def generate_bibliographies(studies: pd.DataFrame) -> pd.Series:
+    """Generates the APA 7 bibliographies of all studies at once
+
+    e.g. Smith, J. (2020). Title. Journal 1(2), 3-4.
 
     Args:
-        csv (file): csv file
+        studies (pd.DataFrame): Studies with the BIBLIOGRAPHY_SOURCE_COLUMNS
 
     Returns:
-        list: List of bibliographies
+        pd.Series: Bibliographies
     """
-    csv_df = pd.read_csv(csv)
-    csv_df["Published Year"] = csv_df["Published Year"].astype(str)
-    csv_df = csv_df.fillna("None")
-
-    dbs = get_db()
+    col = {column: column_as_str(studies[column]) for column in BIBLIOGRAPHY_SOURCE_COLUMNS}
+    return (
+        col["authors"]
+        + " ("
+        + col["published_year"]
+        + "). "
+        + col["title"]
+        + ". "
+        + col["journal"]
+        + " "
+        + col["volume"]
+        + "("
+        + col["issue"]
+        + "), "
+        + col["pages"]
+        + "."
+    )
 
-    bibs = []
 
-    db_res = dbs.query(Study).all()
+def extract_bib(csv, db=False, changed_only=False):
+    """Generates the bibliographies of all studies and updates the bibliography column in the studies table
 
-    for row in db_res:
-        bib = {
-            "covidence_number": row.Covidence,
-            "author": row.authors,
-            "year": row.published_year,
-            "title": row.title,
-            "journal": row.journal,
-            "volume": row.volume,
-            "issue": row.issue,
-            "pages": row.pages,
-        }
+    Args:
+        csv (file): csv file, unused since the studies table holds the imported CSV
+        db (bool, optional): Save to the database? Defaults to False.
+        changed_only (bool, optional): Only studies whose source columns changed since the last run. Defaults to False.
 
-        bibs.append(bib)
+    Returns:
+        list: List of bibliographies
+    """
+    dbs = get_db()
+    ensure_study_columns(dbs, ["bibliography"])
+    studies = load_studies(dbs, ["Covidence"] + BIBLIOGRAPHY_SOURCE_COLUMNS)
 
-    for bib in bibs:
-        bibliography: str = f"{bib['author']} ({bib['year']}). {bib['title']}. {bib['journal']} {bib['volume']}({bib['issue']}), {bib['pages']}."
-        id: str = f"{bib['covidence_number']}"
+    hashes = source_hashes(studies, BIBLIOGRAPHY_SOURCE_COLUMNS)
+    if changed_only:
+        studies = changed_studies(dbs, studies, "bibliography", hashes)
 
-        if db:
-            dbs.query(Study).filter(Study.Covidence == id).update(
-                {Study.bibliography: bibliography}
-            )
-            dbs.commit()
+    bibs = generate_bibliographies(studies)
 
-    dbs.close()
+    if db:
+        save_generated(dbs, "bibliography", studies, bibs, hashes)
+        dbs.flush()
 
-    return bibs
+    return bibs.tolist()
 
 
 ##
@@ -142,59 +442,46 @@ def extract_bib(csv, db=False):
 ##
 
 
-def extract_dl(html, pdf_dir, html_id_element, html_dl_class):
-    """Extracts the download link from the html file and downloads the pdf files
+def find_download_links(html, html_id_element, html_dl_class):
+    """Finds the IDs and download links of the studies in the HTML export
+
+    The export is streamed through an event-driven parser, see iter_download_links().
 
     Args:
         html (file): html file name from config.yaml
-        pdf_dir (str): pdf folder name from config.yaml
         html_id_element (str): id element of html_dl_class name from cli option or config.yaml
         html_dl_class (str): download link element that contains a element and a URL, from cli option or config.yaml
 
-    Raises:
-        Exception: Bad response status code, remove the section of the HTML file containing this link and try again.
-
-    Returns:    TODO: return the pdf file name
-        Soup result: result of the soup.find_all
+    Yields:
+        tuple: (ID, URL) of every study header
     """
-    with open(html, "r") as f:
-        html_string = f.read()
+    yield from iter_download_links(html, html_id_element, html_dl_class)
 
-    soup = BeautifulSoup(html_string, "html.parser")
 
-    study_headers = soup.find_all("div", class_=html_id_element)
+def extract_dl(html, pdf_dir, html_id_element, html_dl_class, **options):
+    """Extracts the download link from the html file and downloads the pdf files
 
-    for study_header in study_headers:
-        study_header_number = re.findall("#(\d+)", study_header.text)[0]
-        download_link_element = study_header.parent.find("a", class_=html_dl_class)
-        download_link = download_link_element["href"]
+    The pdf files are downloaded concurrently, see download_all(). A link that
+    fails is retried, then reported, the others go on.
 
-        print(
-            f"""
-            :runner: Downloading PDF with ID {study_header_number} and URL {download_link}..."""
-        )
+    Args:
+        html (file): html file name from config.yaml
+        pdf_dir (str): pdf folder name from config.yaml
+        html_id_element (str): id element of html_dl_class name from cli option or config.yaml
+        html_dl_class (str): download link element that contains a element and a URL, from cli option or config.yaml
+        **options: workers, per_host, delay, retries, backoff, timeout and on_result of download_all()
 
-        pdf_path = os.path.join(pdf_dir, f"{study_header_number}.pdf")
-
-        if not os.path.exists(pdf_path):
-            response = requests.get(download_link)
-            if response.status_code == 200:
-                with open(pdf_path, "wb") as f:
-                    f.write(response.content)
-                print(f"PDF downloaded: {pdf_path}")
-                time.sleep(3)
-            else:
-                raise Exception(
-                    f"""
-                    [bold red]Error[/bold red]: {response.status_code}
-
-                    Failed to download PDF: {download_link}, remove the section of the HTML file containing this link and try again.
-                    """
-                )
-        else:
-            print(f"PDF already exists: {pdf_path}")
+    Returns:
+        DownloadReport: Result of every link
+    """
+    from slh_sh.utils.download import download_all
 
-    return study_headers
+    report = download_all(
+        find_download_links(html, html_id_element, html_dl_class), pdf_dir, **options
+    )
+    for result in report.failed:
+        logger().error(f"Failed to download PDF {result.id} from {result.url}: {result.error}")
+    return report
 
 
 ##
@@ -212,39 +499,47 @@ def extract_filename(csv, rename=False, db=False):
     Returns:
         list: List of file names
     """
-    csv_df = pd.read_csv(csv)
-    csv_df["Published Year"] = csv_df["Published Year"].astype(str)
-    csv_df = csv_df.fillna("None")
+    dbs = get_db()
+    if db:
+        ensure_study_columns(dbs, ["filename"])
+    pdf_dir = get_conf("pdf_path")
+    pdf_files = set(os.listdir(pdf_dir)) if rename and os.path.isdir(pdf_dir) else set()
+
+    update_filename = (
+        update(Study.__table__)
+        .where(Study.__table__.c.Covidence == bindparam("b_id"))
+        .values(filename=bindparam("b_filename"))
+    )
 
     file_names = []
-    for i in csv_df["Authors"]:
-        # select covidence # from csv_df where authors is i
-        covidence_number: str = csv_df.loc[csv_df["Authors"] == i][
-            "Covidence #"
-        ].values[0]
-        # select publicaiton year from csv_df where authors is i
-        year: str = csv_df.loc[csv_df["Authors"] == i]["Published Year"].values[0]
-
-        file_name: str = file_name_generator(covidence_number, i, year)
+    # stream the CSV, each chunk is written to the database before the next is read
+    for csv_df in pd.read_csv(csv, chunksize=get_import_chunk_size()):
+        ids = column_as_str(csv_df["Covidence #"])
+        chunk_names = generate_file_names(
+            ids, csv_df["Authors"], csv_df["Published Year"]
+        )
 
         if db:
-            dbs = get_db()
-            dbs.query(Study).filter(Study.Covidence == covidence_number).update(
-                {Study.filename: file_name}
+            # one executemany for the whole chunk
+            dbs.connection().execute(
+                update_filename,
+                [
+                    {"b_id": id, "b_filename": file_name}
+                    for id, file_name in zip(ids, chunk_names)
+                ],
             )
-            dbs.commit()
-            dbs.close()
 
         if rename:
-            pdf_path = os.path.join(get_conf("pdf_path"), f"{covidence_number}.pdf")
-            if os.path.exists(pdf_path) and not pdf_path.endswith(f"{file_name}.pdf"):
-                os.rename(
-                    pdf_path, os.path.join(get_conf("pdf_path"), f"{file_name}.pdf")
-                )
-            else:
-                print("file exists")
+            for id, file_name in zip(ids, chunk_names):
+                if f"{id}.pdf" in pdf_files and f"{file_name}.pdf" not in pdf_files:
+                    os.rename(
+                        os.path.join(pdf_dir, f"{id}.pdf"),
+                        os.path.join(pdf_dir, f"{file_name}.pdf"),
+                    )
+                else:
+                    print("file exists")
 
-        file_names.append(file_name)
+        file_names.extend(chunk_names.tolist())
 
     return file_names
 
@@ -254,6 +549,45 @@ def extract_filename(csv, rename=False, db=False):
 ##
 
 
+def find_keywords(text: str) -> str | None:
+    """Finds the keywords paragraph in the text of a pdf file
+
+    Args:
+        text (str): Full text of the pdf file
+
+    Returns:
+        str: Keywords, None if the pdf file has no keywords paragraph
+    """
+    regex = r"(?is)(keyword.*?)(?:(?:\r*\n){2}|\Z)"
+    matches = re.findall(regex, text)
+    if len(matches) == 0:
+        return None
+    return (
+        matches[0]
+        .replace("\n", " ")
+        .replace("Keywords:", "")
+        .replace("KEYWORDS:", "")
+        .replace("Keywords", "")
+        .replace("KEYWORDS", "")
+        .strip()
+    )
+
+
+def save_keywords(dbs, id, keywords: str, text: str):
+    """Updates the keywords and full_text columns of a study
+
+    Args:
+        dbs (Session): Database session
+        id (int): ID, e.g. Covidence number
+        keywords (str): Keywords from find_keywords()
+        text (str): Full text of the pdf file
+    """
+    ensure_study_columns(dbs, ["keywords", "full_text"])
+    dbs.query(Study).filter(Study.Covidence == id).update(
+        {Study.keywords: keywords, Study.full_text: text}
+    )
+
+
 def extract_keywords(id, pdf_path, db=False):
     """Extracts the keywords from the pdf file and updates the keywords column in the studies table
 
@@ -263,38 +597,24 @@ def extract_keywords(id, pdf_path, db=False):
         db (bool, optional): Save to database? Defaults to False.
 
     Returns:
-        _type_: _description_
+        list: "ID keywords" of the pdf file
     """
     print(f"Extracting keywords of: {pdf_path}...")
 
-    text = extract_text(pdf_path)
-    regex = r"(?is)(keyword.*?)(?:(?:\r*\n){2})"
-    matches = re.findall(regex, text)
-    length = len(matches)
+    text = get_full_text(get_pages(pdf_path))
+    keywords = find_keywords(text)
 
     all_keywords = []
-    if length == 0:
+    if keywords is None:
         print(f"Keywords not found for {pdf_path}")
         all_keywords.append(f"{id} None")
-    elif length >= 1:
-        keywords = (
-            matches[0]
-            .replace("\n", " ")
-            .replace("Keywords:", "")
-            .replace("KEYWORDS:", "")
-            .replace("Keywords", "")
-            .replace("KEYWORDS", "")
-            .strip()
-        )
+    else:
         all_keywords.append(f"{id} {keywords}")
         print(id, keywords)
         if db:
             dbs = get_db()
-            dbs.query(Study).filter(Study.Covidence == id).update(
-                {Study.keywords: keywords}
-            )
-            dbs.commit()
-            dbs.close()
+            save_keywords(dbs, id, keywords, text)
+            dbs.flush()
 
     return all_keywords
 
@@ -304,96 +624,149 @@ def extract_keywords(id, pdf_path, db=False):
 ##
 
 
-def extract_annots(id: int, color: str, pdf_path: str, db: bool = False):
-    """Extracts the annotations from the pdf file and updates the annotations table in the database
+def get_theme_classifier(dbs) -> ThemeClassifier:
+    """Loads all themes once per session into a ThemeClassifier
+
+    Args:
+        dbs (Session): Database session
+
+    Returns:
+        ThemeClassifier: Classifier shared by every PDF of the command
+    """
+    if "theme_classifier" not in dbs.info:
+        config = load_config()
+        threshold = DEFAULT_THEME_COLOR_THRESHOLD
+        if config is not None and config.theme_color_threshold is not None:
+            threshold = float(config.theme_color_threshold)
+        # plain copies, they outlive the commits and rollbacks of the session
+        themes = [
+            SimpleNamespace(id=t.id, color=t.color, term=t.term, hex=t.hex)
+            for t in dbs.query(Theme).all()
+        ]
+        dbs.info["theme_classifier"] = ThemeClassifier(themes, threshold)
+    return dbs.info["theme_classifier"]
+
+
+def find_annots(
+    id: int, pages: list, classifier: ThemeClassifier, color: str = "", words: bool = True
+):
+    """Finds the highlights of a pdf file and their themes
 
     Args:
         id (int): ID, e.g. Covidence number
-        color (str): Color of the annotations to extract
-        pdf_path (str): Path to the pdf file
-        db (bool, optional): Defaults to False
+        pages (list): Pages from the text cache
+        classifier (ThemeClassifier): Classifier from get_theme_classifier()
+        color (str, optional): Theme color (name in config.yaml) of the annotations to extract, "" for all
+        words (bool, optional): Exactly the highlighted words, False for whole blocks. Defaults to True.
 
     Returns:
         total_count (int), return_list (list): Total count of the annotations found in the pdf file, and the list of the annotations
     """
     total_count = 0
-    page_annots = []
-    page_number = 0
     return_list = []
 
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
-            count = 0
-            page_number = page.number + 1
-            page_annots = page.annots()
-            for annot in page_annots:
-                if annot.type[1] == "Highlight":
-                    annot_color = annot.colors["stroke"]
-                    hex_color = rgb_to_hex(annot_color)
-                    annot_rgb_fixed = tuple(int(color * 255) for color in annot_color)
-                    if color != "":
-                        dbs = get_db()
-                        theme_data = (
-                            dbs.query(Theme).filter(Theme.color == hex_color).first()
-                        )
-                        theme_color = theme_data.color
-                        theme_term = theme_data.term
-                        theme_hex_color = theme_data.hex
-                        color_matched = is_color_close(annot_color, theme_hex_color)
-                        if color_matched:
-                            text = get_pdf_text(page, annot.rect)
-                            if any(d["text"] == text for d in return_list):
-                                continue
-                            else:
-                                total_count += 1
-                                count += 1
-                                item = {
-                                    "ID": id,
-                                    "count": count,
-                                    "searched_color": color,
-                                    "page_number": page_number,
-                                    "annot_rgb_color": annot_rgb_fixed,
-                                    "annot_hex_color": hex_color,
-                                    "theme_hex_color": theme_hex_color,
-                                    "theme_term": theme_term,
-                                    "theme_color": theme_color,
-                                    "text": text,
-                                }
-                                return_list.append(item)
-                    else:
-                        text = get_pdf_text(page, annot.rect)
-                        if any(d["text"] == text for d in return_list):
-                            continue
-                        else:
-                            total_count += 1
-                            count += 1
-                            item = {
-                                "ID": id,
-                                "count": count,
-                                "page_number": page_number,
-                                "annot_rgb_color": annot_rgb_fixed,
-                                "annot_hex_color": hex_color,
-                                "text": text,
-                            }
-                            return_list.append(item)
+    highlights = [
+        (page, annot)
+        for page in pages
+        for annot in page.annots
+        if annot["type"] == "Highlight" and annot["stroke"]
+    ]
+    # every distinct color of the pdf in one go
+    themes = classifier.classify_many([annot["stroke"] for _, annot in highlights])
+
+    counts = {}
+    seen = set()
+    for (page, annot), theme in zip(highlights, themes):
+        if color != "" and (theme is None or theme.color != color):
+            continue
+        text = page.highlight_text(annot, words)
+        if text in seen:
+            continue
+        seen.add(text)
+
+        annot_color = annot["stroke"]
+        total_count += 1
+        counts[page.page_number] = counts.get(page.page_number, 0) + 1
+        item = {
+            "ID": id,
+            "count": counts[page.page_number],
+            "page_number": page.page_number,
+            "annot_rgb_color": tuple(int(c * 255) for c in annot_color),
+            "annot_hex_color": rgb_to_hex(annot_color),
+        }
+        if color != "":
+            item["searched_color"] = color
+        if theme is not None:
+            item.update(
+                {
+                    "theme_id": theme.id,
+                    "theme_hex_color": theme.hex,
+                    "theme_term": theme.term,
+                    "theme_color": theme.color,
+                }
+            )
+        item["text"] = text
+        return_list.append(item)
+
+    return total_count, return_list
 
-        if db:
-            dbs = get_db()
-            theme_id = dbs.query(Theme).filter(Theme.color == hex_color).first().id
-            for i in return_list:
-                dbs.add(
-                    Annotation(
-                        studies_id=id,
-                        theme_id=theme_id,
-                        count=i["count"],
-                        page_number=i["page_number"],
-                        annot_rgb_color=i["annot_rgb_color"],
-                        annot_hex_color=i["annot_hex_color"],
-                        text=i["text"],
-                    )
-                )
-            dbs.commit()
-            dbs.close()
+
+def save_annots(dbs, id: int, return_list: list, pdf_path: str):
+    """Adds the annotations of a pdf file to the annotations table
+
+    Args:
+        dbs (Session): Database session
+        id (int): ID, e.g. Covidence number
+        return_list (list): Annotations from find_annots()
+        pdf_path (str): Path to the pdf file, for the log
+    """
+    # the annotations refer to studies.id, like the distribution rows
+    study_id = get_study_id(dbs, id)
+    if study_id is None:
+        logger().warning(f"Study {id} not found in the studies table, annotations not saved.")
+        return
+    for i in return_list:
+        if "theme_id" not in i:
+            logger().warning(
+                f"{pdf_path} page {i['page_number']}: highlight color {i['annot_hex_color']} matches no theme, not saved."
+            )
+            continue
+        dbs.add(
+            Annotation(
+                studies_id=study_id,
+                theme_id=i["theme_id"],
+                count=i["count"],
+                page_number=i["page_number"],
+                annot_rgb_color=str(i["annot_rgb_color"]),
+                annot_hex_color=i["annot_hex_color"],
+                text=i["text"],
+            )
+        )
+
+
+def extract_annots(
+    id: int, color: str, pdf_path: str, db: bool = False, words: bool = True
+):
+    """Extracts the annotations from the pdf file and updates the annotations table in the database
+
+    Args:
+        id (int): ID, e.g. Covidence number
+        color (str): Theme color (name in config.yaml) of the annotations to extract, "" for all
+        pdf_path (str): Path to the pdf file
+        db (bool, optional): Defaults to False
+        words (bool, optional): Exactly the highlighted words, False for whole blocks. Defaults to True.
+
+    Returns:
+        total_count (int), return_list (list): Total count of the annotations found in the pdf file, and the list of the annotations
+    """
+    dbs = get_db()
+    total_count, return_list = find_annots(
+        id, get_pages(pdf_path), get_theme_classifier(dbs), color, words
+    )
+
+    if db:
+        save_annots(dbs, id, return_list, pdf_path)
+        dbs.flush()
 
     return total_count, return_list
 
@@ -403,82 +776,268 @@ def extract_annots(id: int, color: str, pdf_path: str, db: bool = False):
 ##
 
 
-def extract_dist(pdf_path: str, term: str, id: str, db=False):
-    """Extracts the distribution of the term from the pdf file and updates the distribution table in the database
+def get_study_id(dbs, id) -> int | None:
+    """Gets the studies.id of a study, the key of its annotations and distribution rows
+
+    Args:
+        dbs (Session): Database session
+        id (int): ID, e.g. Covidence number
+
+    Returns:
+        int: studies.id, None if the study is not in the studies table
+    """
+    ensure_study_columns(dbs, [])
+    return dbs.query(Study.id).filter(Study.Covidence == id).scalar()
+
+
+def get_citation(dbs, id):
+    """Gets the citation of a study
+
+    Args:
+        dbs (Session): Database session
+        id (int): ID, e.g. Covidence number
+
+    Returns:
+        str: Citation, None if the study has none
+    """
+    return dbs.query(Study.citation).filter(Study.Covidence == id).scalar()
+
+
+def compile_terms(terms: list[str]) -> tuple[re.Pattern, list[str]]:
+    """Compiles search terms into one case insensitive pattern reporting every term at every position
+
+    Each term is a zero-width lookahead with its own group, so a match consumes
+    nothing and overlapping or nested terms, e.g. "AI" in "AI Laws" or "social
+    media" and "media use", are all found as if every term was searched on its own.
+
+    Args:
+        terms (list): Search terms, e.g. the theme terms of config.yaml
+
+    Returns:
+        re.Pattern, list: Pattern, the case folded term of each of its groups
+    """
+    # the first spelling of every case folded term, searched case insensitive
+    first = {}
+    for term in terms:
+        if term:
+            first.setdefault(term.casefold(), term)
+    # only positions where a term starts, then one optional group per term
+    gate = "|".join(re.escape(term) for term in first.values())
+    groups = "".join(f"(?=({re.escape(term)})?)" for term in first.values())
+    return re.compile(f"(?={gate}){groups}", re.IGNORECASE), list(first)
+
+
+def dists_from_hits(id: str, term: str, hits, citation: str | None):
+    """Turns the hits of a term into distribution paragraphs, one per distinct paragraph
 
     Args:
-        pdf_path (path): The full path to the pdf file
-        term (str): The term to search for in the pdf file
         id (int): Internal Study ID from the database e.g. Covidence number
-        db (bool, optional): Save to the database? - Defaults to False.
+        term (str): The searched term
+        hits (Iterable): (page, rect) of every hit, in page order
+        citation (str): Citation of the study, appended to every paragraph
 
     Returns:
-        total_count (int), return_list (list): Total count of the term found in the pdf file, and the list of the distribution of the term
+        total_count (int), return_list (list): Like find_dist()
     """
-    total_count = 0
+    seen = set()
+    counts = {}
     return_list = []
+    for page, rect in hits:
+        text = page.geometry.text(rect)
+        if text in seen:
+            continue
+        seen.add(text)
+        page_number = page.page_number
+        counts[page_number] = counts.get(page_number, 0) + 1
+        return_list.append(
+            {
+                "studies_id": id,
+                "count": counts[page_number],
+                "page_number": page_number,
+                "term": term,
+                "text": f" {text} {citation} page {page_number}.",
+            }
+        )
+    return len(return_list), return_list
 
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
-            count = 0
-            res = page.search_for(term)
-            if res != []:
-                for rect in res:
-                    text = get_pdf_text(page, rect)
-                    if any(d["text"] == text for d in return_list):
-                        continue
-                    else:
-                        page_number = page.number + 1
-                        # get citation from the database for id
-                        dbs = get_db()
-                        citation = (
-                            dbs.query(Study)
-                            .filter(Study.Covidence == id)
-                            .first()
-                            .citation
-                        )
-                        text = f" {text} {citation} page {page_number}."
-                        total_count += 1
-                        count += 1
-                        item: dict = {
-                            "studies_id": id,
-                            "count": count,
-                            "page_number": page_number,
-                            "term": term,
-                            "text": text,
-                        }
-                        return_list.append(item)
 
-    if db:
-        dbs = get_db()
-        dbs.begin()
-        dbs.query(Study).filter(Study.Covidence == id).update(
-            {Study.total_distribution: total_count}
+def find_dists(id: str, pages: list, terms: list[str], citation: str | None) -> dict:
+    """Finds the paragraphs of a pdf file that contain any of the terms, scanning every page once
+
+    Args:
+        id (int): Internal Study ID from the database e.g. Covidence number
+        pages (list): Pages from the text cache
+        terms (list): The terms to search for in the pdf file
+        citation (str): Citation of the study, appended to every paragraph
+
+    Returns:
+        dict: (total_count, return_list) of every term, like find_dist()
+    """
+    terms = [term for term in dict.fromkeys(terms) if term]
+    if not terms:
+        return {}
+    # terms differing only in case find the same hits
+    by_match = {}
+    for term in terms:
+        by_match.setdefault(term.casefold(), []).append(term)
+    pattern, keys = compile_terms(terms)
+    hits = {term: [] for term in terms}
+
+    for page in pages:
+        # end of the last hit of every term, its hits don't overlap, like page.search_for
+        ends = dict.fromkeys(keys, 0)
+        for match in pattern.finditer(page.search_text):
+            start = match.start()
+            for key, group in zip(keys, match.groups()):
+                if group is None or start < ends[key]:
+                    continue
+                ends[key] = start + len(group)
+                rect = page.span_rect(start, ends[key])
+                for term in by_match[key]:
+                    hits[term].append((page, rect))
+
+    return {
+        term: dists_from_hits(id, term, term_hits, citation)
+        for term, term_hits in hits.items()
+    }
+
+
+def find_dist(id: str, pages: list, term: str, citation: str | None):
+    """Finds the paragraphs of a pdf file that contain the term
+
+    Args:
+        id (int): Internal Study ID from the database e.g. Covidence number
+        pages (list): Pages from the text cache
+        term (str): The term to search for in the pdf file
+        citation (str): Citation of the study, appended to every paragraph
+
+    Returns:
+        total_count (int), return_list (list): Total count of the term found in the pdf file, and the list of the distribution of the term
+    """
+    hits = ((page, rect) for page in pages for rect in page.search_for(term))
+    return dists_from_hits(id, term, hits, citation)
+
+
+def save_dists(dbs, id: str, results: dict):
+    """Updates total_distribution of a study and adds the paragraphs of all terms to the distribution table
+
+    Args:
+        dbs (Session): Database session
+        id (int): Internal Study ID from the database e.g. Covidence number
+        results (dict): Result of find_dists()
+    """
+    ensure_study_columns(dbs, ["total_distribution"])
+    study_id = get_study_id(dbs, id)
+    if study_id is None:
+        logger().warning(f"Study {id} not found in the studies table, distribution not saved.")
+        return
+    dbs.query(Study).filter(Study.Covidence == id).update(
+        {Study.total_distribution: sum(total for total, _ in results.values())}
+    )
+    theme_ids = dict(
+        dbs.query(Theme.term, Theme.id).filter(Theme.term.in_(list(results))).all()
+    )
+    # (term, text) already in the distribution table, one query per study
+    existing = {
+        (row.term, row.text)
+        for row in dbs.execute(
+            select(Distribution.term, Distribution.text).where(
+                Distribution.studies_id == study_id
+            )
         )
-        study_id = dbs.query(Study).filter(Study.Covidence == id).first().id
-        theme_id = dbs.query(Theme).filter(Theme.term == term).first().id
+    }
 
+    for term, (_, return_list) in results.items():
+        if term not in theme_ids:
+            raise ValueError(f"Theme with term {term} not found, run slh-sh sync config.")
         for i in return_list:
-            # check if the text already exists in the distribution table
-            if dbs.query(Distribution).filter(Distribution.text == i["text"]).first():
+            if (term, i["text"]) in existing:
                 continue
-            else:
-                dbs.add(
-                    Distribution(
-                        studies_id=study_id,
-                        theme_id=theme_id,
-                        count=i["count"],
-                        page_number=i["page_number"],
-                        term=i["term"],
-                        text=i["text"],
-                    )
+            existing.add((term, i["text"]))
+            dbs.add(
+                Distribution(
+                    studies_id=study_id,
+                    theme_id=theme_ids[term],
+                    count=i["count"],
+                    page_number=i["page_number"],
+                    term=i["term"],
+                    text=i["text"],
                 )
-        dbs.commit()
-        dbs.close()
+            )
+
+
+def save_dist(dbs, id: str, term: str, total_count: int, return_list: list):
+    """Updates total_distribution of a study and adds its paragraphs to the distribution table
+
+    Args:
+        dbs (Session): Database session
+        id (int): Internal Study ID from the database e.g. Covidence number
+        term (str): The searched term
+        total_count (int), return_list (list): Result of find_dist()
+    """
+    save_dists(dbs, id, {term: (total_count, return_list)})
+
+
+def extract_dist(pdf_path: str, term: str, id: str, db=False):
+    """Extracts the distribution of the term from the pdf file and updates the distribution table in the database
+
+    Args:
+        pdf_path (path): The full path to the pdf file
+        term (str): The term to search for in the pdf file
+        id (int): Internal Study ID from the database e.g. Covidence number
+        db (bool, optional): Save to the database? - Defaults to False.
+
+    Returns:
+        total_count (int), return_list (list): Total count of the term found in the pdf file, and the list of the distribution of the term
+    """
+    dbs = get_db()
+    ensure_study_columns(dbs, ["citation"])
+    total_count, return_list = find_dist(
+        id, get_pages(pdf_path), term, get_citation(dbs, id)
+    )
+
+    if db:
+        save_dist(dbs, id, term, total_count, return_list)
+        dbs.flush()
 
     return total_count, return_list
 
 
+def get_theme_terms() -> list[str]:
+    """Returns the terms of the themes in config.yaml
+
+    Returns:
+        list: Theme terms
+    """
+    config = load_config()
+    if config is None:
+        return []
+    return [theme["term"] for theme in config.themes.values()]
+
+
+def extract_dists(pdf_path: str, terms: list[str], id: str, db=False):
+    """Extracts the distribution of several terms from the pdf file in one pass and updates the distribution table
+
+    Args:
+        pdf_path (path): The full path to the pdf file
+        terms (list): The terms to search for, e.g. get_theme_terms()
+        id (int): Internal Study ID from the database e.g. Covidence number
+        db (bool, optional): Save to the database? - Defaults to False.
+
+    Returns:
+        dict: (total_count, return_list) of every term
+    """
+    dbs = get_db()
+    ensure_study_columns(dbs, ["citation"])
+    results = find_dists(id, get_pages(pdf_path), terms, get_citation(dbs, id))
+
+    if db:
+        save_dists(dbs, id, results)
+        dbs.flush()
+
+    return results
+
+
 def extract_total_dist_sheet_sync():
     """Extracts the total distribution from the database and updates the Distribution Worksheet in the Google Sheet
 
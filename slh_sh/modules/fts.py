@@ -0,0 +1,163 @@
+import sqlite3 as sql
+
+from slh_sh.modules.add import ensure_study_ids
+from slh_sh.utils.sqlite import bulk_writes
+
+FTS_TOKENIZE = "porter unicode61 remove_diacritics 2"
+
+# FTS5 table, content table, indexed columns, bm25 weight of every column
+FTS_TABLES = {
+    "studies_fts": ("studies", ["title", "abstract", "keywords", "full_text"], [10.0, 5.0, 5.0, 1.0]),
+    "annotations_fts": ("annotations", ["text"], [1.0]),
+    "distribution_fts": ("distribution", ["text"], [1.0]),
+}
+
+# column of the content table holding the studies.id of the study
+STUDY_ID = {"studies": "id", "annotations": '"Study"', "distribution": "studies_id"}
+
+# tokens around a match in a snippet
+SNIPPET_TOKENS = 12
+
+
+def table_columns(conn: sql.Connection, table: str) -> list[str]:
+    """Column names of a table, empty if the table doesn't exist
+
+    Args:
+        conn (sqlite3.Connection): Database connection
+        table (str): Table name
+
+    Returns:
+        list: Column names in table order
+    """
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _fts_statements(fts: str, content: str, columns: list[str]) -> list[str]:
+    cols = ", ".join(f'"{col}"' for col in columns)
+    new = ", ".join(f'new."{col}"' for col in columns)
+    old = ", ".join(f'old."{col}"' for col in columns)
+    # external content table keyed on its INTEGER PRIMARY KEY id, which VACUUM
+    # keeps, the triggers mirror every write of the content table
+    return [
+        f"""CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{content}',
+        content_rowid='id', tokenize='{FTS_TOKENIZE}')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{content}" BEGIN
+        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{content}" BEGIN
+        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+        END""",
+        # only the indexed columns, e.g. updating total_distribution leaves the index alone
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON "{content}" BEGIN
+        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});
+        END""",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_fts(conn: sql.Connection) -> list[str]:
+    """Creates the FTS5 tables of studies, annotations and distribution and their sync triggers
+
+    A FTS5 table is created, and filled from its content table, the first time
+    the content table exists. Studies imported from a CSV file get the
+    keywords and full_text columns if they are missing, and an id column, see
+    ensure_study_ids().
+
+    Args:
+        conn (sqlite3.Connection): Connection from connect()
+
+    Returns:
+        list: Names of the FTS5 tables created by this call
+    """
+    created = []
+    with bulk_writes(conn):
+        ensure_study_ids(conn)
+        for fts, (content, columns, _) in FTS_TABLES.items():
+            if table_columns(conn, fts):
+                continue
+            existing = table_columns(conn, content)
+            if not existing:
+                continue
+            lower = {col.lower() for col in existing}
+            for col in columns:
+                if col not in lower:
+                    conn.execute(f'ALTER TABLE "{content}" ADD COLUMN "{col}" TEXT')
+            for statement in _fts_statements(fts, content, columns):
+                conn.execute(statement)
+            created.append(fts)
+    return created
+
+
+def fts_query(query: str) -> str:
+    """Turns free text into a FTS5 query, every word a quoted phrase
+
+    Used when the query is not valid FTS5 syntax, e.g. AI-based.
+
+    Args:
+        query (str): Search text
+
+    Returns:
+        str: FTS5 query matching all words
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def _search_table(conn, fts: str, query: str, idcol: str, limit: int, start: str, end: str):
+    content, _, weights = FTS_TABLES[fts]
+    study = f"c.{STUDY_ID[content]}"
+    rows = conn.execute(
+        f"""SELECT s."{idcol}", bm25({fts}, {", ".join(str(w) for w in weights)}) AS score,
+        snippet({fts}, -1, ?, ?, '...', {SNIPPET_TOKENS})
+        FROM {fts}
+        JOIN "{content}" c ON c.id = {fts}.rowid
+        LEFT JOIN studies s ON s.id = {study}
+        WHERE {fts} MATCH ?
+        ORDER BY score LIMIT ?""",
+        (start, end, query, limit),
+    )
+    return [
+        {"source": content, "ID": id, "rank": score, "snippet": snippet}
+        for id, score, snippet in rows
+    ]
+
+
+def fts_search(
+    conn: sql.Connection,
+    query: str,
+    idcol: str,
+    limit: int = 20,
+    start: str = "**",
+    end: str = "**",
+) -> list[dict]:
+    """Searches studies, annotations and distribution with FTS5, best matches of each first
+
+    BM25 scores depend on the statistics of their own FTS5 table and are not
+    comparable across tables, so the hits are grouped by source, studies, then
+    annotations, then distribution, and ranked within it.
+
+    Args:
+        conn (sqlite3.Connection): Connection from connect()
+        query (str): FTS5 query, e.g. "social media" NEAR(ai, 5), free text if it is not valid syntax
+        idcol (str): ID column of the studies, e.g. Covidence
+        limit (int, optional): Maximal number of hits per source. Defaults to 20.
+        start (str, optional): Marker before a match in the snippet. Defaults to "**".
+        end (str, optional): Marker after a match in the snippet. Defaults to "**".
+
+    Returns:
+        list: Hits with source table, ID, BM25 rank within the source (lower is better) and snippet
+    """
+    create_fts(conn)
+    tables = [fts for fts in FTS_TABLES if table_columns(conn, fts)]
+    try:
+        return [
+            hit
+            for fts in tables
+            for hit in _search_table(conn, fts, query, idcol, limit, start, end)
+        ]
+    except sql.OperationalError:
+        return [
+            hit
+            for fts in tables
+            for hit in _search_table(conn, fts, fts_query(query), idcol, limit, start, end)
+        ]
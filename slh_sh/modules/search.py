@@ -0,0 +1,420 @@
+import re
+import json
+
+from dataclasses import dataclass
+
+from sqlalchemy import delete, insert, select
+
+from slh_sh.utils.db import get_db
+from slh_sh.utils.log import logger
+from slh_sh.utils.file import get_pdf_dir
+from slh_sh.utils.textcache import (
+    get_pages,
+    prune_pdf_files,
+    read_cached_pages,
+    update_pdf_files,
+)
+from slh_sh.data.models import PdfFile, PdfPage, SearchDocument, SearchPosting, SearchTerm
+from slh_sh.modules.batch import pdf_tasks
+from slh_sh.modules.extract import dists_from_hits, get_citation, save_dists
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# words of context on each side of a hit
+SNIPPET_WORDS = 8
+
+
+@dataclass
+class SearchHit:
+    """One match of a query in the search index
+
+    Args:
+        study (str): ID, e.g. Covidence number
+        pdf_path (str): Path to the pdf file
+        page_number (int): 1 based page number
+        before (str): Words before the match
+        text (str): The matched words
+        after (str): Words after the match
+    """
+
+    study: str
+    pdf_path: str
+    page_number: int
+    before: str
+    text: str
+    after: str
+
+    @property
+    def snippet(self) -> str:
+        return " ".join(part for part in (self.before, self.text, self.after) if part)
+
+
+def tokenize_words(words: list) -> list[tuple[str, int]]:
+    """Splits the words of a page into lower case index tokens
+
+    A fitz word like "AI-based," holds several tokens, ai and based.
+
+    Args:
+        words (list): page.get_text("words") tuples of the page
+
+    Returns:
+        list: (token, word_number) of every token in page order, the position is the list index
+    """
+    return [
+        (token, word_number)
+        for word_number, word in enumerate(words)
+        for token in TOKEN_PATTERN.findall(word[4].lower())
+    ]
+
+
+def parse_query(query: str) -> list[tuple[str, bool]]:
+    """Splits a query into tokens, a word ending with * is a prefix
+
+    Args:
+        query (str): e.g. social media, or social med*
+
+    Returns:
+        list: (token, is_prefix) in query order
+    """
+    tokens = []
+    for part in query.split():
+        part_tokens = TOKEN_PATTERN.findall(part.lower())
+        tokens.extend((token, False) for token in part_tokens)
+        if part_tokens and part.endswith("*"):
+            tokens[-1] = (tokens[-1][0], True)
+    return tokens
+
+
+def create_index_tables(conn):
+    """Creates the tables of the search index if they don't exist
+
+    Args:
+        conn (Connection): Database connection
+    """
+    for model in (PdfFile, SearchDocument, SearchTerm, SearchPosting):
+        model.__table__.create(conn, checkfirst=True)
+
+
+def _term_ids(conn, vocabulary: dict, tokens: set) -> dict:
+    # adds the new tokens to the vocabulary, ids of known tokens come from memory
+    new = [{"term": token} for token in tokens if token not in vocabulary]
+    if new:
+        conn.execute(insert(SearchTerm.__table__), new)
+        table = SearchTerm.__table__
+        for i in range(0, len(new), 500):
+            batch = [row["term"] for row in new[i : i + 500]]
+            vocabulary.update(
+                conn.execute(
+                    select(table.c.term, table.c.id).where(table.c.term.in_(batch))
+                ).all()
+            )
+    return vocabulary
+
+
+def _remove_document(conn, document_id: int):
+    conn.execute(
+        delete(SearchPosting.__table__).where(
+            SearchPosting.__table__.c.document_id == document_id
+        )
+    )
+    conn.execute(
+        delete(SearchDocument.__table__).where(
+            SearchDocument.__table__.c.id == document_id
+        )
+    )
+
+
+def index_document(conn, vocabulary: dict, sha256: str, pages):
+    """Adds the postings of one pdf content to the search index
+
+    Args:
+        conn (Connection): Database connection
+        vocabulary (dict): Term to id of the known terms, updated in place
+        sha256 (str): SHA-256 of the pdf file
+        pages (list): Pages from the text cache, empty if the file could not be parsed
+    """
+    document_id = conn.execute(
+        insert(SearchDocument.__table__).values(sha256=sha256)
+    ).inserted_primary_key[0]
+
+    tokens = [(page.page_number, tokenize_words(page.words)) for page in pages]
+    _term_ids(conn, vocabulary, {token for _, page in tokens for token, _ in page})
+    postings = [
+        {
+            "term_id": vocabulary[token],
+            "document_id": document_id,
+            "page_number": page_number,
+            "position": position,
+            "word_number": word_number,
+        }
+        for page_number, page_tokens in tokens
+        for position, (token, word_number) in enumerate(page_tokens)
+    ]
+    if postings:
+        conn.execute(insert(SearchPosting.__table__), postings)
+
+
+def update_index(pdf_dir: str | None = None) -> dict[str, int]:
+    """Brings the search index up to date with the pdf files of a folder
+
+    The index is keyed by the SHA-256 of the pdf files, the pdf_files table maps
+    every ID named file to its hash. Only new and changed files (by size and
+    modification time) are hashed, and only contents not indexed yet are
+    tokenized, once for all identical files. Their pages come from the text
+    cache. Contents no file has any more are dropped from the index. A file
+    that cannot be parsed is logged and skipped until it changes.
+
+    Args:
+        pdf_dir (str, optional): Folder of the pdf files. Defaults to pdf_path from config.yaml.
+
+    Returns:
+        dict: Number of added, updated, removed, unchanged and failed pdf files, and of indexed contents
+    """
+    dbs = get_db()
+    conn = dbs.connection()
+    create_index_tables(conn)
+    counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0, "indexed": 0}
+
+    tasks = pdf_tasks(pdf_dir or get_pdf_dir())
+    files = update_pdf_files(conn, tasks)
+    documents = SearchDocument.__table__
+    indexed = set(conn.execute(select(documents.c.sha256)).scalars())
+    vocabulary = None
+    for pdf_path, (sha256, status) in files.items():
+        counts[status] += 1
+        if sha256 is None:
+            logger().error(f"Search index failed for {pdf_path}: file not readable")
+            counts["failed"] += 1
+            continue
+        if sha256 in indexed:
+            continue
+        if vocabulary is None:
+            vocabulary = dict(conn.execute(select(SearchTerm.term, SearchTerm.id)).all())
+        try:
+            pages = get_pages(pdf_path)
+        except Exception as e:
+            logger().error(f"Search index failed for {pdf_path}: {type(e).__name__}: {e}")
+            counts["failed"] += 1
+            pages = []
+        index_document(conn, vocabulary, sha256, pages)
+        indexed.add(sha256)
+        counts["indexed"] += 1
+
+    counts["removed"] = prune_pdf_files(conn, [pdf_path for _, pdf_path in tasks])
+    # contents no pdf file has any more
+    files_table = PdfFile.__table__
+    unused = select(documents.c.id).where(
+        documents.c.sha256.not_in(
+            select(files_table.c.sha256).where(files_table.c.sha256.is_not(None))
+        )
+    )
+    for (document_id,) in conn.execute(unused).all():
+        _remove_document(conn, document_id)
+
+    dbs.flush()
+    return counts
+
+
+def _match_sql(
+    tokens: list[tuple[str, bool]], near: int, study: str | None, limit: int | None = None
+):
+    # one self join of the postings per query token, every join is a primary key lookup
+    params = []
+    tables, where = [], []
+    for i, (token, prefix) in enumerate(tokens):
+        tables.append(f"search_postings p{i}")
+        if prefix:
+            where.append(
+                f"p{i}.term_id IN (SELECT id FROM search_terms WHERE term >= ? AND term < ?)"
+            )
+            params.extend([token, token[:-1] + chr(ord(token[-1]) + 1)])
+        else:
+            where.append(f"p{i}.term_id = (SELECT id FROM search_terms WHERE term = ?)")
+            params.append(token)
+        if i == 0:
+            continue
+        where.append(
+            f"p{i}.document_id = p0.document_id AND p{i}.page_number = p0.page_number"
+        )
+        if near:
+            where.append(f"p{i}.position BETWEEN p0.position - ? AND p0.position + ?")
+            params.extend([near, near])
+        else:
+            where.append(f"p{i}.position = p0.position + {i}")
+    if study is not None:
+        where.append("f.study = ?")
+        params.append(study)
+
+    words = [f"p{i}.word_number" for i in range(len(tokens))]
+    first = f"min({', '.join(words)})" if len(words) > 1 else words[0]
+    last = f"max({', '.join(words)})" if len(words) > 1 else words[0]
+    # a content is matched once, then listed for every pdf file that has it
+    sql = f"""SELECT f.study, f.pdf_path, d.sha256, p0.page_number,
+        min({first}) AS first_word, max({last}) AS last_word
+        FROM {", ".join(tables)}
+        JOIN search_documents d ON d.id = p0.document_id
+        JOIN pdf_files f ON f.sha256 = d.sha256
+        WHERE {" AND ".join(where)}
+        GROUP BY f.id, p0.page_number, p0.position
+        ORDER BY f.pdf_path, p0.page_number, p0.position"""
+    if limit:
+        # the first hits in corpus order only, sorted and cut by SQLite
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def find_matches(
+    conn, query: str, near: int = 0, study: str | None = None, limit: int | None = None
+) -> list:
+    """Finds a phrase, prefix or proximity query in the search index
+
+    Args:
+        conn (Connection): Database connection
+        query (str): Words of the query, a word ending with * matches every word it starts
+        near (int, optional): 0 for a phrase, else the words in any order within this many words of the first. Defaults to 0.
+        study (str, optional): Only the pdf files of this ID
+        limit (int, optional): Maximal number of rows. Defaults to all.
+
+    Returns:
+        list: Rows with study, pdf_path, sha256, page_number, first_word and last_word, in corpus order
+    """
+    tokens = parse_query(query)
+    if not tokens:
+        return []
+    create_index_tables(conn)
+    sql, params = _match_sql(tokens, near, study, limit)
+    return conn.exec_driver_sql(sql, tuple(params)).all()
+
+
+def search_index(query: str, near: int = 0, limit: int | None = None) -> list[SearchHit]:
+    """Searches the whole corpus and returns the matches with a snippet
+
+    Args:
+        query (str): Words of the query, see find_matches()
+        near (int, optional): Proximity in words, 0 for a phrase. Defaults to 0.
+        limit (int, optional): Maximal number of hits. Defaults to all.
+
+    Returns:
+        list: SearchHit of every match, in corpus order
+    """
+    conn = get_db().connection()
+    rows = find_matches(conn, query, near, limit=limit)
+
+    words = {}
+    table = PdfPage.__table__
+    hits = []
+    for row in rows:
+        key = (row.sha256, row.page_number)
+        if key not in words:
+            words[key] = [
+                word[4]
+                for word in json.loads(
+                    conn.execute(
+                        select(table.c.words).where(
+                            table.c.sha256 == row.sha256,
+                            table.c.page_number == row.page_number,
+                        )
+                    ).scalar_one()
+                )
+            ]
+        page_words = words[key]
+        start, end = row.first_word, row.last_word + 1
+        hits.append(
+            SearchHit(
+                study=row.study,
+                pdf_path=row.pdf_path,
+                page_number=row.page_number,
+                before=" ".join(page_words[max(0, start - SNIPPET_WORDS) : start]),
+                text=" ".join(page_words[start:end]),
+                after=" ".join(page_words[end : end + SNIPPET_WORDS]),
+            )
+        )
+    return hits
+
+
+def index_dists(terms: list[str], study: str | None = None) -> dict[str, dict]:
+    """Finds the distribution paragraphs of terms with the search index, without opening any pdf file
+
+    Unlike find_dists(), which matches any substring, a term matches whole
+    index tokens, a trailing * matches prefixes.
+
+    Args:
+        terms (list): The terms to search for
+        study (str, optional): Only the pdf files of this ID. Defaults to all indexed ones.
+
+    Returns:
+        dict: ID to the result of find_dists() of every indexed pdf file
+    """
+    dbs = get_db()
+    conn = dbs.connection()
+    create_index_tables(conn)
+    terms = [term for term in dict.fromkeys(terms) if term]
+
+    documents, files = SearchDocument.__table__, PdfFile.__table__
+    query = (
+        select(files.c.study, files.c.sha256)
+        .join(documents, documents.c.sha256 == files.c.sha256)
+        .order_by(files.c.pdf_path)
+    )
+    if study is not None:
+        query = query.where(files.c.study == study)
+    hits = {
+        row.study: {"sha256": row.sha256, "hits": {term: [] for term in terms}}
+        for row in conn.execute(query)
+    }
+
+    pages = {}
+    for term in terms:
+        for row in find_matches(conn, term, study=study):
+            if row.sha256 not in pages:
+                pages[row.sha256] = {
+                    page.page_number: page
+                    for page in read_cached_pages(conn, row.sha256) or []
+                }
+            page = pages[row.sha256].get(row.page_number)
+            if page is None:
+                continue
+            words = page.words[row.first_word : row.last_word + 1]
+            rect = (
+                min(w[0] for w in words),
+                min(w[1] for w in words),
+                max(w[2] for w in words),
+                max(w[3] for w in words),
+            )
+            hits[row.study]["hits"][term].append((page, rect))
+
+    results = {}
+    for id, document in hits.items():
+        citation = get_citation(dbs, id)
+        results[id] = {
+            term: dists_from_hits(id, term, term_hits, citation)
+            for term, term_hits in document["hits"].items()
+        }
+    return results
+
+
+def extract_index_dists(terms: list[str], id: str | None = None, db=False) -> dict[str, dict]:
+    """Extracts the distribution of terms from the search index and updates the distribution table in the database
+
+    Args:
+        terms (list): The terms to search for
+        id (str, optional): Only this ID, e.g. Covidence number. Defaults to all indexed studies.
+        db (bool, optional): Save to the database? - Defaults to False.
+
+    Returns:
+        dict: ID to the result of find_dists()
+    """
+    dbs = get_db()
+    update_index()
+    results = index_dists(terms, id)
+    if db:
+        for study, result in results.items():
+            try:
+                # a savepoint, a study missing from the database does not roll back the others
+                with dbs.begin_nested():
+                    save_dists(dbs, study, result)
+            except Exception as e:
+                logger().error(f"dist failed for {study}: {type(e).__name__}: {e}")
+        dbs.flush()
+    return results
@@ -3,13 +3,18 @@ import gspread
 
 from oauth2client.service_account import ServiceAccountCredentials
 
+from slh_sh.modules.add import normalize_headers
 from slh_sh.utils.file import get_conf, get_random_string
 from slh_sh.utils.log import logger
 from slh_sh.utils.db import get_db
+from slh_sh.utils.sqlite import connect
 from slh_sh.data.models import (
     Study,
 )
 
+# cells written per batch_update request of a column sync
+COLUMN_CHUNK_ROWS = 5000
+
 
 def gs_auth():
     """Authenticate to Google Sheet API
@@ -210,51 +215,148 @@ def sync_studies_sheet(gs):
     return new_ws.title
 
 
-def sync_studies_column_sheet(ws, idcol, sheetcol, apply=False):
-    """Sync studies table of sqlite database to Google Sheet
+def get_studies_column_values(conn, idcol, sheetcol, ids=None):
+    """Get a column of the studies table by ID in one query
+
+    The Google Sheet's column names are mapped to database columns like the
+    CSV headers on import, e.g. 'Covidence #' to Covidence.
 
     Args:
-        ws (Worksheet): Google Sheet's Worksheet
+        conn (sqlite3.Connection): Database connection
         idcol (str): Google Sheet's Worksheet's id column name
         sheetcol (str): Google Sheet's Worksheet's column name
-        apply (bool, optional): Defaults to False.
+        ids (list, optional): Only these IDs. Defaults to all studies.
 
     Returns:
-        bool: True if updated successfully, False if not
+        dict: Value of the column by ID as text, as the IDs read from Google Sheet
+    """
+    id_column, column = normalize_headers([idcol, sheetcol])
+    query = f'SELECT "{id_column}", "{column}" FROM studies WHERE "{id_column}" IS NOT NULL'
+    params = []
+    if ids is not None:
+        params = [str(id) for id in ids]
+        query += f' AND CAST("{id_column}" AS TEXT) IN ({", ".join("?" * len(params))})'
+    return {str(id): value for id, value in conn.execute(query, params)}
+
+
+def get_column_updates(id_col_values, col_values, db_values, header_row):
+    """Compare a Google Sheet's column with the database values of its studies
+
+    Args:
+        id_col_values (list): Google Sheet's Worksheet's id column values, from row 1
+        col_values (list): Google Sheet's Worksheet's updating column values, from row 1
+        db_values (dict): Database values by ID, from get_studies_column_values()
+        header_row (int): Number of the header row, the studies start below it
+
+    Returns:
+        list, dict: (row number, ID, new value) of the changed cells, and counts
+            of updated, unchanged, empty (no value in the database) and missing studies
     """
-    # select all Keywords from database where Covidence is id_col_values
-    updating_col_index_header = get_worksheet_updating_col_index_header(
-        get_worksheet_headers_row_values(ws), sheetcol
-    )
-    id_col_values = get_worksheet_id_col_index_values(ws, idcol)
-    for id_col_value in id_col_values[3:]:
-        dbs = get_db()
-        # select [idcol = covidence] from database where idcol is id_col_value
-        db_res = dbs.query(Study).filter_by(idcol=id_col_value).first()
-        # check if SELECT found any value
-        if db_res == None:
+    updates = []
+    counts = {"updated": 0, "unchanged": 0, "empty": 0, "missing": 0}
+    for row, id_col_value in enumerate(id_col_values[header_row:], start=header_row + 1):
+        id_col_value = str(id_col_value).strip()
+        if id_col_value == "":
+            continue
+        if id_col_value not in db_values:
             print(f"Study {id_col_value} not found in database!")
+            counts["missing"] += 1
             continue
-        elif db_res[0] != None:
-            if apply:
-                try:
-                    update_sheet_cell(
-                        ws,
-                        id_col_values,
-                        id_col_value,
-                        updating_col_index_header,
-                        db_res[0],
-                    )
-                    time.sleep(3)
-                except gspread.exceptions.APIError:
-                    logger().warning(
-                        f"Google API rate limit reached, or other API error, please try again later!"
-                    )
-                    return False
-                # sleep for 3 seconds to avoid Google API rate limit
-            else:
-                print(f"Would update {id_col_value} with '{db_res[0]}'")
+        new_value = db_values[id_col_value]
+        if new_value is None:
+            counts["empty"] += 1
+            continue
+        current = col_values[row - 1] if row <= len(col_values) else ""
+        if str(new_value) == current:
+            counts["unchanged"] += 1
+            continue
+        updates.append((row, id_col_value, new_value))
+        counts["updated"] += 1
+    return updates, counts
+
+
+def get_column_ranges(updates, col, chunk_rows=COLUMN_CHUNK_ROWS):
+    """Group changed cells of a column into value ranges of consecutive rows
+
+    Args:
+        updates (list): (row number, ID, new value) sorted by row, from get_column_updates()
+        col (int): Number of the column, from 1
+        chunk_rows (int, optional): Cells per request. Defaults to COLUMN_CHUNK_ROWS.
+
+    Returns:
+        list: Requests, each a list of {"range": "B4:B9", "values": [[...], ...]}
+    """
+    runs = []
+    for row, _, value in updates:
+        if runs and runs[-1][0] + len(runs[-1][1]) == row:
+            runs[-1][1].append([value])
         else:
-            print(f"Empty {sheetcol} for {id_col_value}, skipping...")
+            runs.append((row, [[value]]))
+
+    requests, request, size = [], [], 0
+    for start, values in runs:
+        for offset in range(0, len(values), chunk_rows):
+            part = values[offset : offset + chunk_rows]
+            if request and size + len(part) > chunk_rows:
+                requests.append(request)
+                request, size = [], 0
+            first = gspread.utils.rowcol_to_a1(start + offset, col)
+            last = gspread.utils.rowcol_to_a1(start + offset + len(part) - 1, col)
+            request.append({"range": f"{first}:{last}", "values": part})
+            size += len(part)
+    if request:
+        requests.append(request)
+    return requests
+
+
+def sync_studies_column_sheet(ws, idcol, sheetcol, apply=False):
+    """Sync a column of the studies table of sqlite database to Google Sheet
+
+    The column is read from the database in one query and compared with the
+    Google Sheet, only the changed cells are written, a few value ranges per
+    batch_update request instead of a request per cell.
+
+    Args:
+        ws (Worksheet): Google Sheet's Worksheet
+        idcol (str): Google Sheet's Worksheet's id column name
+        sheetcol (str): Google Sheet's Worksheet's column name
+        apply (bool, optional): Write the changes, else only print them. Defaults to False.
+
+    Returns:
+        dict or None: Counts of updated, unchanged, empty and missing studies, None on a Google API error
+    """
+    header_row = int(get_conf("gs_header_row_number"))
+    try:
+        header_row_values = ws.row_values(header_row)
+        updating_col_index_header = get_worksheet_updating_col_index_header(
+            header_row_values, sheetcol
+        )
+        id_col_values = ws.col_values(header_row_values.index(idcol) + 1)
+        col_values = ws.col_values(updating_col_index_header + 1)
+    except gspread.exceptions.APIError:
+        logger().warning(
+            "Google API rate limit reached, or other API error, please try again later!"
+        )
+        return None
 
-    return True
+    conn = connect()
+    try:
+        db_values = get_studies_column_values(conn, idcol, sheetcol)
+    finally:
+        conn.close()
+    updates, counts = get_column_updates(id_col_values, col_values, db_values, header_row)
+    if not apply:
+        for _, id_col_value, new_value in updates:
+            print(f"Would update {id_col_value} with '{new_value}'")
+        return counts
+
+    for data in get_column_ranges(updates, updating_col_index_header + 1):
+        try:
+            ws.batch_update(data, value_input_option="USER_ENTERED")
+        except gspread.exceptions.APIError:
+            logger().warning(
+                "Google API rate limit reached, or other API error, please try again later!"
+            )
+            return None
+    logger().info(f"Updated {counts['updated']} cells of {sheetcol}: {counts}")
+    return counts
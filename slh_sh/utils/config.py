@@ -2,6 +2,146 @@ import typer
 import os
 import yaml
 
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from types import MappingProxyType
+
+
+def _freeze(value):
+    # read-only views of the nested mappings and lists, a cached Config is shared by all callers
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class Config:
+    """Parsed and validated contents of config.yaml, immutable once loaded.
+
+    Keys that are not declared below are kept in `extra`. A declared key
+    missing from config.yaml has the default below. Mappings and lists,
+    e.g. themes, are read-only views.
+    """
+
+    project_name: str | None = None
+    gs_url: str | None = ""
+    gd_url: str | None = ""
+    csv_export: str | None = "studies.csv"
+    html_export: str | None = "export.html"
+    html_id_element: str | None = "study-header"
+    html_dl_class: str | None = "action-link download"
+    google_credentials: str | None = "credentials.json"
+    sqlite_db: str | None = "slh.db"
+    pdf_path: str | None = "studies_pdf"
+    gs_header_row_number: int | str | None = "3"
+    default_studies: str | None = "Studies"
+    default_id: str | None = "Covidence"
+    themes: dict = field(default_factory=dict)
+    searches: dict = field(default_factory=dict)
+    sources: dict = field(default_factory=dict)
+    sqlite_pragmas: dict = field(default_factory=dict)
+    sqlite_bulk_batch_size: int | None = None
+    import_chunk_size: int | None = None
+    theme_color_threshold: int | float | None = None
+    page_shard_threshold: int | None = None
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Config":
+        """Validates the loaded yaml and builds a Config.
+
+        Args:
+            data (dict): Contents of config.yaml
+
+        Raises:
+            ValueError: config.yaml has a value of the wrong type
+
+        Returns:
+            Config: Parsed config
+        """
+        if not isinstance(data, dict):
+            raise ValueError("config.yaml must be a mapping of keys to values.")
+        known = {f.name for f in fields(cls)} - {"extra"}
+        for key in known & data.keys():
+            value = data[key]
+            if key in ("themes", "searches", "sources", "sqlite_pragmas"):
+                if not isinstance(value, dict):
+                    raise ValueError(f"config.yaml: {key} must be a mapping.")
+            elif key == "theme_color_threshold":
+                if value is not None and not isinstance(value, (int, float)):
+                    raise ValueError(f"config.yaml: {key} must be a number.")
+            elif value is not None and not isinstance(value, (str, int)):
+                raise ValueError(f"config.yaml: {key} must be a string.")
+        for name, theme in (data.get("themes") or {}).items():
+            if not isinstance(theme, dict) or not {"hex", "term"} <= theme.keys():
+                raise ValueError(f"config.yaml: theme {name} needs a hex and a term.")
+
+        return cls(
+            **{key: _freeze(value) for key, value in data.items() if key in known},
+            extra=_freeze({key: value for key, value in data.items() if key not in known}),
+        )
+
+    def get(self, key: str):
+        """Returns the value of the given key, the default of a declared key missing from config.yaml.
+
+        Raises:
+            KeyError: The key is neither declared nor in config.yaml
+        """
+        if key in self.extra:
+            return self.extra[key]
+        if key != "extra" and key in self.__dataclass_fields__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+
+# (path, mtime_ns, size) of the parsed file and its Config
+_config_cache: tuple[tuple[str, int, int], Config] | None = None
+_config_parse_count: int = 0
+
+
+def load_config(config_path: Path | None = None) -> Config | None:
+    """Loads config.yaml once and returns the cached Config until the file changes.
+
+    Args:
+        config_path (Path, optional): Path to the config file. Defaults to config.yaml in the current directory.
+
+    Returns:
+        Config: Parsed config, or None if the file does not exist.
+    """
+    global _config_cache, _config_parse_count
+
+    if config_path is None:
+        config_path = Path.cwd() / "config.yaml"
+    try:
+        stat = os.stat(config_path)
+    except FileNotFoundError:
+        return None
+
+    key = (str(config_path), stat.st_mtime_ns, stat.st_size)
+    if _config_cache is not None and _config_cache[0] == key:
+        return _config_cache[1]
+
+    with open(config_path, "r") as f:
+        data = yaml.safe_load(f) or {}
+    _config_parse_count += 1
+
+    config = Config.from_dict(data)
+    _config_cache = (key, config)
+    return config
+
+
+def config_parse_count() -> int:
+    """Returns how many times config.yaml has been parsed by this process."""
+    return _config_parse_count
+
+
+def clear_config_cache():
+    """Drops the cached Config so the next load_config() parses the file again."""
+    global _config_cache
+    _config_cache = None
+
 
 def saveConfigFile(
     project_name, gs_url, csv_export, html_export, google_credentials, sqlite_db
@@ -1,14 +1,14 @@
-import sqlite3 as sql
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm import Mapped, mapped_column, declared_attr
+from contextlib import contextmanager
+from functools import lru_cache
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
 from sqlalchemy import DateTime
 
-
-sqlite_db_url = "sqlite:///slh.db"
+from slh_sh.utils.sqlite import apply_pragmas, get_db_path
 
 # config_data = load_config()
 Base = declarative_base()
@@ -31,19 +31,68 @@ class BaseModel(Base):
     #     return cls.__name__.lower()
 
 
+def _on_connect(dbapi_connection, connection_record):
+    # Same pragma profile as the raw sqlite3 connections of utils.sqlite.connect()
+    apply_pragmas(dbapi_connection)
+
+
+@lru_cache(maxsize=None)
+def _session_registry(db_path: str):
+    # One pooled engine and one thread-scoped session registry per database file.
+    engine = create_engine(f"sqlite:///{db_path}", pool_size=5, max_overflow=10)
+    event.listen(engine, "connect", _on_connect)
+    return engine, scoped_session(sessionmaker(bind=engine))
+
+
+def get_engine():
+    """Gets the process-wide engine of the configured database
+
+    Returns:
+        engine (Engine): pooled sqlalchemy engine
+    """
+    engine, _ = _session_registry(get_db_path())
+    return engine
+
+
 def get_db():
     """Gets the database session
 
+    The engine is created once per process and the session is scoped to the
+    current thread, every call inside a command returns the same session.
+
     Returns:
         session (any): the database session
     """
-    # create sqlalchemy engine and session
-    engine = create_engine(sqlite_db_url)
-    # db = engine.connect()
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    _, Session = _session_registry(get_db_path())
+    return Session()
+
+
+@contextmanager
+def session_scope():
+    """Runs a block of work, e.g. a whole command, in one database transaction.
 
-    return session
+    Commits when the block finishes, rolls back if it raises, and releases the
+    scoped session afterwards.
+
+    Yields:
+        session (any): the database session
+    """
+    _, Session = _session_registry(get_db_path())
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+
+
+def remove_session():
+    """Closes the session of the current thread, the next get_db() starts a new one."""
+    _, Session = _session_registry(get_db_path())
+    Session.remove()
 
 
 # def get_db_cursor():  # DEPRECATED
@@ -0,0 +1,373 @@
+import os
+import re
+import time
+import threading
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from slh_sh.utils.log import logger
+from slh_sh.utils.store import store_file
+
+DEFAULT_DOWNLOAD_WORKERS = 8
+
+# parallel downloads and seconds between two request starts, per host
+DEFAULT_PER_HOST = 2
+DEFAULT_HOST_DELAY = 1.0
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_TIMEOUT = 60
+
+# status codes worth retrying, anything else is a permanent failure
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# bytes held in memory at a time, whatever the size of the pdf file
+CHUNK_SIZE = 1 << 16
+
+PDF_SIGNATURE = b"%PDF-"
+PDF_SIGNATURE_WINDOW = 1024
+
+
+@dataclass
+class DownloadResult:
+    """Outcome of one download
+
+    Args:
+        id (str): ID, e.g. Covidence number
+        url (str): Download link
+        path (str): Target file
+        status (str): downloaded, exists or failed
+        attempts (int): HTTP requests made
+        size (int): Bytes of the file
+        error (str): Reason of the failure
+        sha256 (str): SHA-256 of the downloaded file, its name in the pdf store
+        duplicate (bool): The same file was already in the pdf store
+    """
+
+    id: str
+    url: str
+    path: str
+    status: str = "failed"
+    attempts: int = 0
+    size: int = 0
+    error: str | None = None
+    sha256: str | None = None
+    duplicate: bool = False
+
+
+@dataclass
+class DownloadReport:
+    """Results of a download run, in the order of the links
+
+    Args:
+        results (list): DownloadResult of every link
+    """
+
+    results: list[DownloadResult] = field(default_factory=list)
+
+    def by_status(self, status: str) -> list[DownloadResult]:
+        return [result for result in self.results if result.status == status]
+
+    @property
+    def downloaded(self) -> list[DownloadResult]:
+        return self.by_status("downloaded")
+
+    @property
+    def exists(self) -> list[DownloadResult]:
+        return self.by_status("exists")
+
+    @property
+    def failed(self) -> list[DownloadResult]:
+        return self.by_status("failed")
+
+    @property
+    def duplicates(self) -> list[DownloadResult]:
+        return [result for result in self.results if result.duplicate]
+
+
+class DownloadError(Exception):
+    """A download failed, retryable tells if another attempt may succeed"""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class HostLimiter:
+    """Limits the parallel requests per host and spaces out their starts
+
+    Args:
+        per_host (int): Parallel requests per host
+        delay (float): Seconds between two request starts on the same host
+    """
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST, delay: float = DEFAULT_HOST_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next_start = {}
+
+    def _slot(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[host]
+
+    def acquire(self, host: str):
+        """Waits for a free slot of the host and its next start time"""
+        self._slot(host).acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host: str):
+        self._slot(host).release()
+
+
+def make_session(workers: int = DEFAULT_DOWNLOAD_WORKERS) -> requests.Session:
+    """Creates a session whose connection pools fit the number of workers
+
+    Args:
+        workers (int, optional): Number of download threads. Defaults to DEFAULT_DOWNLOAD_WORKERS.
+
+    Returns:
+        requests.Session: Session reusing connections per host
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def retry_after(response) -> float | None:
+    """Seconds to wait from a Retry-After header, in seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def content_range_start(value: str | None) -> int | None:
+    """First byte of a Content-Range header, e.g. 100 for bytes 100-199/200"""
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", value or "")
+    return int(match.group(1)) if match else None
+
+
+def is_pdf(head: bytes) -> bool:
+    """Checks the first bytes of a file for the PDF signature, readers allow it within 1024 bytes"""
+    return PDF_SIGNATURE in head[:PDF_SIGNATURE_WINDOW]
+
+
+def read_head(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(PDF_SIGNATURE_WINDOW)
+
+
+def fetch(session: requests.Session, url: str, path: str, timeout: float = DEFAULT_TIMEOUT) -> int:
+    """Downloads a URL to a file, one attempt, streamed in chunks
+
+    The body is written to <path>.part and renamed to path once complete, a
+    .part file left by an interrupted attempt is resumed with a Range request.
+    The file must start with the PDF signature and have the announced
+    Content-Length.
+
+    Args:
+        session (requests.Session): Session from make_session()
+        url (str): Download link
+        path (str): Target file
+        timeout (float, optional): Seconds to connect and between two reads. Defaults to DEFAULT_TIMEOUT.
+
+    Raises:
+        DownloadError: Bad response status code, not a PDF, truncated body or connection error
+
+    Returns:
+        int: Bytes of the file
+    """
+    part = f"{path}.part"
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset and not is_pdf(read_head(part)):
+        os.remove(part)
+        offset = 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    try:
+        with session.get(url, stream=True, timeout=timeout, headers=headers) as response:
+            if response.status_code == 416:
+                # the .part file does not fit the current file on the server
+                os.remove(part)
+                raise DownloadError("HTTP 416, restarting the download", retryable=True)
+            if response.status_code == 206:
+                if content_range_start(response.headers.get("Content-Range")) != offset:
+                    os.remove(part)
+                    raise DownloadError("Unexpected Content-Range", retryable=True)
+            elif response.status_code == 200:
+                # the server ignored the Range header, start over
+                offset = 0
+            else:
+                raise DownloadError(
+                    f"HTTP {response.status_code}",
+                    retryable=response.status_code in RETRY_STATUS,
+                    retry_after=retry_after(response),
+                )
+
+            length = response.headers.get("Content-Length")
+            expected = offset + int(length) if length and length.isdigit() else None
+            if response.headers.get("Content-Encoding", "identity") != "identity":
+                # the length of the encoded body, not of the file
+                expected = None
+            size = offset
+            head = read_head(part) if offset else b""
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if len(head) < PDF_SIGNATURE_WINDOW:
+                        head += chunk[: PDF_SIGNATURE_WINDOW - len(head)]
+                        if len(head) >= PDF_SIGNATURE_WINDOW and not is_pdf(head):
+                            break
+                    f.write(chunk)
+                    size += len(chunk)
+    except requests.RequestException as e:
+        # the .part file is kept, the next attempt resumes it
+        raise DownloadError(f"{type(e).__name__}: {e}", retryable=True) from e
+
+    if not is_pdf(head):
+        os.remove(part)
+        content_type = response.headers.get("Content-Type", "unknown content type")
+        raise DownloadError(f"Not a PDF ({content_type})")
+    if expected is not None and size != expected:
+        raise DownloadError(f"Truncated, {size} of {expected} bytes", retryable=True)
+    os.replace(part, path)
+    return size
+
+
+def download(
+    session: requests.Session,
+    limiter: HostLimiter,
+    id: str,
+    url: str,
+    path: str,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> DownloadResult:
+    """Downloads one link, retrying with exponential backoff
+
+    A downloaded file is added to the pdf store of its folder, a file already
+    in it is reported as a duplicate and kept as its own copy.
+
+    Args:
+        session (requests.Session): Session from make_session()
+        limiter (HostLimiter): Per host limits shared by all downloads
+        id (str): ID, e.g. Covidence number
+        url (str): Download link
+        path (str): Target file, skipped if it exists
+        retries (int, optional): Attempts after the first one. Defaults to DEFAULT_RETRIES.
+        backoff (float, optional): Seconds before the first retry, doubled for every next one. Defaults to DEFAULT_BACKOFF.
+        timeout (float, optional): Seconds to connect and between two reads. Defaults to DEFAULT_TIMEOUT.
+
+    Returns:
+        DownloadResult: The outcome, a failure is returned, not raised
+    """
+    result = DownloadResult(str(id), url, str(path))
+    if os.path.exists(path):
+        result.status = "exists"
+        return result
+
+    host = urlsplit(url).netloc
+    for attempt in range(retries + 1):
+        result.attempts += 1
+        limiter.acquire(host)
+        try:
+            result.size = fetch(session, url, path, timeout)
+            result.status, result.error = "downloaded", None
+            break
+        except DownloadError as e:
+            result.error = str(e)
+            if not e.retryable or attempt == retries:
+                break
+            wait = backoff * 2**attempt
+            if e.retry_after is not None:
+                wait = max(wait, e.retry_after)
+        except OSError as e:
+            result.error = f"{type(e).__name__}: {e}"
+            break
+        finally:
+            limiter.release(host)
+        time.sleep(wait)
+
+    if result.status == "downloaded":
+        try:
+            stored = store_file(os.path.dirname(path) or ".", path)
+            result.sha256, result.duplicate = stored.sha256, stored.status == "duplicate"
+        except OSError as e:
+            # the file is downloaded, only not deduplicated
+            logger().warning(f"{path} not added to the pdf store: {e}")
+    return result
+
+
+def download_all(
+    links: Iterable[tuple[str, str]],
+    pdf_dir: str,
+    workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    per_host: int = DEFAULT_PER_HOST,
+    delay: float = DEFAULT_HOST_DELAY,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    timeout: float = DEFAULT_TIMEOUT,
+    on_result: Callable[[DownloadResult], None] | None = None,
+) -> DownloadReport:
+    """Downloads PDFs in a thread pool, with per host limits and retries
+
+    Downloads start as soon as the links come in, a failing link is reported
+    and the others go on.
+
+    Args:
+        links (Iterable): (ID, URL) pairs, may be a generator
+        pdf_dir (str): Folder of the pdf files, saved as <ID>.pdf
+        workers (int, optional): Download threads. Defaults to DEFAULT_DOWNLOAD_WORKERS.
+        per_host (int, optional): Parallel downloads per host. Defaults to DEFAULT_PER_HOST.
+        delay (float, optional): Seconds between two request starts on the same host. Defaults to DEFAULT_HOST_DELAY.
+        retries (int, optional): Attempts after the first one. Defaults to DEFAULT_RETRIES.
+        backoff (float, optional): Seconds before the first retry, doubled for every next one. Defaults to DEFAULT_BACKOFF.
+        timeout (float, optional): Seconds to connect and between two reads. Defaults to DEFAULT_TIMEOUT.
+        on_result (Callable, optional): Called with every DownloadResult as it finishes
+
+    Returns:
+        DownloadReport: Results in the order of the links
+    """
+    limiter = HostLimiter(per_host, delay)
+    futures = []
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        for id, url in links:
+            future = executor.submit(
+                download,
+                session,
+                limiter,
+                id,
+                url,
+                os.path.join(pdf_dir, f"{id}.pdf"),
+                retries,
+                backoff,
+                timeout,
+            )
+            if on_result is not None:
+                future.add_done_callback(lambda f: on_result(f.result()))
+            futures.append(future)
+    return DownloadReport([future.result() for future in futures])
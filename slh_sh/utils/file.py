@@ -1,28 +1,84 @@
 import os
-import yaml
+import csv
+import json
+import time
 import random
 import string
 
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
+from typing import Iterator
+
+from slh_sh.utils.config import load_config
+
+DEFAULT_IMPORT_CHUNK_SIZE = 5000
+
+# ID to pdf file index, in the project folder so writing it leaves the pdf folder's mtime alone
+PDF_INDEX_FILE = ".slh_pdf_index.json"
+
+# bumped when the IDs of the file names change, an index of another version is scanned again
+PDF_INDEX_VERSION = 2
+
+# a folder changed this recently may still change within its mtime resolution, e.g. on a network share
+PDF_INDEX_SETTLE_SECONDS = 2
 
 
 def get_conf(key: str) -> str:
     """Returns the value of the given key in the config file.
 
+    The file is parsed once per process and re-parsed only when its mtime or size changes.
+
     Args:
         key (str): Key in the config file.
 
     Returns:
         str: Value of the given key.
     """
-    config_path = Path.cwd() / "config.yaml"
-    if config_path.exists():
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)
-    else:
+    config = load_config()
+    if config is None:
         return "config.yaml file does not exist."
 
-    return config[key]
+    return config.get(key)
+
+
+def get_import_chunk_size() -> int:
+    """Returns the number of CSV rows read and written at a time by imports.
+
+    Returns:
+        int: import_chunk_size from the config file, or DEFAULT_IMPORT_CHUNK_SIZE.
+    """
+    config = load_config()
+    if config is not None and config.import_chunk_size:
+        return int(config.import_chunk_size)
+    return DEFAULT_IMPORT_CHUNK_SIZE
+
+
+def read_csv_chunks(
+    csv_path: str, chunk_size: int | None = None
+) -> tuple[list[str], Iterator[list[tuple]]]:
+    """Reads a CSV file lazily, a fixed number of rows at a time.
+
+    Only one chunk is held in memory, the file stays open until the chunks are consumed.
+
+    Args:
+        csv_path (str): Path to the CSV file.
+        chunk_size (int, optional): Rows per chunk. Defaults to get_import_chunk_size().
+
+    Returns:
+        list[str], Iterator[list[tuple]]: The header row and an iterator over chunks of rows.
+    """
+    chunk_size = chunk_size or get_import_chunk_size()
+    f = open(csv_path, "r", newline="")
+    reader = csv.reader(f)
+    headers = next(reader, [])
+
+    def chunks():
+        with f:
+            while chunk := [tuple(row) for row in islice(reader, chunk_size)]:
+                yield chunk
+
+    return headers, chunks()
 
 
 def get_pdf_dir() -> str:
@@ -34,22 +90,153 @@ def get_pdf_dir() -> str:
     return Path.cwd() / get_conf("pdf_path")
 
 
+def pdf_file_id(file_name: str) -> str:
+    """Returns the ID of a pdf file name, the part before the first _ or the extension, without #
+
+    Args:
+        file_name (str): e.g. #123_Smith_2020.pdf or 123.pdf, as written by extract dl
+
+    Returns:
+        str: e.g. 123
+    """
+    return os.path.splitext(file_name)[0].split("_")[0].lstrip("#")
+
+
+@dataclass(frozen=True)
+class PdfIndex:
+    """ID to file names of the pdf files of a folder, from one directory scan
+
+    Args:
+        pdf_dir (str): The pdf folder
+        mtime_ns (int): Modification time of the folder when it was scanned
+        files (dict): ID to the sorted file names with that ID
+    """
+
+    pdf_dir: str
+    mtime_ns: int
+    files: dict[str, list[str]] = field(default_factory=dict)
+
+    def get(self, id) -> str | None:
+        """Path of the pdf file of an ID, the first by file name if there are duplicates"""
+        names = self.files.get(str(id))
+        return os.path.join(self.pdf_dir, names[0]) if names else None
+
+    @property
+    def duplicates(self) -> dict[str, list[str]]:
+        """IDs with more than one pdf file"""
+        return {id: names for id, names in self.files.items() if len(names) > 1}
+
+    def orphans(self, ids) -> list[str]:
+        """File names whose ID is not one of the given study IDs
+
+        Args:
+            ids (Iterable): IDs of the studies, e.g. from the studies table
+
+        Returns:
+            list: Sorted file names
+        """
+        ids = {str(id) for id in ids}
+        return sorted(
+            name for id, names in self.files.items() if id not in ids for name in names
+        )
+
+
+def scan_pdf_dir(pdf_dir) -> PdfIndex:
+    """Builds the ID index of a pdf folder in one directory scan
+
+    Args:
+        pdf_dir (str): The pdf folder
+
+    Returns:
+        PdfIndex: The index
+    """
+    mtime_ns = os.stat(pdf_dir).st_mtime_ns
+    files = {}
+    with os.scandir(pdf_dir) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(".pdf") and not entry.name.startswith("."):
+                files.setdefault(pdf_file_id(entry.name), []).append(entry.name)
+    for names in files.values():
+        names.sort()
+    return PdfIndex(str(pdf_dir), mtime_ns, files)
+
+
+_pdf_indexes: dict[str, PdfIndex] = {}
+
+
+def _read_pdf_index(pdf_dir: str, mtime_ns: int) -> PdfIndex | None:
+    try:
+        with open(Path.cwd() / PDF_INDEX_FILE, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        data.get("version") != PDF_INDEX_VERSION
+        or data.get("pdf_dir") != pdf_dir
+        or data.get("mtime_ns") != mtime_ns
+    ):
+        return None
+    return PdfIndex(pdf_dir, mtime_ns, data["files"])
+
+
+def _write_pdf_index(index: PdfIndex):
+    path = Path.cwd() / PDF_INDEX_FILE
+    tmp = path.with_suffix(".tmp")
+    try:
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "version": PDF_INDEX_VERSION,
+                    "pdf_dir": index.pdf_dir,
+                    "mtime_ns": index.mtime_ns,
+                    "files": index.files,
+                },
+                f,
+            )
+        os.replace(tmp, path)
+    except OSError:
+        # a read-only project folder only loses the persisted copy
+        pass
+
+
+def load_pdf_index(pdf_dir=None) -> PdfIndex:
+    """Returns the ID index of the pdf folder, scanning it only if it changed
+
+    The index is kept in memory for the process and persisted in
+    PDF_INDEX_FILE, both are valid as long as the folder's mtime is unchanged,
+    i.e. no file was added, removed or renamed.
+
+    Args:
+        pdf_dir (str, optional): The pdf folder. Defaults to get_pdf_dir().
+
+    Returns:
+        PdfIndex: The index
+    """
+    pdf_dir = str(pdf_dir or get_pdf_dir())
+    mtime_ns = os.stat(pdf_dir).st_mtime_ns
+    index = _pdf_indexes.get(pdf_dir)
+    if index is None or index.mtime_ns != mtime_ns:
+        index = _read_pdf_index(pdf_dir, mtime_ns)
+    if index is None:
+        index = scan_pdf_dir(pdf_dir)
+        if time.time_ns() - index.mtime_ns > PDF_INDEX_SETTLE_SECONDS * 1e9:
+            _write_pdf_index(index)
+        else:
+            # scanned again next time, a change in the same mtime tick would be missed
+            return index
+    _pdf_indexes[pdf_dir] = index
+    return index
+
+
 def get_file_path(id):
     """Return the file path for the given covidence number.
 
+    Looked up in the ID index of the pdf folder, see load_pdf_index().
+
     Args:
         id: ID column of the study specified in the config file and exists in the file name.
     """
-    pdf_dir = get_pdf_dir()
-    pdf_path = None
-    pdf_id = None
-
-    for file_name in os.listdir(pdf_dir):
-        pdf_id: str = file_name.split("_")[0].replace("#", "")
-        if pdf_id == str(id):
-            pdf_path = os.path.join(pdf_dir, file_name)
-
-    return pdf_path
+    return load_pdf_index().get(id)
 
 
 def file_name_generator(id: str, authors: str, year: str) -> list[str]:
@@ -0,0 +1,122 @@
+import re
+
+from collections import deque
+from html.parser import HTMLParser
+from typing import Iterator
+
+from slh_sh.utils.log import logger
+
+# characters of the HTML export read and parsed at a time
+HTML_CHUNK_SIZE = 1 << 16
+
+# elements without an end tag, never pushed on the element stack
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+STUDY_ID_PATTERN = re.compile(r"#(\d+)")
+
+
+class DownloadLinkParser(HTMLParser):
+    """Finds the study headers of a Covidence HTML export and their download links, without building a tree
+
+    A study header is a div with the classes of html_id_element, its ID is the
+    first #<number> of its text. Its download link is the href of the first a
+    with the classes of html_dl_class inside the header's parent element.
+    Every (ID, URL) pair is put in found as soon as both are known, the caller
+    drains it between two feed() calls.
+
+    Args:
+        html_id_element (str): Classes of the div containing the ID, space separated
+        html_dl_class (str): Classes of the a element containing the URL, space separated
+    """
+
+    def __init__(self, html_id_element: str, html_dl_class: str):
+        super().__init__(convert_charrefs=True)
+        self.html_id_element = html_id_element
+        self.html_dl_class = html_dl_class
+        # "action-link download" matches elements with both classes, as BeautifulSoup's class_
+        self._id_classes = set(html_id_element.split())
+        self._dl_classes = set(html_dl_class.split())
+        self.found = deque()
+        # open elements as [tag, first download link inside, IDs of child headers waiting for one, is a header]
+        self._stack = []
+        # text of the study headers being read, innermost last
+        self._headers = []
+
+    def _classes(self, attrs) -> set[str]:
+        return set(next((value or "" for name, value in attrs if name == "class"), "").split())
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a" and self._dl_classes <= self._classes(attrs):
+            href = next((value for name, value in attrs if name == "href"), None)
+            # the first link of an element is the first link of all its ancestors too
+            for frame in reversed(self._stack):
+                if frame[1] is not None:
+                    break
+                frame[1] = href
+                for id in frame[2]:
+                    self.found.append((id, href))
+                frame[2].clear()
+        if tag in VOID_ELEMENTS:
+            return
+        header = tag == "div" and self._id_classes <= self._classes(attrs)
+        self._stack.append([tag, None, [], header])
+        if header:
+            self._headers.append([])
+
+    def handle_data(self, data):
+        for text in self._headers:
+            text.append(data)
+
+    def handle_endtag(self, tag):
+        # unclosed elements inside are closed with it, a stray end tag is ignored
+        if not any(frame[0] == tag for frame in self._stack):
+            return
+        while self._stack:
+            frame = self._stack.pop()
+            if frame[2]:
+                logger().warning(f"No download link found for the studies {frame[2]}")
+            if frame[3]:
+                self._end_header()
+            if frame[0] == tag:
+                return
+
+    def _end_header(self):
+        match = STUDY_ID_PATTERN.search("".join(self._headers.pop()))
+        if match is None or not self._stack:
+            return
+        parent = self._stack[-1]
+        if parent[1] is not None:
+            self.found.append((match.group(1), parent[1]))
+        else:
+            parent[2].append(match.group(1))
+
+
+def iter_download_links(
+    html: str, html_id_element: str, html_dl_class: str, chunk_size: int = HTML_CHUNK_SIZE
+) -> Iterator[tuple[str, str]]:
+    """Streams the (ID, URL) pairs of a Covidence HTML export
+
+    The file is read and parsed a chunk at a time, a pair is yielded as soon
+    as it is complete, so downloads start before the end of the file is read.
+
+    Args:
+        html (str): Path to the HTML export
+        html_id_element (str): Class of the div containing the ID
+        html_dl_class (str): Class of the a element containing the URL
+        chunk_size (int, optional): Characters read at a time. Defaults to HTML_CHUNK_SIZE.
+
+    Yields:
+        tuple: (ID, URL) of every study header, as soon as both are parsed
+    """
+    parser = DownloadLinkParser(html_id_element, html_dl_class)
+    with open(html, "r") as f:
+        while chunk := f.read(chunk_size):
+            parser.feed(chunk)
+            while parser.found:
+                yield parser.found.popleft()
+    parser.close()
+    while parser.found:
+        yield parser.found.popleft()
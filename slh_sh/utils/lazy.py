@@ -0,0 +1,100 @@
+import importlib
+
+from typing import NamedTuple
+
+import typer
+
+from typer.core import TyperCommand, TyperGroup
+
+
+class LazyCommand(NamedTuple):
+    """A command that is imported only when it is invoked.
+
+    Args:
+        module (str): Module holding a Typer `app`, e.g. slh_sh.commands.extract
+        command (str): Name of the command in the module's app, None to mount the whole app as a group
+        help (str): Help text shown in `slh-sh --help` without importing the module
+        rich_help_panel (str): Panel the command is listed under in `slh-sh --help`
+    """
+
+    module: str
+    command: str | None = None
+    help: str | None = None
+    rich_help_panel: str | None = None
+
+
+def load_command(name: str, spec: LazyCommand, rich_markup_mode=None):
+    """Imports the module of a lazy command and returns its click command.
+
+    Args:
+        name (str): Name the command is registered under
+        spec (LazyCommand): Registry entry of the command
+        rich_markup_mode (str, optional): Markup mode inherited from the parent app
+
+    Returns:
+        Command: click command or group ready to be invoked
+    """
+    module = importlib.import_module(spec.module)
+    if spec.command is None:
+        cmd = typer.main.get_group(module.app)
+    else:
+        cmd = typer.main.get_command(module.app)
+        if isinstance(cmd, TyperGroup):
+            cmd = cmd.commands[spec.command]
+    cmd.name = name
+    cmd.rich_help_panel = spec.rich_help_panel
+    _set_markup_mode(cmd, rich_markup_mode)
+    return cmd
+
+
+def _set_markup_mode(cmd, rich_markup_mode):
+    if isinstance(cmd, (TyperCommand, TyperGroup)):
+        cmd.rich_markup_mode = rich_markup_mode
+    if isinstance(cmd, TyperGroup):
+        for sub_cmd in cmd.commands.values():
+            _set_markup_mode(sub_cmd, rich_markup_mode)
+
+
+class LazyGroup(TyperGroup):
+    """Typer group that lists the commands of `lazy_commands` without importing them.
+
+    Listing (help and shell completion) uses placeholders built from the registry,
+    the real command is imported when it is resolved for invocation.
+    """
+
+    lazy_commands: dict[str, LazyCommand] = {}
+
+    def list_commands(self, ctx):
+        commands = super().list_commands(ctx)
+        return commands + [name for name in self.lazy_commands if name not in commands]
+
+    def get_command(self, ctx, cmd_name):
+        cmd = super().get_command(ctx, cmd_name)
+        if cmd is None and cmd_name in self.lazy_commands:
+            spec = self.lazy_commands[cmd_name]
+            return TyperCommand(
+                name=cmd_name,
+                help=spec.help,
+                rich_help_panel=spec.rich_help_panel,
+            )
+        return cmd
+
+    def resolve_command(self, ctx, args):
+        if args and args[0] in self.lazy_commands and args[0] not in self.commands:
+            self.load(args[0])
+        return super().resolve_command(ctx, args)
+
+    def load(self, cmd_name):
+        """Imports and registers the lazy command with the given name.
+
+        Args:
+            cmd_name (str): Name of the registered command
+
+        Returns:
+            Command: The loaded click command
+        """
+        cmd = load_command(
+            cmd_name, self.lazy_commands[cmd_name], self.rich_markup_mode
+        )
+        self.add_command(cmd, cmd_name)
+        return cmd
@@ -1,5 +1,5 @@
-import fitz
 import math
+import numpy as np
 
 from itertools import groupby
 
@@ -11,14 +11,118 @@ def get_pdf_text(page, rect):
         page (fitz.page): the associated page.
         rect (fitz.Rect): rectangular highlighted area.
     """
-    words = page.get_text("blocks")  # list of words on page
-    words.sort(key=lambda w: (w[3], w[0]))  # ascending y, then x
-    mywords = [w for w in words if fitz.Rect(w[:4]).intersects(rect)]
-    group = groupby(mywords, key=lambda w: w[3])
-    for y1, gwords in group:
-        pdf_text = " ".join(w[4] for w in gwords)
-        pdf_text = pdf_text.replace("\n", " ").strip()
-        return pdf_text
+    return PageGeometry(page.get_text("blocks")).text(rect)
+
+
+def get_blocks_text(blocks, rect):
+    """Return text of the blocks in the given rectangular highlighted area.
+
+    Args:
+        blocks (list): blocks of the page, from page.get_text("blocks") or the text cache.
+        rect (fitz.Rect | tuple): rectangular highlighted area.
+    """
+    return PageGeometry(blocks).text(rect)
+
+
+class PageGeometry:
+    """Blocks of a page sorted once and indexed on y, for many rect to text lookups.
+
+    The page is cut in horizontal bands of cell_height points, each band lists the
+    blocks that cross it, so a lookup only tests the blocks in the bands of the rect
+    instead of every block of the page.
+
+    Args:
+        blocks (list): blocks of the page, from page.get_text("blocks") or the text cache.
+        cell_height (float, optional): height of a band in points. Defaults to 50.
+    """
+
+    def __init__(self, blocks, cell_height=50.0):
+        self.cell_height = cell_height
+        self.blocks = sorted(blocks, key=lambda w: (w[3], w[0]))  # ascending y, then x
+        self.grid = {}
+        for index, block in enumerate(self.blocks):
+            for cell in self._cells(block[1], block[3]):
+                self.grid.setdefault(cell, []).append(index)
+
+    def _cells(self, y0, y1):
+        return range(
+            math.floor(y0 / self.cell_height), math.floor(y1 / self.cell_height) + 1
+        )
+
+    def lookup(self, rect):
+        """Return the blocks intersecting the rect, in ascending y, then x order.
+
+        Args:
+            rect (fitz.Rect | tuple): rectangular area.
+        """
+        x0, y0, x1, y1 = tuple(rect)[:4]
+        if x0 >= x1 or y0 >= y1:  # empty rect, like fitz.Rect.intersects
+            return []
+        candidates = set()
+        for cell in self._cells(y0, y1):
+            candidates.update(self.grid.get(cell, ()))
+        return [
+            self.blocks[index]
+            for index in sorted(candidates)
+            if self.blocks[index][0] < x1
+            and x0 < self.blocks[index][2]
+            and self.blocks[index][1] < y1
+            and y0 < self.blocks[index][3]
+        ]
+
+    def text(self, rect):
+        """Return text containted in the given rectangular highlighted area.
+
+        Args:
+            rect (fitz.Rect | tuple): rectangular highlighted area.
+        """
+        group = groupby(self.lookup(rect), key=lambda w: w[3])
+        for y1, gwords in group:
+            pdf_text = " ".join(w[4] for w in gwords)
+            pdf_text = pdf_text.replace("\n", " ").strip()
+            return pdf_text
+
+
+class PageWords:
+    """Words of a page as NumPy arrays, for exact highlight text from quad points.
+
+    Args:
+        words (list): words of the page, from page.get_text("words") or the text cache.
+    """
+
+    def __init__(self, words):
+        self.words = [w[4] for w in words]
+        self.boxes = np.array([w[:4] for w in words], dtype=float).reshape(-1, 4)
+
+    def text(self, vertices, min_overlap=0.5):
+        """Return the words covered by the quads of a highlight, in reading order.
+
+        Every 4 vertices (annot.vertices) are one quad, usually one per highlighted
+        line. A word is highlighted when at least min_overlap of its box is covered
+        by a quad, all words are tested against all quads at once.
+
+        Args:
+            vertices (list): quad points of the annotation, (x, y) tuples.
+            min_overlap (float, optional): covered share of a word box. Defaults to 0.5.
+        """
+        if not self.words or len(vertices) < 4:
+            return ""
+        points = np.array(vertices, dtype=float)[: len(vertices) // 4 * 4]
+        quads = points.reshape(-1, 4, 2)
+        # bounding box of every quad, shape (quads, 4)
+        quad_boxes = np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1)
+
+        words = self.boxes[:, None, :]  # (words, 1, 4) against (quads, 4)
+        width = np.minimum(words[..., 2], quad_boxes[:, 2]) - np.maximum(
+            words[..., 0], quad_boxes[:, 0]
+        )
+        height = np.minimum(words[..., 3], quad_boxes[:, 3]) - np.maximum(
+            words[..., 1], quad_boxes[:, 1]
+        )
+        covered = width.clip(0) * height.clip(0)
+        area = (self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1])
+        hit = (covered >= min_overlap * area[:, None]).any(axis=1) & (area > 0)
+        return " ".join(self.words[i] for i in np.flatnonzero(hit))
 
 
 def rgb_to_hex(rgb):
@@ -87,3 +191,105 @@ def is_color_close(rgb_color, hex_color, threshold=50):
 
     # Return True if the distance is less than or equal to the threshold.
     return distance <= threshold
+
+
+# CIE76 distance in CIELAB, about 2.3 is a just noticeable difference, the
+# same highlight colour differs by far more than that between PDF viewers
+DEFAULT_THEME_COLOR_THRESHOLD = 25.0
+
+
+def rgb_to_lab(rgb):
+    """
+    Converts sRGB colors to CIELAB (D65), vectorised over any number of colors.
+
+    Args:
+        rgb: An array of shape (..., 3) with the red, green, and blue components in the range [0, 1].
+
+    Returns:
+        An array of shape (..., 3) with the L*, a* and b* components.
+    """
+
+    rgb = np.asarray(rgb, dtype=float)
+    # sRGB to linear light
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array(
+        [
+            [0.4124564, 0.2126729, 0.0193339],
+            [0.3575761, 0.7151522, 0.1191920],
+            [0.1804375, 0.0721750, 0.9503041],
+        ]
+    )
+    xyz = xyz / np.array([0.95047, 1.0, 1.08883])  # D65 white point
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack(
+        [
+            116 * f[..., 1] - 16,
+            500 * (f[..., 0] - f[..., 1]),
+            200 * (f[..., 1] - f[..., 2]),
+        ],
+        axis=-1,
+    )
+
+
+class ThemeClassifier:
+    """Maps highlight colors to the nearest theme color in CIELAB.
+
+    The theme colors are converted once, each distinct highlight color is
+    classified once and remembered.
+
+    Args:
+        themes (list): Themes with a hex attribute, e.g. rows of the themes table.
+        threshold (float, optional): Largest CIELAB distance to still match a theme. Defaults to DEFAULT_THEME_COLOR_THRESHOLD.
+    """
+
+    def __init__(self, themes, threshold=DEFAULT_THEME_COLOR_THRESHOLD):
+        self.themes = list(themes)
+        self.threshold = threshold
+        self.lab = rgb_to_lab(
+            np.array([hex_to_rgb(theme.hex) for theme in self.themes], dtype=float).reshape(-1, 3)
+            / 255
+        )
+        self._memo = {}
+
+    def classify(self, rgb_color):
+        """
+        Returns the theme of a highlight color.
+
+        Args:
+            rgb_color: A tuple of 3 floats in the range [0, 1], e.g. annot.colors["stroke"].
+
+        Returns:
+            The nearest theme, or None if no theme is within the threshold.
+        """
+        return self.classify_many([rgb_color])[0]
+
+    def classify_many(self, rgb_colors):
+        """
+        Returns the themes of many highlight colors, with one distance computation for the new ones.
+
+        Args:
+            rgb_colors: Tuples of 3 floats in the range [0, 1].
+
+        Returns:
+            A list with the nearest theme or None for each color.
+        """
+        keys = [tuple(int(color * 255) for color in rgb) for rgb in rgb_colors]
+        new = list(dict.fromkeys(key for key in keys if key not in self._memo))
+        if new:
+            if self.themes:
+                # (new colors, themes) distance matrix
+                distances = np.linalg.norm(
+                    rgb_to_lab(np.array(new, dtype=float) / 255)[:, None, :]
+                    - self.lab[None, :, :],
+                    axis=-1,
+                )
+                nearest = distances.argmin(axis=1)
+                for key, index, distance in zip(
+                    new, nearest, distances[np.arange(len(new)), nearest]
+                ):
+                    self._memo[key] = (
+                        self.themes[index] if distance <= self.threshold else None
+                    )
+            else:
+                self._memo.update(dict.fromkeys(new))
+        return [self._memo[key] for key in keys]
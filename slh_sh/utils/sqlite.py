@@ -0,0 +1,143 @@
+import os
+import re
+import sqlite3 as sql
+
+from contextlib import contextmanager
+from itertools import islice
+
+from slh_sh.utils.config import load_config
+
+# Tuning profile applied to every connection, override in config.yaml with e.g.
+#
+# sqlite_pragmas:
+#     mmap_size: 0
+#     busy_timeout: 30000
+DEFAULT_PRAGMAS: dict[str, str | int] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,  # 256 MB
+    "cache_size": -65536,  # 64 MB, negative values are KiB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # ms
+}
+
+DEFAULT_BULK_BATCH_SIZE = 10000
+
+_pragma_value = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+
+def get_db_path() -> str:
+    """Returns the absolute path of the configured sqlite_db.
+
+    Returns:
+        str: Path to the SQLite database file, slh.db if config.yaml does not set one
+    """
+    config = load_config()
+    sqlite_db = config.sqlite_db if config is not None and config.sqlite_db else "slh.db"
+    return os.path.abspath(sqlite_db)
+
+
+def get_pragmas() -> dict[str, str | int]:
+    """Returns the pragma profile, DEFAULT_PRAGMAS updated with sqlite_pragmas from config.yaml.
+
+    Raises:
+        ValueError: Unknown pragma or invalid value in config.yaml
+
+    Returns:
+        dict: Pragma names and values
+    """
+    pragmas = dict(DEFAULT_PRAGMAS)
+    config = load_config()
+    if config is not None:
+        for name, value in config.sqlite_pragmas.items():
+            if name not in DEFAULT_PRAGMAS:
+                raise ValueError(f"config.yaml: unknown sqlite pragma {name}.")
+            if not _pragma_value.match(str(value)):
+                raise ValueError(f"config.yaml: invalid value for sqlite pragma {name}.")
+            pragmas[name] = value
+    return pragmas
+
+
+def get_bulk_batch_size() -> int:
+    """Returns the number of rows written per statement batch in bulk mode."""
+    config = load_config()
+    if config is not None and config.sqlite_bulk_batch_size:
+        return int(config.sqlite_bulk_batch_size)
+    return DEFAULT_BULK_BATCH_SIZE
+
+
+def apply_pragmas(conn, pragmas: dict | None = None):
+    """Applies the pragma profile to a DBAPI sqlite3 connection.
+
+    Args:
+        conn (sqlite3.Connection): Connection, raw or the one wrapped by sqlalchemy
+        pragmas (dict, optional): Pragmas to apply. Defaults to get_pragmas().
+    """
+    if pragmas is None:
+        pragmas = get_pragmas()
+    cursor = conn.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def connect(db_path: str | None = None) -> sql.Connection:
+    """Opens a sqlite3 connection to the configured database with the pragma profile applied.
+
+    Args:
+        db_path (str, optional): Path to the database. Defaults to sqlite_db from config.yaml.
+
+    Returns:
+        sqlite3.Connection: The tuned connection
+    """
+    pragmas = get_pragmas()
+    conn = sql.connect(
+        db_path or get_db_path(), timeout=int(pragmas["busy_timeout"]) / 1000
+    )
+    apply_pragmas(conn, pragmas)
+    return conn
+
+
+@contextmanager
+def bulk_writes(conn: sql.Connection):
+    """Groups all writes of the block into one transaction.
+
+    Commits once at the end of the block, or rolls everything back if it raises,
+    instead of paying a commit (and an fsync) per row.
+
+    Args:
+        conn (sqlite3.Connection): Connection from connect()
+
+    Yields:
+        sqlite3.Connection: The same connection
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def bulk_execute(conn: sql.Connection, statement: str, rows, batch_size=None) -> int:
+    """Runs executemany over rows in batches, all inside one transaction.
+
+    Args:
+        conn (sqlite3.Connection): Connection from connect()
+        statement (str): INSERT/UPDATE statement with placeholders
+        rows (Iterable): Parameters of each row, may be a generator
+        batch_size (int, optional): Rows per executemany. Defaults to get_bulk_batch_size().
+
+    Returns:
+        int: Number of rows written
+    """
+    batch_size = batch_size or get_bulk_batch_size()
+    rows = iter(rows)
+    written = 0
+    with bulk_writes(conn):
+        while batch := list(islice(rows, batch_size)):
+            conn.executemany(statement, batch)
+            written += len(batch)
+    return written
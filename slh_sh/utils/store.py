@@ -0,0 +1,207 @@
+import os
+import hashlib
+
+from dataclasses import dataclass, field
+
+# content-addressed blobs inside pdf_path, .store/<sha[:2]>/<sha>.pdf
+STORE_DIR = ".store"
+
+# hashes kept in memory, keyed by inode so hardlinked ID files are hashed once
+_MAX_HASHES = 4096
+_hashes: dict[tuple, str] = {}
+
+
+def file_sha256(pdf_path: str) -> str:
+    """SHA-256 of a file, memoised per inode, modification time and size
+
+    Args:
+        pdf_path (str): Path to the pdf file
+
+    Returns:
+        str: Hex digest
+    """
+    stat = os.stat(pdf_path)
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if key not in _hashes:
+        if len(_hashes) >= _MAX_HASHES:
+            _hashes.clear()
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+def blob_path(pdf_dir, sha256: str) -> str:
+    """Path of the blob of a hash in the store of a pdf folder
+
+    Args:
+        pdf_dir (str): Folder of the pdf files
+        sha256 (str): SHA-256 of the pdf file
+
+    Returns:
+        str: pdf_dir/.store/<sha[:2]>/<sha>.pdf
+    """
+    return os.path.join(pdf_dir, STORE_DIR, sha256[:2], f"{sha256}.pdf")
+
+
+def _link(blob: str, pdf_path: str) -> str:
+    # replaces pdf_path by a link to the blob, a hardlink or else a symlink
+    tmp = f"{pdf_path}.link"
+    try:
+        os.link(blob, tmp)
+        kind = "hardlink"
+    except OSError:
+        os.symlink(os.path.abspath(blob), tmp)
+        kind = "symlink"
+    os.replace(tmp, pdf_path)
+    return kind
+
+
+@dataclass
+class StoredFile:
+    """Outcome of adding one pdf file to the store
+
+    Args:
+        pdf_path (str): The ID named pdf file
+        sha256 (str): SHA-256 of the file
+        status (str): added (new blob), linked (duplicate, now a link to the blob),
+            duplicate (same content as the blob, kept as its own file) or stored (already a link)
+        link (str): hardlink or symlink, how the file and the blob are tied, None for a duplicate
+    """
+
+    pdf_path: str
+    sha256: str
+    status: str
+    link: str | None
+
+
+def _is_stale(blob: str) -> bool:
+    # a blob edited in place through one of its links no longer has the content of its name
+    return file_sha256(blob) != os.path.basename(blob)[: -len(".pdf")]
+
+
+def store_file(pdf_dir, pdf_path: str, link: bool = False) -> StoredFile:
+    """Adds a pdf file to the content-addressed store of its folder
+
+    A new file becomes a blob through a hardlink, no data is copied. Without
+    hardlink support the file moves into the store and is replaced by a
+    symlink. A file whose content is already in the store is a duplicate, it
+    is only replaced by a link to the blob with link=True.
+
+    Linked files share their content: a PDF viewer saving annotations in place
+    changes every study linked to the blob, a viewer writing a new file breaks
+    the link. A hardlinked blob changed in place is detected and added again.
+
+    Args:
+        pdf_dir (str): Folder of the pdf files
+        pdf_path (str): The ID named pdf file
+        link (bool, optional): Replace a duplicate by a link to the blob, frees its disk space. Defaults to False.
+
+    Returns:
+        StoredFile: The hash and what was done
+    """
+    sha256 = file_sha256(pdf_path)
+    blob = blob_path(pdf_dir, sha256)
+    if os.path.exists(blob) and not os.path.samefile(blob, pdf_path) and _is_stale(blob):
+        if os.stat(blob).st_nlink == 1:
+            # the content of symlinked files, kept, the duplicate is not linked to it
+            return StoredFile(pdf_path, sha256, "duplicate", None)
+        # the hardlinked files keep the edited content, the blob is added again
+        os.remove(blob)
+    if os.path.exists(blob):
+        if os.path.samefile(blob, pdf_path):
+            kind = "symlink" if os.path.islink(pdf_path) else "hardlink"
+            return StoredFile(pdf_path, sha256, "stored", kind)
+        if not link:
+            return StoredFile(pdf_path, sha256, "duplicate", None)
+        return StoredFile(pdf_path, sha256, "linked", _link(blob, pdf_path))
+
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        os.link(pdf_path, blob)
+        kind = "hardlink"
+    except FileExistsError:
+        # added meanwhile, e.g. by a parallel download of the same file
+        if not link:
+            return StoredFile(pdf_path, sha256, "duplicate", None)
+        return StoredFile(pdf_path, sha256, "linked", _link(blob, pdf_path))
+    except OSError:
+        # the file moves into the store and a symlink takes its place
+        os.replace(pdf_path, blob)
+        try:
+            os.symlink(os.path.abspath(blob), pdf_path)
+        except OSError:
+            os.replace(blob, pdf_path)
+            raise
+        kind = "symlink"
+    return StoredFile(pdf_path, sha256, "added", kind)
+
+
+@dataclass
+class StoreReport:
+    """Result of adding the pdf files of a folder to the store
+
+    Args:
+        files (list): StoredFile of every pdf file
+        errors (dict): Path to error message of the files that could not be stored
+    """
+
+    files: list[StoredFile] = field(default_factory=list)
+    errors: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def duplicates(self) -> dict[str, list[str]]:
+        """Hashes shared by several pdf files, with their file names"""
+        by_hash = {}
+        for stored in self.files:
+            by_hash.setdefault(stored.sha256, []).append(os.path.basename(stored.pdf_path))
+        return {sha256: names for sha256, names in by_hash.items() if len(names) > 1}
+
+
+def store_files(pdf_dir, pdf_paths, link: bool = False) -> StoreReport:
+    """Adds pdf files to the store, a file that fails is reported and the others go on
+
+    Args:
+        pdf_dir (str): Folder of the pdf files
+        pdf_paths (Iterable): The ID named pdf files
+        link (bool, optional): Replace duplicates by links, see store_file(). Defaults to False.
+
+    Returns:
+        StoreReport: Every file and the duplicates
+    """
+    report = StoreReport()
+    for pdf_path in pdf_paths:
+        try:
+            report.files.append(store_file(pdf_dir, pdf_path, link))
+        except OSError as e:
+            report.errors[pdf_path] = f"{type(e).__name__}: {e}"
+    return report
+
+
+def prune_store(pdf_dir) -> list[str]:
+    """Removes the blobs no pdf file links to any more, e.g. after a file was replaced, and the ones edited in place
+
+    Args:
+        pdf_dir (str): Folder of the pdf files
+
+    Returns:
+        list: Removed blobs
+    """
+    store = os.path.join(pdf_dir, STORE_DIR)
+    linked = {
+        os.path.realpath(os.path.join(pdf_dir, name))
+        for name in os.listdir(pdf_dir)
+        if os.path.islink(os.path.join(pdf_dir, name))
+    }
+    removed = []
+    for root, _, names in os.walk(store):
+        for name in names:
+            blob = os.path.join(root, name)
+            if os.path.realpath(blob) in linked:
+                continue
+            if os.stat(blob).st_nlink == 1 or _is_stale(blob):
+                os.remove(blob)
+                removed.append(blob)
+    return removed
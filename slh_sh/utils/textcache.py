@@ -0,0 +1,485 @@
+import os
+import re
+import json
+import fitz
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from functools import cached_property
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from slh_sh.utils.db import get_db
+from slh_sh.utils.file import pdf_file_id
+from slh_sh.utils.pdf import PageGeometry, PageWords
+from slh_sh.utils.store import file_sha256
+from slh_sh.data.models import PdfFile, PdfPage
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    """Text and geometry of one PDF page, as extracted once by fitz
+
+    Args:
+        page_number (int): 1 based page number
+        text (str): Text blocks of the page separated by blank lines
+        blocks (list): page.get_text("blocks") tuples, (x0, y0, x1, y1, text, block_no, block_type)
+        words (list): page.get_text("words") tuples, (x0, y0, x1, y1, word, block_no, line_no, word_no)
+        annots (list): Annotations as dicts with type, stroke, rect and vertices
+    """
+
+    page_number: int
+    text: str
+    blocks: list
+    words: list
+    annots: list
+
+    @cached_property
+    def geometry(self) -> PageGeometry:
+        """Blocks of the page indexed for rect to text lookups, built once per page"""
+        return PageGeometry(self.blocks)
+
+    @cached_property
+    def word_geometry(self) -> PageWords:
+        """Word boxes of the page as arrays for quad point lookups, built once per page"""
+        return PageWords(self.words)
+
+    def highlight_text(self, annot: dict, words: bool = True) -> str:
+        """Text of a highlight annotation
+
+        Args:
+            annot (dict): Annotation from annots
+            words (bool, optional): Exactly the highlighted words from the quad points,
+                False for the whole blocks touching the rect. Defaults to True.
+
+        Returns:
+            str: Highlighted text
+        """
+        if words and annot["vertices"]:
+            return self.word_geometry.text(annot["vertices"])
+        return self.geometry.text(annot["rect"])
+
+    @cached_property
+    def _word_index(self):
+        # words joined by single spaces, with the start offset of every word
+        starts, ends, offset = [], [], 0
+        for word in self.words:
+            starts.append(offset)
+            offset += len(word[4])
+            ends.append(offset)
+            offset += 1
+        return " ".join(word[4] for word in self.words), starts, ends
+
+    @property
+    def search_text(self) -> str:
+        """Words of the page joined by single spaces, the text searched by search_pattern"""
+        return self._word_index[0]
+
+    def search_for(self, term: str) -> list[tuple]:
+        """Finds a term on the page, case insensitive, like fitz page.search_for
+
+        Args:
+            term (str): Search term, may span several words
+
+        Returns:
+            list: Bounding rect (x0, y0, x1, y1) of the words of every hit
+        """
+        pattern = re.compile(re.escape(term), re.IGNORECASE)
+        return [rect for _, rect in self.search_pattern(pattern)]
+
+    def search_pattern(self, pattern: re.Pattern) -> list[tuple[re.Match, tuple]]:
+        """Finds all matches of a compiled pattern on the page in one scan
+
+        Args:
+            pattern (re.Pattern): Pattern, e.g. an alternation of several terms
+
+        Returns:
+            list: (match, bounding rect of its words) of every hit, in page order
+        """
+        text, _, _ = self._word_index
+        return [
+            (match, self.span_rect(match.start(), match.end()))
+            for match in pattern.finditer(text)
+        ]
+
+    def span_rect(self, start: int, end: int) -> tuple:
+        """Bounding rect of the words of a span of the page text searched by search_pattern
+
+        Args:
+            start (int): Offset of the first character
+            end (int): Offset after the last character
+
+        Returns:
+            tuple: (x0, y0, x1, y1)
+        """
+        _, starts, ends = self._word_index
+        words = self.words[bisect_right(ends, start) : bisect_left(starts, end)]
+        return (
+            min(w[0] for w in words),
+            min(w[1] for w in words),
+            max(w[2] for w in words),
+            max(w[3] for w in words),
+        )
+
+
+def parse_page(page) -> CachedPage:
+    """Extracts the text, blocks, words and annotations of a fitz page
+
+    Args:
+        page (fitz.Page): The page
+
+    Returns:
+        CachedPage: The extracted page
+    """
+    blocks = [tuple(block) for block in page.get_text("blocks")]
+    annots = [
+        {
+            "type": annot.type[1],
+            "stroke": annot.colors["stroke"],
+            "rect": tuple(annot.rect),
+            "vertices": [tuple(point) for point in annot.vertices or []],
+        }
+        for annot in page.annots()
+    ]
+    return CachedPage(
+        page_number=page.number + 1,
+        # block_type 0 is text, 1 is an image
+        text="\n\n".join(block[4].strip() for block in blocks if block[6] == 0),
+        blocks=blocks,
+        words=[tuple(word) for word in page.get_text("words")],
+        annots=annots,
+    )
+
+
+def parse_pdf(pdf_path: str, start: int = 0, stop: int | None = None) -> list[CachedPage]:
+    """Extracts the pages of a pdf file, all of them or a range
+
+    Args:
+        pdf_path (str): Path to the pdf file
+        start (int, optional): 0 based index of the first page. Defaults to 0.
+        stop (int, optional): 0 based index after the last page. Defaults to the page count.
+
+    Returns:
+        list: One CachedPage per page
+    """
+    with fitz.open(pdf_path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        return [parse_page(doc[number]) for number in range(start, stop)]
+
+
+def get_page_count(pdf_path: str) -> int:
+    """Number of pages of a pdf file, without extracting them
+
+    Args:
+        pdf_path (str): Path to the pdf file
+
+    Returns:
+        int: Page count
+    """
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def _page_from_row(row) -> CachedPage:
+    return CachedPage(
+        page_number=row.page_number,
+        text=row.text,
+        blocks=[tuple(block) for block in json.loads(row.blocks)],
+        words=[tuple(word) for word in json.loads(row.words)],
+        annots=[
+            {
+                **annot,
+                "rect": tuple(annot["rect"]),
+                "vertices": [tuple(point) for point in annot["vertices"]],
+                "stroke": tuple(annot["stroke"]) if annot["stroke"] else annot["stroke"],
+            }
+            for annot in json.loads(row.annots)
+        ],
+    )
+
+
+def _has_no_pages(conn, sha256: str) -> bool:
+    # a document without pages is cached as page_count 0 of its pdf_files rows
+    table = PdfFile.__table__
+    table.create(conn, checkfirst=True)
+    return (
+        conn.execute(
+            select(table.c.id)
+            .where(table.c.sha256 == sha256, table.c.page_count == 0)
+            .limit(1)
+        ).first()
+        is not None
+    )
+
+
+def read_cached_pages(conn, sha256: str) -> list[CachedPage] | None:
+    """Reads the pages of a pdf file from the text cache
+
+    Args:
+        conn (Connection): Database connection
+        sha256 (str): SHA-256 of the pdf file
+
+    Returns:
+        list: One CachedPage per page, None if the file is not (completely) cached
+    """
+    table = PdfPage.__table__
+    table.create(conn, checkfirst=True)
+    rows = conn.execute(
+        select(table).where(table.c.sha256 == sha256).order_by(table.c.page_number)
+    ).all()
+    if rows and len(rows) == rows[0].page_count:
+        return [_page_from_row(row) for row in rows]
+    if not rows and _has_no_pages(conn, sha256):
+        return []
+    return None
+
+
+def is_cached(conn, sha256: str) -> bool:
+    """Checks if all pages of a pdf file are in the text cache
+
+    Args:
+        conn (Connection): Database connection
+        sha256 (str): SHA-256 of the pdf file
+
+    Returns:
+        bool: True if the pdf file is completely cached
+    """
+    table = PdfPage.__table__
+    row = conn.execute(
+        select(func.count(), func.max(table.c.page_count)).where(
+            table.c.sha256 == sha256
+        )
+    ).one()
+    if row[0] == 0:
+        return _has_no_pages(conn, sha256)
+    return row[0] == row[1]
+
+
+def store_pages(conn, sha256: str, pages: list[CachedPage]):
+    """Writes the pages of a pdf file to the text cache, replacing a partial entry
+
+    The page count is also set on the pdf_files rows of the content, a document
+    without pages is cached by that alone.
+
+    Args:
+        conn (Connection): Database connection
+        sha256 (str): SHA-256 of the pdf file
+        pages (list): Pages from parse_pdf()
+    """
+    table = PdfPage.__table__
+    table.create(conn, checkfirst=True)
+    files = PdfFile.__table__
+    files.create(conn, checkfirst=True)
+    conn.execute(
+        update(files).where(files.c.sha256 == sha256).values(page_count=len(pages))
+    )
+    # drop a partial entry, e.g. from an interrupted run
+    conn.execute(delete(table).where(table.c.sha256 == sha256))
+    if pages:
+        conn.execute(
+            insert(table),
+            [
+                {
+                    "sha256": sha256,
+                    "page_number": page.page_number,
+                    "page_count": len(pages),
+                    "text": page.text,
+                    "blocks": json.dumps(page.blocks),
+                    "words": json.dumps(page.words),
+                    "annots": json.dumps(page.annots),
+                }
+                for page in pages
+            ],
+        )
+
+
+def read_pdf_files(conn, pdf_paths: list[str]) -> dict:
+    """Reads the recorded hashes of pdf files from the pdf_files table
+
+    Args:
+        conn (Connection): Database connection
+        pdf_paths (list): Paths to the pdf files
+
+    Returns:
+        dict: Path to the pdf_files row of every recorded file
+    """
+    table = PdfFile.__table__
+    table.create(conn, checkfirst=True)
+    rows = {}
+    for i in range(0, len(pdf_paths), 500):
+        rows.update(
+            (row.pdf_path, row)
+            for row in conn.execute(
+                select(table).where(table.c.pdf_path.in_(pdf_paths[i : i + 500]))
+            )
+        )
+    return rows
+
+
+def recorded_sha256(row, study: str, pdf_path: str, stat) -> str | None:
+    """Gets the hash of a pdf file from its pdf_files row, if the file is unchanged
+
+    A file of the recorded size but another modification time, e.g. touched or
+    copied back, is hashed again and compared.
+
+    Args:
+        row (Row): pdf_files row of the file, None if it is not recorded
+        study (str): ID, e.g. Covidence number
+        pdf_path (str): Path to the pdf file
+        stat (os.stat_result): Size and modification time of the file
+
+    Returns:
+        str: SHA-256 of the file, None if it is not recorded or changed
+    """
+    if row is None or row.sha256 is None or row.study != study or row.size != stat.st_size:
+        return None
+    if row.mtime_ns == stat.st_mtime_ns or file_sha256(pdf_path) == row.sha256:
+        return row.sha256
+    return None
+
+
+def record_pdf_file(conn, study: str, pdf_path: str, stat, sha256: str | None):
+    """Records the hash of a pdf file in the pdf_files table
+
+    Args:
+        conn (Connection): Database connection
+        study (str): ID, e.g. Covidence number
+        pdf_path (str): Path to the pdf file
+        stat (os.stat_result): Size and modification time of the file
+        sha256 (str): SHA-256 of the file, None if it could not be read
+    """
+    table = PdfFile.__table__
+    values = {
+        "study": study,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256,
+        "updated_at": func.now(),
+    }
+    stmt = insert(table).values(pdf_path=pdf_path, **values)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["pdf_path"],
+            # the page count belongs to the content, forgotten when the content changed
+            set_={
+                **values,
+                "page_count": case(
+                    (table.c.sha256 == stmt.excluded.sha256, table.c.page_count)
+                ),
+            },
+        )
+    )
+
+
+def update_pdf_files(conn, tasks: list[tuple[str, str]]) -> dict[str, tuple[str | None, str]]:
+    """Brings the hashes of pdf files in the pdf_files table up to date
+
+    Only new and changed files are hashed.
+
+    Args:
+        conn (Connection): Database connection
+        tasks (list): (ID, path) of the pdf files
+
+    Returns:
+        dict: Path to (SHA-256 or None if unreadable, added, updated or unchanged) of every file
+    """
+    rows = read_pdf_files(conn, [pdf_path for _, pdf_path in tasks])
+    files = {}
+    for study, pdf_path in tasks:
+        try:
+            stat = os.stat(pdf_path)
+        except OSError:
+            continue
+        row = rows.get(pdf_path)
+        sha256 = recorded_sha256(row, study, pdf_path, stat)
+        if sha256 is not None:
+            files[pdf_path] = (sha256, "unchanged")
+            if row.mtime_ns == stat.st_mtime_ns:
+                continue
+        else:
+            try:
+                sha256 = file_sha256(pdf_path)
+            except OSError:
+                sha256 = None
+            files[pdf_path] = (sha256, "added" if row is None else "updated")
+        record_pdf_file(conn, study, pdf_path, stat, sha256)
+    return files
+
+
+def prune_pdf_files(conn, pdf_paths) -> int:
+    """Removes the pdf_files rows of files that no longer exist
+
+    Args:
+        conn (Connection): Database connection
+        pdf_paths (Iterable): Paths of the current pdf files, kept
+
+    Returns:
+        int: Number of removed rows
+    """
+    table = PdfFile.__table__
+    table.create(conn, checkfirst=True)
+    current = set(pdf_paths)
+    gone = [
+        pdf_path
+        for pdf_path in conn.execute(select(table.c.pdf_path)).scalars()
+        if pdf_path not in current and not os.path.exists(pdf_path)
+    ]
+    for i in range(0, len(gone), 500):
+        conn.execute(delete(table).where(table.c.pdf_path.in_(gone[i : i + 500])))
+    return len(gone)
+
+
+def load_pages(pdf_path: str, sha256: str | None = None) -> tuple[str, list[CachedPage], bool]:
+    """Gets the pages of a pdf file from the text cache or by parsing it, without writing the cache
+
+    Used by batch workers, the parsed pages are handed to a single writer.
+
+    Args:
+        pdf_path (str): Path to the pdf file
+        sha256 (str, optional): SHA-256 of the file if already known, e.g. from pdf_files
+
+    Returns:
+        str, list, bool: SHA-256 of the file, one CachedPage per page, True if they came from the cache
+    """
+    sha256 = sha256 or file_sha256(pdf_path)
+    pages = read_cached_pages(get_db().connection(), sha256)
+    if pages is not None:
+        return sha256, pages, True
+    return sha256, parse_pdf(pdf_path), False
+
+
+def get_pages(pdf_path: str) -> list[CachedPage]:
+    """Gets the pages of a pdf file from the text cache, parsing the file only if it is not cached
+
+    The cache is keyed by the SHA-256 of the file, a changed file is parsed again
+    and a renamed or moved file is still a hit.
+
+    Args:
+        pdf_path (str): Path to the pdf file
+
+    Returns:
+        list: One CachedPage per page
+    """
+    sha256, pages, cached = load_pages(pdf_path)
+    if not cached:
+        conn = get_db().connection()
+        if not pages:
+            # the page count of a document without pages is kept in pdf_files
+            record_pdf_file(
+                conn, pdf_file_id(os.path.basename(pdf_path)), pdf_path, os.stat(pdf_path), sha256
+            )
+        store_pages(conn, sha256, pages)
+    return pages
+
+
+def get_full_text(pages: list[CachedPage]) -> str:
+    """Joins the text of all pages
+
+    Args:
+        pages (list): Pages from get_pages()
+
+    Returns:
+        str: Full text of the document
+    """
+    return "\n\n".join(page.text for page in pages)
@@ -0,0 +1,78 @@
+import csv
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from pathlib import Path
+from slh_sh.modules.add import import_csv, normalize_headers
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.file import read_csv_chunks
+
+HEADERS = ["Title", "Authors", "Published Year", "Covidence #"]
+
+
+class TestImportCSV(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\ndefault_id: Covidence\n")
+        clear_config_cache()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def write_csv(self, rows):
+        with open("studies.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS)
+            writer.writerows(rows)
+
+    def test_normalize_headers(self):
+        self.assertEqual(
+            normalize_headers(HEADERS), ["Title", "Authors", "Published_Year", "Covidence"]
+        )
+
+    def test_upsert_counts(self):
+        self.write_csv([["A", "Smith, J.", "2020", "1"], ["B", "Doe, J.", "2021", "2"]])
+        counts = import_csv("studies.csv", "Covidence")
+        self.assertEqual(counts, {"inserted": 2, "updated": 0, "unchanged": 0})
+
+        self.write_csv(
+            [
+                ["A", "Smith, J.", "2020", "1"],
+                ["B2", "Doe, J.", "2021", "2"],
+                ["C", "Roe, R.", "2022", "3"],
+            ]
+        )
+        counts = import_csv("studies.csv", "Covidence")
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "unchanged": 1})
+
+        conn = sqlite3.connect("test.db")
+        rows = conn.execute("SELECT id, Title, Covidence FROM studies ORDER BY Covidence").fetchall()
+        conn.close()
+        self.assertEqual([row[1:] for row in rows], [("A", "1"), ("B2", "2"), ("C", "3")])
+        # an updated study keeps its id
+        self.assertEqual([row[0] for row in rows[:2]], [1, 2])
+
+    def test_missing_id_column(self):
+        self.write_csv([["A", "Smith, J.", "2020", "1"]])
+        with self.assertRaisesRegex(ValueError, "no Study_ID column"):
+            import_csv("studies.csv", "Study_ID")
+        self.assertFalse(Path("test.db").exists())
+
+    def test_chunked_import(self):
+        self.write_csv([[f"T{i}", "Smith, J.", "2020", str(i)] for i in range(10)])
+        counts = import_csv("studies.csv", "Covidence", chunk_size=3)
+        self.assertEqual(counts, {"inserted": 10, "updated": 0, "unchanged": 0})
+
+        headers, chunks = read_csv_chunks("studies.csv", 4)
+        self.assertEqual(headers, HEADERS)
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
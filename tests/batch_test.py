@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock
+from sqlalchemy import text
+from slh_sh.data.models import PdfPage, Study, Theme
+from slh_sh.modules.add import import_csv
+from slh_sh.modules import batch
+from slh_sh.modules.batch import page_shards, pdf_tasks, run_batch
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.db import Base, get_db, get_engine, session_scope
+from tests.textcache_test import make_pdf
+
+
+def session_info():
+    return dict(get_db().info)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\npdf_path: pdfs\n")
+        clear_config_cache()
+        Base.metadata.create_all(get_engine())
+        os.mkdir("pdfs")
+        with session_scope() as dbs:
+            for id in range(1, 6):
+                dbs.add(Study(Covidence=id, title="t", authors="a", abstract="", published_year=2020))
+                if id != 3:
+                    make_pdf(f"pdfs/{id}_Smith_2020.pdf", [["Abstract", f"Keywords: topic {id}"]])
+        # not a pdf, fails to parse
+        Path("pdfs/3_Broken_2020.pdf").write_text("broken")
+        Path("pdfs/notes.txt").write_text("not a pdf")
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def run_keywords(self, jobs, force=True):
+        with session_scope():
+            return run_batch(
+                "keywords", pdf_tasks("pdfs"), jobs, write_batch_size=2, force=force, db=True
+            )
+
+    def test_pdf_tasks(self):
+        self.assertEqual(
+            [id for id, _ in pdf_tasks("pdfs")], ["1", "2", "3", "4", "5"]
+        )
+
+    def test_keywords_in_order_and_failure_isolated(self):
+        for jobs in (1, 2):
+            summary = self.run_keywords(jobs)
+            self.assertEqual([r.index for r in summary.results], [0, 1, 2, 3, 4])
+            self.assertEqual([r.id for r in summary.failed], ["3"])
+            self.assertEqual(
+                [r.result for r in summary.results if r.error is None],
+                ["topic 1", "topic 2", "topic 4", "topic 5"],
+            )
+
+        with session_scope() as dbs:
+            keywords = dbs.execute(
+                text("SELECT keywords FROM studies ORDER BY Covidence")
+            ).scalars().all()
+            self.assertEqual(keywords, ["topic 1", "topic 2", None, "topic 4", "topic 5"])
+            self.assertEqual(dbs.query(PdfPage).count(), 4)
+
+    def test_second_run_reads_the_cache(self):
+        self.run_keywords(2)
+        summary = self.run_keywords(2)
+        self.assertTrue(all(r.pages is None for r in summary.results))
+
+    def test_documents_without_pages_are_parsed_once(self):
+        with mock.patch("slh_sh.utils.textcache.parse_pdf", return_value=[]) as parse:
+            self.run_keywords(1)
+            self.assertEqual(parse.call_count, 5)
+            self.run_keywords(1)
+            self.assertEqual(parse.call_count, 5)
+
+    def test_manifest_skips_unchanged_pdfs(self):
+        self.run_keywords(1, force=False)
+        summary = self.run_keywords(1, force=False)
+        # the broken pdf file is never recorded, it is tried again
+        self.assertEqual([r.id for r in summary.results], ["3"])
+        self.assertEqual(len(summary.skipped), 4)
+
+        make_pdf("pdfs/2_Smith_2020.pdf", [["Keywords: changed"]])
+        os.utime("pdfs/4_Smith_2020.pdf")
+        summary = self.run_keywords(1, force=False)
+        self.assertEqual([r.id for r in summary.results], ["2", "3"])
+
+        with session_scope() as dbs:
+            dbs.add_all([Theme(color="Red", term=term, hex="#ff0000") for term in ("topic", "other")])
+            summary = run_batch("dist", pdf_tasks("pdfs"), term="topic", db=True)
+            self.assertEqual(len(summary.results), 5)
+            summary = run_batch("dist", pdf_tasks("pdfs"), term="topic", db=True)
+            self.assertEqual(len(summary.results), 1)
+            summary = run_batch("dist", pdf_tasks("pdfs"), term="other", db=True)
+            self.assertEqual(len(summary.results), 5)
+            with mock.patch.dict(batch.EXTRACTOR_VERSIONS, {"dist": 2}):
+                summary = run_batch("dist", pdf_tasks("pdfs"), term="topic", db=True)
+            self.assertEqual(len(summary.results), 5)
+
+        self.assertEqual(len(self.run_keywords(1).results), 5)
+
+    def test_identical_pdfs_are_parsed_once_and_saved_per_study(self):
+        self.run_keywords(1, force=False)
+        shutil.copy("pdfs/1_Smith_2020.pdf", "pdfs/6_Copy_2020.pdf")
+        with session_scope() as dbs:
+            dbs.add(Study(Covidence=6, title="t", authors="a", abstract="", published_year=2020))
+        # same content, another study, its results are not saved yet
+        summary = self.run_keywords(2, force=False)
+        self.assertEqual([(r.id, r.result, r.pages) for r in summary.results if r.error is None], [("6", "topic 1", None)])
+        summary = self.run_keywords(2, force=False)
+        self.assertEqual([r.id for r in summary.results], ["3"])
+        with session_scope() as dbs:
+            self.assertEqual(dbs.query(PdfPage.sha256).distinct().count(), 4)
+            self.assertEqual(dbs.execute(text("SELECT keywords FROM studies WHERE Covidence = 6")).scalar(), "topic 1")
+
+    def test_in_flight_pdfs_are_bounded(self):
+        for id in range(6, 12):
+            make_pdf(f"pdfs/{id}_Smith_2020.pdf", [["Abstract", f"Keywords: topic {id}"]])
+        tasks = pdf_tasks("pdfs")
+        with session_scope():
+            with mock.patch.object(batch, "page_shards", return_value=None) as shards:
+                results = batch._results("keywords", {}, tasks, 2)
+                first = next(results)
+                # a window of 2 * jobs, refilled by one before the first result
+                self.assertEqual(shards.call_count, 5)
+                rest = list(results)
+        self.assertEqual([r.index for r in [first] + rest], list(range(len(tasks))))
+        self.assertEqual(shards.call_count, len(tasks))
+
+    def test_workers_start_with_their_own_session(self):
+        with session_scope() as dbs:
+            dbs.info["parent"] = True
+            with ProcessPoolExecutor(max_workers=1, initializer=batch._init_worker) as executor:
+                self.assertEqual(executor.submit(session_info).result(), {})
+
+    def test_large_pdf_is_sharded(self):
+        Path("config.yaml").write_text("sqlite_db: test.db\npdf_path: pdfs\npage_shard_threshold: 4\n")
+        clear_config_cache()
+        pages = [[f"Page {n} media", f"media again {n}"] for n in range(7)]
+        make_pdf("pdfs/6_Large_2020.pdf", pages)
+        tasks = [("6", "pdfs/6_Large_2020.pdf")]
+
+        with session_scope() as dbs:
+            self.assertEqual(page_shards(tasks[0][1], 3, 4), [(0, 3), (3, 6), (6, 7)])
+            # the cache lookup leaves no connection checked out by the session
+            self.assertFalse(dbs.in_transaction())
+            self.assertIsNone(page_shards(tasks[0][1], 3, 8))
+            # a small pdf file is not hashed by the parent process
+            with mock.patch.object(batch, "file_sha256") as sha256:
+                self.assertIsNone(page_shards("pdfs/1_Smith_2020.pdf", 3, 4))
+            sha256.assert_not_called()
+            sharded = run_batch("dist", tasks, 3, term="media")
+        with session_scope():
+            # cached now, read back in one piece
+            self.assertIsNone(page_shards(tasks[0][1], 3, 4))
+            single = run_batch("dist", tasks, 1, term="media")
+
+        self.assertIsNotNone(sharded.results[0].pages)
+        self.assertIsNone(single.results[0].pages)
+        total, dist = sharded.results[0].result
+        self.assertEqual(total, 14)
+        self.assertEqual([d["page_number"] for d in dist], [n for n in range(1, 8) for _ in range(2)])
+        self.assertEqual([d["count"] for d in dist], [1, 2] * 7)
+        self.assertEqual(sharded.results[0].result, single.results[0].result)
+
+
+class TestBatchCsvStudies(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\npdf_path: pdfs\ndefault_id: Covidence\n")
+        clear_config_cache()
+        Path("studies.csv").write_text(
+            "Title,Authors,Abstract,Published Year,Covidence #\nt,\"Smith, J.\",,2020,1\n"
+        )
+        # the studies table has the CSV columns only, like after add csv
+        import_csv("studies.csv", "Covidence")
+        Base.metadata.create_all(get_engine())
+        with session_scope() as dbs:
+            dbs.add(Theme(color="Red", term="media", hex="#ff0000"))
+        os.mkdir("pdfs")
+        make_pdf("pdfs/1_Smith_2020.pdf", [["social media", "media use"]])
+        # not in the studies table
+        make_pdf("pdfs/9_Doe_2020.pdf", [["media"]])
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_dist_of_all_themes_is_saved(self):
+        with session_scope():
+            summary = run_batch("dist", pdf_tasks("pdfs"), 2, terms=["media"], db=True)
+        self.assertEqual(summary.failed, [])
+        with session_scope() as dbs:
+            total = dbs.execute(text("SELECT total_distribution FROM studies WHERE Covidence = '1'")).scalar()
+            studies = dbs.execute(text("SELECT DISTINCT studies_id FROM distribution")).scalars().all()
+        self.assertEqual(int(total), 2)
+        self.assertEqual(studies, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
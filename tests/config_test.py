@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from slh_sh.utils.config import clear_config_cache, config_parse_count, load_config
+from slh_sh.utils.file import get_conf
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        clear_config_cache()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def write_config(self, text):
+        Path("config.yaml").write_text(text)
+
+    def test_missing_config(self):
+        self.assertEqual(get_conf("sqlite_db"), "config.yaml file does not exist.")
+
+    def test_parses_once(self):
+        self.write_config("sqlite_db: test.db\ndefault_id: Covidence\n")
+        before = config_parse_count()
+        for _ in range(50):
+            self.assertEqual(get_conf("sqlite_db"), "test.db")
+            self.assertEqual(get_conf("default_id"), "Covidence")
+        self.assertEqual(config_parse_count() - before, 1)
+
+    def test_reparses_on_change(self):
+        self.write_config("sqlite_db: test.db\n")
+        self.assertEqual(get_conf("sqlite_db"), "test.db")
+        self.write_config("sqlite_db: other_name.db\n")
+        self.assertEqual(get_conf("sqlite_db"), "other_name.db")
+
+    def test_unknown_key(self):
+        self.write_config("sqlite_db: test.db\ncustom_key: 1\n")
+        self.assertEqual(get_conf("custom_key"), 1)
+        with self.assertRaises(KeyError):
+            get_conf("not_a_key")
+
+    def test_immutable(self):
+        self.write_config("sqlite_db: test.db\nthemes:\n  Red: {hex: '#ff0000', term: law}\ncustom: [1, 2]\n")
+        with self.assertRaises(Exception):
+            load_config().sqlite_db = "other.db"
+        with self.assertRaises(TypeError):
+            get_conf("themes")["Blue"] = {"hex": "#0000ff", "term": "ai"}
+        with self.assertRaises(TypeError):
+            get_conf("themes")["Red"]["term"] = "other"
+        with self.assertRaises(AttributeError):
+            get_conf("custom").append(3)
+        self.assertEqual(list(get_conf("themes")), ["Red"])
+
+    def test_declared_key_missing_from_the_file_has_its_default(self):
+        self.write_config("sqlite_db: test.db\n")
+        self.assertEqual(get_conf("default_id"), "Covidence")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from sqlalchemy import text
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.db import get_db, get_engine, session_scope
+
+
+class TestDBSession(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\n")
+        clear_config_cache()
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_engine_created_once(self):
+        engine = get_engine()
+        self.assertIs(engine, get_engine())
+        self.assertEqual(
+            engine.url.database, os.path.join(os.path.realpath(self.tmp.name), "test.db")
+        )
+
+    def test_engine_applies_pragmas(self):
+        with get_engine().connect() as conn:
+            mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+        self.assertEqual(mode, "wal")
+
+    def test_session_shared_within_scope(self):
+        with session_scope() as session:
+            self.assertIs(session, get_db())
+            session.execute(text("CREATE TABLE t (x INTEGER)"))
+            session.execute(text("INSERT INTO t VALUES (1)"))
+        with session_scope() as session:
+            self.assertEqual(session.execute(text("SELECT x FROM t")).scalar(), 1)
+
+    def test_rollback_on_error(self):
+        with session_scope() as session:
+            session.execute(text("CREATE TABLE t (x INTEGER)"))
+        with self.assertRaises(RuntimeError):
+            with session_scope() as session:
+                session.execute(text("INSERT INTO t VALUES (1)"))
+                raise RuntimeError()
+        with session_scope() as session:
+            self.assertEqual(session.execute(text("SELECT count(*) FROM t")).scalar(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from slh_sh.utils.download import CHUNK_SIZE, HostLimiter, download_all
+
+PDF = b"%PDF-1.7\n" + b"x" * 100_000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.1)
+            if self.path == "/flaky" and server.requests.count("/flaky") <= 2:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if self.path == "/missing":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if self.path == "/html":
+                body = b"<html>Please log in</html>"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            offset = 0
+            range_header = self.headers.get("Range")
+            server.ranges.append(range_header)
+            if range_header:
+                offset = int(range_header[len("bytes=") : -1])
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {offset}-{len(PDF) - 1}/{len(PDF)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(PDF) - offset))
+            self.end_headers()
+            if self.path == "/truncated" and server.requests.count("/truncated") == 1:
+                # the connection drops half way
+                self.wfile.write(PDF[offset : CHUNK_SIZE + 100])
+                self.close_connection = True
+                return
+            self.wfile.write(PDF[offset:])
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.ranges = []
+        self.server.active = 0
+        self.server.max_active = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def run_links(self, links, **options):
+        options = {"delay": 0, "backoff": 0.01, **options}
+        return download_all(links, self.tmp.name, **options)
+
+    def test_failures_do_not_stop_the_others(self):
+        open(os.path.join(self.tmp.name, "4.pdf"), "wb").close()
+        report = self.run_links(
+            [("1", f"{self.url}/a"), ("2", f"{self.url}/flaky"), ("3", f"{self.url}/missing"), ("4", f"{self.url}/b")]
+        )
+        self.assertEqual(
+            [(r.id, r.status, r.attempts) for r in report.results],
+            [("1", "downloaded", 1), ("2", "downloaded", 3), ("3", "failed", 1), ("4", "exists", 0)],
+        )
+        self.assertEqual(report.failed[0].error, "HTTP 404")
+        with open(os.path.join(self.tmp.name, "2.pdf"), "rb") as f:
+            self.assertEqual(f.read(), PDF)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "3.pdf")))
+
+    def test_retries_are_limited(self):
+        report = self.run_links([("2", f"{self.url}/flaky")], retries=1)
+        self.assertEqual((report.results[0].status, report.results[0].attempts), ("failed", 2))
+        self.assertEqual(report.results[0].error, "HTTP 503")
+
+    def test_partial_download_is_resumed(self):
+        part = os.path.join(self.tmp.name, "1.pdf.part")
+        with open(part, "wb") as f:
+            f.write(PDF[:1000])
+        report = self.run_links([("1", f"{self.url}/a")])
+        self.assertEqual(report.results[0].status, "downloaded")
+        self.assertEqual(self.server.ranges, ["bytes=1000-"])
+        with open(os.path.join(self.tmp.name, "1.pdf"), "rb") as f:
+            self.assertEqual(f.read(), PDF)
+        self.assertFalse(os.path.exists(part))
+
+    def test_interrupted_download_resumes_on_retry(self):
+        report = self.run_links([("1", f"{self.url}/truncated")])
+        self.assertEqual((report.results[0].status, report.results[0].attempts), ("downloaded", 2))
+        # the complete chunks of the first attempt are kept
+        self.assertEqual(self.server.ranges, [None, f"bytes={CHUNK_SIZE}-"])
+        with open(os.path.join(self.tmp.name, "1.pdf"), "rb") as f:
+            self.assertEqual(f.read(), PDF)
+
+    def test_html_is_not_saved_as_pdf(self):
+        report = self.run_links([("1", f"{self.url}/html")])
+        self.assertEqual(
+            (report.results[0].status, report.results[0].attempts, report.results[0].error),
+            ("failed", 1, "Not a PDF (text/html)"),
+        )
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_identical_downloads_are_detected(self):
+        report = self.run_links([("1", f"{self.url}/a"), ("2", f"{self.url}/b")], workers=1)
+        self.assertEqual([r.duplicate for r in report.results], [False, True])
+        self.assertEqual(report.results[0].sha256, report.results[1].sha256)
+        # not linked, annotating one PDF must not change the other
+        self.assertFalse(
+            os.path.samefile(os.path.join(self.tmp.name, "1.pdf"), os.path.join(self.tmp.name, "2.pdf"))
+        )
+
+    def test_per_host_concurrency(self):
+        links = ((str(i), f"{self.url}/slow{i}") for i in range(8))
+        report = self.run_links(links, workers=8, per_host=2)
+        self.assertEqual(len(report.downloaded), 8)
+        self.assertEqual(self.server.max_active, 2)
+
+    def test_host_delay_spaces_out_requests(self):
+        limiter = HostLimiter(per_host=4, delay=0.05)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire("a")
+            limiter.release("a")
+        limiter.acquire("b")
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
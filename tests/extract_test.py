@@ -0,0 +1,330 @@
+import os
+import tempfile
+import unittest
+
+import fitz
+import pandas as pd
+
+from pathlib import Path
+from sqlalchemy import text
+from slh_sh.data.models import Annotation, Study, Theme
+from slh_sh.modules.add import import_csv
+from slh_sh.modules.extract import (
+    extract_annots,
+    extract_bib,
+    extract_cit,
+    extract_dists,
+    extract_filename,
+    find_dist,
+    find_dists,
+    generate_citations,
+    generate_file_names,
+)
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.db import Base, get_engine, session_scope
+from slh_sh.utils.file import file_name_generator
+from slh_sh.utils.textcache import get_pages
+from tests.textcache_test import make_pdf
+
+
+class TestFileNames(unittest.TestCase):
+    def test_matches_file_name_generator(self):
+        df = pd.DataFrame(
+            {
+                "Covidence #": [1, 2, 3, 4],
+                "Authors": [
+                    "Smith, J.",
+                    "Smith, J.; Doe, K.",
+                    "Smith, J.; Doe, K.; Roe, R.",
+                    "Smith, J.",
+                ],
+                "Published Year": [2020, 2021, 2022, 2023],
+            }
+        )
+        expected = [
+            file_name_generator(str(id), authors, str(year))
+            for id, authors, year in df.itertuples(index=False)
+        ]
+        names = generate_file_names(df["Covidence #"], df["Authors"], df["Published Year"])
+        self.assertEqual(names.tolist(), expected)
+
+    def test_extract_filename_on_a_csv_studies_table(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                Path("config.yaml").write_text("sqlite_db: test.db\ndefault_id: Covidence\n")
+                clear_config_cache()
+                pd.DataFrame(
+                    {
+                        "Title": ["A", "B"],
+                        "Authors": ["Smith, J.", "Smith, J.; Doe, K."],
+                        "Published Year": [2020, 2021],
+                        "Covidence #": [1, 2],
+                    }
+                ).to_csv("studies.csv", index=False)
+                # no filename column, the table has the CSV headers only
+                import_csv("studies.csv", "Covidence")
+                with session_scope():
+                    names = extract_filename("studies.csv", db=True)
+                with session_scope() as dbs:
+                    saved = dbs.execute(
+                        text("SELECT filename FROM studies ORDER BY Covidence")
+                    ).scalars().all()
+                self.assertEqual(saved, names)
+                self.assertEqual(names, ["1_Smith_2020", "2_Smith_Doe_2021"])
+            finally:
+                get_engine().dispose()
+                os.chdir(cwd)
+                clear_config_cache()
+
+    def test_same_authors_keep_their_own_row(self):
+        df = pd.DataFrame(
+            {
+                "Covidence #": [7, 8],
+                "Authors": ["Smith, J.", "Smith, J."],
+                "Published Year": [2019, None],
+            }
+        )
+        names = generate_file_names(df["Covidence #"], df["Authors"], df["Published Year"])
+        self.assertEqual(names.tolist(), ["7_Smith_2019", "8_Smith_None"])
+
+
+class TestCitations(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\n")
+        clear_config_cache()
+        Base.metadata.create_all(get_engine())
+        with session_scope() as dbs:
+            for id, authors, year in [
+                (1, "Smith, J.", 2020),
+                (2, "Smith, J.; Doe, K.", 2021),
+                (3, "Smith, J.; Doe, K.; Roe, R.", 2022),
+            ]:
+                dbs.add(
+                    Study(
+                        Covidence=id,
+                        title=f"Title {id}",
+                        authors=authors,
+                        abstract="",
+                        published_year=year,
+                        journal="Journal",
+                        volume="1",
+                        issue="2",
+                        pages="3-4",
+                    )
+                )
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_generate_citations(self):
+        citations = generate_citations(
+            pd.DataFrame(
+                {
+                    "Covidence": [1, 2, 3, 4, 5],
+                    "authors": ["Smith, J.", "Smith, J.; Doe, K.", "A, B; C, D; E, F", "Smith, K.", "Smith, J."],
+                    "published_year": [2020, 2021, 2022, 2020, 2020],
+                    "title": ["B title", "Title", "Title", "C title", "A title"],
+                }
+            )
+        )
+        self.assertEqual(
+            citations["citation"].tolist(),
+            ["(Smith, 2020b)", "(Smith & Doe, 2021)", "(A et al., 2022)", "(Smith, 2020c)", "(Smith, 2020a)"],
+        )
+        self.assertEqual(
+            citations["citation_key"].tolist(),
+            ["smith2020b", "smithdoe2021", "aetal2022", "smith2020c", "smith2020a"],
+        )
+
+    def test_generate_citations_without_year(self):
+        citations = generate_citations(
+            pd.DataFrame(
+                {
+                    "Covidence": [1, 2, 3, 4],
+                    "authors": ["Doe, J.; Roe, K.", "Smith, J.", "Smith, J.", "Smith, J."],
+                    "published_year": ["", None, " ", "2020"],
+                    "title": ["Title", "B title", "A title", "Title"],
+                }
+            )
+        )
+        self.assertEqual(
+            citations["citation"].tolist(),
+            ["(Doe & Roe, n.d.)", "(Smith, n.d.-b)", "(Smith, n.d.-a)", "(Smith, 2020)"],
+        )
+        self.assertEqual(
+            citations["citation_key"].tolist(), ["doeroend", "smithndb", "smithnda", "smith2020"]
+        )
+
+    def test_extract_cit_blank_year_and_authors(self):
+        with session_scope() as dbs:
+            dbs.execute(text("UPDATE studies SET published_year = '' WHERE Covidence = 2"))
+            dbs.execute(text("UPDATE studies SET authors = ' ' WHERE Covidence = 3"))
+        with session_scope():
+            citations, missing = extract_cit(db=True)
+        self.assertEqual(citations, ["(Smith, 2020)", "(Smith & Doe, n.d.)"])
+        self.assertEqual(missing, [3])
+
+    def test_extract_cit_changed_only(self):
+        with session_scope():
+            citations, missing = extract_cit(db=True)
+        self.assertEqual(len(citations), 3)
+        self.assertEqual(missing, [])
+
+        with session_scope():
+            citations, _ = extract_cit(db=True, changed_only=True)
+        self.assertEqual(citations, [])
+
+        with session_scope() as dbs:
+            dbs.execute(text("UPDATE studies SET published_year = 2019 WHERE Covidence = 1"))
+        with session_scope():
+            citations, _ = extract_cit(db=True, changed_only=True)
+        self.assertEqual(citations, ["(Smith, 2019)"])
+
+        with session_scope() as dbs:
+            saved = dbs.execute(text("SELECT citation FROM studies ORDER BY Covidence")).scalars().all()
+        self.assertEqual(saved, ["(Smith, 2019)", "(Smith & Doe, 2021)", "(Smith et al., 2022)"])
+
+    def test_extract_cit_disambiguates_changed_group(self):
+        with session_scope():
+            extract_cit(db=True)
+        # study 1 moves into the group of study 2, which gets a suffix without changing itself
+        with session_scope() as dbs:
+            dbs.execute(text("UPDATE studies SET authors = 'Smith, J.; Doe, K.', published_year = 2021 WHERE Covidence = 1"))
+        with session_scope():
+            citations, _ = extract_cit(db=True, changed_only=True)
+        self.assertEqual(citations, ["(Smith & Doe, 2021a)", "(Smith & Doe, 2021b)"])
+
+        with session_scope() as dbs:
+            keys = dbs.execute(text("SELECT citation_key FROM studies ORDER BY Covidence")).scalars().all()
+        self.assertEqual(keys, ["smithdoe2021a", "smithdoe2021b", "smithetal2022"])
+
+    def test_extract_bib(self):
+        with session_scope():
+            bibs = extract_bib(None, db=True)
+        self.assertEqual(bibs[0], "Smith, J. (2020). Title 1. Journal 1(2), 3-4.")
+
+
+class TestAnnotations(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\n")
+        clear_config_cache()
+        Base.metadata.create_all(get_engine())
+        with session_scope() as dbs:
+            dbs.add(Theme(color="yellow", hex="#ffeb3b", term="theme1"))
+            dbs.add(Theme(color="blue", hex="#69aff1", term="theme2"))
+            # studies.id 2 for Covidence 1
+            dbs.add(Study(Covidence=7, title="Other", authors="a", abstract="", published_year=2020))
+            dbs.add(Study(Covidence=1, title="Annotated", authors="b", abstract="", published_year=2021))
+
+        make_pdf("1.pdf", [["Yellow text", "Blue text", "Grey text"]])
+        with fitz.open("1.pdf") as doc:
+            page = doc[0]
+            for term, stroke in [
+                ("Yellow text", (1, 0.94, 0.3)),
+                ("Blue text", (0.4, 0.7, 0.95)),
+                ("Grey text", (0.5, 0.5, 0.5)),
+            ]:
+                annot = page.add_highlight_annot(page.search_for(term))
+                annot.set_colors(stroke=stroke)
+                annot.update()
+            doc.saveIncr()
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_extract_annots_by_theme(self):
+        with session_scope():
+            total, annots = extract_annots(1, "", "1.pdf", db=True)
+        self.assertEqual(total, 3)
+        self.assertEqual(
+            [(a["text"], a.get("theme_term")) for a in annots],
+            [("Yellow text", "theme1"), ("Blue text", "theme2"), ("Grey text", None)],
+        )
+        with session_scope() as dbs:
+            self.assertEqual(dbs.query(Annotation).count(), 2)
+            self.assertEqual({a.studies_id for a in dbs.query(Annotation)}, {2})
+
+        with session_scope():
+            total, annots = extract_annots(1, "blue", "1.pdf")
+        self.assertEqual([a["text"] for a in annots], ["Blue text"])
+
+
+class TestDistribution(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\n")
+        clear_config_cache()
+        Base.metadata.create_all(get_engine())
+        with session_scope() as dbs:
+            dbs.add(Study(Covidence=1, title="t", authors="a", abstract="", published_year=2020, citation="(A, 2020)"))
+            for term in ["AI", "AI Laws", "ethics"]:
+                dbs.add(Theme(color=term, hex="#000000", term=term))
+        make_pdf(
+            "1.pdf",
+            [
+                ["AI Laws are new", "Ethics of AI", "nothing here"],
+                ["ethics and AI laws", "more on ai"],
+            ],
+        )
+        self.terms = ["AI", "AI Laws", "ethics"]
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_one_pass_matches_one_term_at_a_time(self):
+        with session_scope():
+            pages = get_pages("1.pdf")
+        results = find_dists(1, pages, self.terms, "(A, 2020)")
+        for term in self.terms:
+            self.assertEqual(results[term], find_dist(1, pages, term, "(A, 2020)"))
+        self.assertEqual(results["AI"][0], 4)
+        self.assertEqual(results["AI Laws"][0], 2)
+        self.assertEqual(results["ethics"][0], 2)
+
+    def test_overlapping_and_case_variant_terms_match_one_term_at_a_time(self):
+        make_pdf("2.pdf", [["We study social media use in media contexts", "Media use of kids"], ["social media"]])
+        with session_scope():
+            pages = get_pages("2.pdf")
+        for terms in (["social media", "media use"], ["media", "Media"], ["media", "Media use", "social media"]):
+            results = find_dists(1, pages, terms, "(A, 2020)")
+            for term in terms:
+                self.assertEqual(results[term], find_dist(1, pages, term, "(A, 2020)"))
+        results = find_dists(1, pages, ["social media", "media use", "Media"], "(A, 2020)")
+        self.assertEqual(
+            {term: total for term, (total, _) in results.items()},
+            {"social media": 2, "media use": 2, "Media": 3},
+        )
+
+    def test_extract_dists_saves_all_themes(self):
+        with session_scope():
+            extract_dists("1.pdf", self.terms, 1, db=True)
+        with session_scope() as dbs:
+            rows = dbs.execute(
+                text("SELECT term, COUNT(*) FROM distribution GROUP BY term ORDER BY term")
+            ).all()
+            total = dbs.execute(text("SELECT total_distribution FROM studies")).scalar()
+        self.assertEqual(rows, [("AI", 4), ("AI Laws", 2), ("ethics", 2)])
+        self.assertEqual(total, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest import mock
+from slh_sh.utils import file
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.file import PDF_INDEX_FILE, get_file_path, load_pdf_index, pdf_file_id
+
+
+class TestPdfIndex(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("pdf_path: pdfs\n")
+        clear_config_cache()
+        os.mkdir("pdfs")
+        for name in ("1_Smith_2020.pdf", "#2_Doe_2021.pdf", "2_Doe_2021_v2.pdf", "9_Roe_2019.pdf", "3_notes.txt", "101.pdf"):
+            Path("pdfs", name).write_text("")
+        self.settle()
+        file._pdf_indexes.clear()
+
+    def tearDown(self):
+        file._pdf_indexes.clear()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def settle(self):
+        # as if the folder was last changed a minute ago
+        mtime = os.stat("pdfs").st_mtime - 60
+        os.utime("pdfs", (mtime, mtime))
+
+    def test_pdf_file_id(self):
+        self.assertEqual(pdf_file_id("101.pdf"), "101")
+        self.assertEqual(pdf_file_id("#101_Smith_2020.pdf"), "101")
+        self.assertEqual(pdf_file_id("101_Smith_2020.PDF"), "101")
+
+    def test_lookup_duplicates_and_orphans(self):
+        index = load_pdf_index()
+        self.assertEqual(get_file_path(1), os.path.join(index.pdf_dir, "1_Smith_2020.pdf"))
+        self.assertEqual(get_file_path("2"), os.path.join(index.pdf_dir, "#2_Doe_2021.pdf"))
+        self.assertIsNone(get_file_path(3))
+        # named by extract dl
+        self.assertEqual(get_file_path(101), os.path.join(index.pdf_dir, "101.pdf"))
+        self.assertEqual(index.duplicates, {"2": ["#2_Doe_2021.pdf", "2_Doe_2021_v2.pdf"]})
+        self.assertEqual(index.orphans([1, 2, 101]), ["9_Roe_2019.pdf"])
+
+    def test_index_of_an_older_version_is_scanned_again(self):
+        pdf_dir = str(file.get_pdf_dir())
+        Path(PDF_INDEX_FILE).write_text(
+            json.dumps({"pdf_dir": pdf_dir, "mtime_ns": os.stat(pdf_dir).st_mtime_ns, "files": {"101.pdf": ["101.pdf"]}})
+        )
+        self.assertEqual(get_file_path(101), os.path.join(pdf_dir, "101.pdf"))
+
+    def test_scanned_once_and_persisted_until_the_folder_changes(self):
+        with mock.patch.object(file, "scan_pdf_dir", wraps=file.scan_pdf_dir) as scan:
+            load_pdf_index()
+            get_file_path(1)
+            file._pdf_indexes.clear()
+            # a new process reads the persisted index
+            get_file_path(9)
+            self.assertEqual(scan.call_count, 1)
+            self.assertTrue(Path(PDF_INDEX_FILE).is_file())
+
+            Path("pdfs", "4_New_2022.pdf").write_text("")
+            self.assertIsNotNone(get_file_path(4))
+            self.assertEqual(scan.call_count, 2)
+            # changed within the mtime resolution, not trusted yet
+            get_file_path(4)
+            self.assertEqual(scan.call_count, 3)
+
+            self.settle()
+            get_file_path(4)
+            get_file_path(4)
+            self.assertEqual(scan.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
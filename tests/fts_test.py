@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from slh_sh.data.models import Study, Theme
+from slh_sh.modules.extract import save_annots, save_dists
+from slh_sh.modules.fts import create_fts, fts_search, table_columns
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.db import Base, get_engine, session_scope
+from slh_sh.utils.sqlite import connect
+
+
+class TestFts(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\n")
+        clear_config_cache()
+        Base.metadata.create_all(get_engine())
+        with session_scope() as dbs:
+            dbs.add(Study(Covidence=101, title="Social media and children", authors="a", abstract="A survey.", published_year=2020))
+            dbs.add(Study(Covidence=102, title="Labour law", authors="b", abstract="Platform workers use social media.", published_year=2021))
+            dbs.add(Theme(color="Red", term="law", hex="#ff0000"))
+        self.conn = connect()
+
+    def tearDown(self):
+        self.conn.close()
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_existing_rows_are_indexed_and_ranked(self):
+        self.assertEqual(
+            create_fts(self.conn), ["studies_fts", "annotations_fts", "distribution_fts"]
+        )
+        self.assertEqual(create_fts(self.conn), [])
+        hits = fts_search(self.conn, "social media", "Covidence")
+        # the title weighs more than the abstract
+        self.assertEqual([(hit["source"], hit["ID"]) for hit in hits], [("studies", 101), ("studies", 102)])
+        self.assertEqual(hits[0]["snippet"], "**Social** **media** and children")
+
+    def test_triggers_keep_the_index_in_sync(self):
+        create_fts(self.conn)
+        with session_scope() as dbs:
+            study = dbs.query(Study).filter(Study.Covidence == 102).one()
+            study.keywords = "gig economy"
+            # written like extract annots and extract dist do, by Covidence number
+            save_annots(dbs, 102, [{"theme_id": 1, "count": 1, "page_number": 3, "annot_rgb_color": "", "annot_hex_color": "", "text": "The gig economy grows"}], "102.pdf")
+            save_dists(dbs, 102, {"law": (1, [{"page_number": 4, "count": 1, "term": "law", "text": "Gig workers and law"}])})
+            dbs.query(Study).filter(Study.Covidence == 101).delete()
+
+        hits = fts_search(self.conn, "gig", "Covidence")
+        self.assertEqual(
+            sorted((hit["source"], hit["ID"]) for hit in hits),
+            [("annotations", 102), ("distribution", 102), ("studies", 102)],
+        )
+        self.assertEqual(fts_search(self.conn, "children", "Covidence"), [])
+        # not valid FTS5 syntax, searched as plain words
+        self.assertEqual(len(fts_search(self.conn, "gig-economy", "Covidence")), 2)
+
+    def test_hits_are_ranked_within_each_source(self):
+        with session_scope() as dbs:
+            save_annots(dbs, 101, [{"theme_id": 1, "count": 1, "page_number": 1, "annot_rgb_color": "", "annot_hex_color": "", "text": "media media media"}], "101.pdf")
+            save_dists(dbs, 102, {"law": (1, [{"page_number": 2, "count": 1, "term": "law", "text": "media law"}])})
+        hits = fts_search(self.conn, "media", "Covidence")
+        self.assertEqual(
+            [(hit["source"], hit["ID"]) for hit in hits],
+            [("studies", 101), ("studies", 102), ("annotations", 101), ("distribution", 102)],
+        )
+        ranks = [hit["rank"] for hit in hits if hit["source"] == "studies"]
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(fts_search(self.conn, "media", "Covidence", limit=1)), 3)
+
+    def test_csv_studies_table_keeps_its_ids_through_vacuum(self):
+        self.conn.execute("DROP TABLE studies")
+        self.conn.execute('CREATE TABLE studies ("Covidence", "title", "abstract")')
+        self.conn.executemany(
+            "INSERT INTO studies VALUES (?, ?, '')",
+            [(7, "Deep learning"), (8, "Labour law"), (9, "Social media")],
+        )
+        self.conn.execute("DELETE FROM studies WHERE Covidence = 7")
+        self.conn.commit()
+        with session_scope() as dbs:
+            save_annots(dbs, 9, [{"theme_id": 1, "count": 1, "page_number": 1, "annot_rgb_color": "", "annot_hex_color": "", "text": "Platform law"}], "9.pdf")
+        create_fts(self.conn)
+        self.conn.execute("VACUUM")
+        self.assertEqual(
+            self.conn.execute("SELECT id, Covidence FROM studies ORDER BY id").fetchall(),
+            [(2, 8), (3, 9)],
+        )
+        self.assertEqual(fts_search(self.conn, "social", "Covidence")[0]["ID"], 9)
+        self.assertEqual(fts_search(self.conn, "platform", "Covidence")[0]["ID"], 9)
+
+    def test_csv_studies_table_gets_the_missing_columns(self):
+        self.conn.execute("DROP TABLE studies")
+        self.conn.execute('CREATE TABLE studies ("Covidence", "title", "abstract")')
+        self.conn.execute("INSERT INTO studies VALUES (7, 'Deep learning', '')")
+        self.conn.commit()
+        create_fts(self.conn)
+        self.assertIn("full_text", table_columns(self.conn, "studies"))
+        self.assertEqual(fts_search(self.conn, "learn", "Covidence")[0]["ID"], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+from benchmarks.html_parse import make_export, soup_links
+from slh_sh.utils.html import DownloadLinkParser, iter_download_links
+
+EXPORT = """<html><body>
+<div class="study"><div class="study-header">Study <b>#12</b> Smith</div>
+  <p>unclosed paragraph<br>
+  <a class="other" href="https://x.org/no">No</a>
+  <a class="btn download" href="https://x.org/12.pdf?a=1&amp;b=2">Download</a>
+</div>
+<div class="study"><a class="download" href="https://x.org/7.pdf">Download</a>
+  <div class="study-header">#7 Doe</div></div>
+<div class="study"><div class="study-header">#9 Roe</div></div>
+<div class="study"><div><div class="study-header">#3 Nested</div></div>
+  <a class="download" href="https://x.org/3.pdf">Download</a></div>
+</body></html>
+"""
+
+
+class TestDownloadLinks(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        # the warnings of the parser go to slh_sh.log in the current folder
+        os.chdir(self.tmp.name)
+        self.html = os.path.join(self.tmp.name, "export.html")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_links(self):
+        with open(self.html, "w") as f:
+            f.write(EXPORT)
+        # tiny chunks split tags and text across feed() calls
+        for chunk_size in (7, 1 << 16):
+            self.assertEqual(
+                list(iter_download_links(self.html, "study-header", "download", chunk_size)),
+                [("12", "https://x.org/12.pdf?a=1&b=2"), ("7", "https://x.org/7.pdf")],
+            )
+
+    def test_default_classes_of_the_config(self):
+        with open(self.html, "w") as f:
+            f.write(EXPORT.replace('class="btn download"', 'class="action-link download"'))
+        self.assertEqual(
+            list(iter_download_links(self.html, "study-header", "action-link download")),
+            [("12", "https://x.org/12.pdf?a=1&b=2")],
+        )
+        make_export(self.html, 20)
+        with open(self.html) as f:
+            export = f.read().replace('class="download"', 'class="action-link download"')
+        with open(self.html, "w") as f:
+            f.write(export)
+        links = list(iter_download_links(self.html, "study-header", "action-link download"))
+        self.assertEqual(len(links), 20)
+        self.assertEqual(links, list(soup_links(self.html, "study-header", "action-link download")))
+
+    def test_same_links_as_a_full_tree(self):
+        make_export(self.html, 50)
+        self.assertEqual(
+            list(iter_download_links(self.html, "study-header", "download", 1000)),
+            list(soup_links(self.html, "study-header", "download")),
+        )
+
+    def test_links_are_yielded_before_the_end_of_the_file(self):
+        make_export(self.html, 200)
+        feed = DownloadLinkParser.feed
+        with mock.patch.object(DownloadLinkParser, "feed", autospec=True, side_effect=feed) as fed:
+            links = iter_download_links(self.html, "study-header", "download", 4096)
+            self.assertEqual(next(links), ("1", "https://files.example.org/1.pdf?token=abc"))
+            self.assertEqual(fed.call_count, 1)
+            self.assertEqual(len(list(links)), 199)
+        self.assertGreater(fed.call_count, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+import unittest
+
+import typer
+
+from slh_sh.main import SlhGroup, app
+
+
+class TestLazyCommands(unittest.TestCase):
+    def test_registry_matches_commands(self):
+        group = typer.main.get_group(app)
+        for name, spec in SlhGroup.lazy_commands.items():
+            placeholder = group.get_command(None, name)
+            cmd = group.load(name)
+            self.assertEqual(cmd.name, name)
+            self.assertEqual(placeholder.help, cmd.help, name)
+            self.assertEqual(cmd.rich_help_panel, spec.rich_help_panel)
+
+    def test_help_does_not_import_heavy_modules(self):
+        code = (
+            "import sys\n"
+            "from slh_sh.main import app\n"
+            "try:\n"
+            "    app(['--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "heavy = ('fitz', 'pandas', 'pdfminer', 'bs4', 'gspread', 'sqlalchemy')\n"
+            "print('heavy:' + ','.join(m for m in heavy if m in sys.modules))\n"
+        )
+        res = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(res.stdout.strip().splitlines()[-1], "heavy:")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,11 @@
+import random
 import unittest
-from slh_sh.utils.pdf import get_pdf_text, rgb_to_hex, hex_to_rgb, is_color_close
+
+import fitz
+
+from itertools import groupby
+from types import SimpleNamespace
+from slh_sh.utils.pdf import PageGeometry, PageWords, ThemeClassifier, rgb_to_lab, get_pdf_text, rgb_to_hex, hex_to_rgb, is_color_close
 
 class TestPDFMethods(unittest.TestCase):
 
@@ -18,6 +24,60 @@ class TestPDFMethods(unittest.TestCase):
         self.assertFalse(is_color_close((0, 0, 0), '#ffffff'))
         self.assertTrue(is_color_close((0.5, 0.5, 0.5), '#7f7f7f', 50))
 
+    def test_page_geometry_matches_linear_scan(self):
+        def linear_scan(blocks, rect):
+            blocks = sorted(blocks, key=lambda w: (w[3], w[0]))
+            hits = [w for w in blocks if fitz.Rect(w[:4]).intersects(rect)]
+            for y1, group in groupby(hits, key=lambda w: w[3]):
+                return " ".join(w[4] for w in group).replace("\n", " ").strip()
+
+        rng = random.Random(0)
+        blocks = []
+        for i in range(200):
+            x0, y0 = rng.uniform(0, 500), rng.uniform(0, 800)
+            blocks.append((x0, y0, x0 + rng.uniform(1, 200), y0 + rng.uniform(1, 120), f"block {i}\n", i, 0))
+        geometry = PageGeometry(blocks)
+        for _ in range(500):
+            x0, y0 = rng.uniform(0, 600), rng.uniform(0, 900)
+            rect = fitz.Rect(x0, y0, x0 + rng.uniform(0, 100), y0 + rng.uniform(0, 60))
+            self.assertEqual(geometry.text(rect), linear_scan(blocks, rect))
+
+    def test_page_words(self):
+        words = PageWords(
+            [
+                (10, 10, 40, 20, "one", 0, 0, 0),
+                (45, 10, 80, 20, "two", 0, 0, 1),
+                (10, 30, 40, 40, "three", 0, 1, 0),
+                (45, 30, 80, 40, "four", 0, 1, 1),
+            ]
+        )
+        # two quads, from the second word of line 1 to the first word of line 2
+        vertices = [(44, 9), (81, 9), (44, 21), (81, 21), (9, 29), (41, 29), (9, 41), (41, 41)]
+        self.assertEqual(words.text(vertices), "two three")
+        # a quad barely touching a word does not select it
+        self.assertEqual(words.text([(38, 9), (70, 9), (38, 21), (70, 21)]), "two")
+        self.assertEqual(words.text([]), "")
+
+    def test_rgb_to_lab(self):
+        lab = rgb_to_lab([[1, 1, 1], [0, 0, 0], [1, 0, 0]])
+        self.assertAlmostEqual(lab[0][0], 100, places=2)
+        self.assertAlmostEqual(lab[1][0], 0, places=2)
+        self.assertAlmostEqual(lab[2][0], 53.24, places=1)
+        self.assertAlmostEqual(lab[2][1], 80.09, places=1)
+
+    def test_theme_classifier(self):
+        yellow = SimpleNamespace(color="yellow", hex="#ffeb3b")
+        blue = SimpleNamespace(color="blue", hex="#69aff1")
+        classifier = ThemeClassifier([yellow, blue])
+        # yellow as exported by another viewer, blue, and a grey matching nothing
+        self.assertEqual(
+            classifier.classify_many([(1, 0.94, 0.3), (0.4, 0.7, 0.95), (0.5, 0.5, 0.5)]),
+            [yellow, blue, None],
+        )
+        self.assertIs(classifier.classify((1, 0.94, 0.3)), yellow)
+        self.assertEqual(len(classifier._memo), 3)
+        self.assertIsNone(ThemeClassifier([]).classify((1, 1, 0)))
+
     # Mocking required for get_pdf_text as it requires a fitz.page object and a fitz.Rect object
     # def test_get_pdf_text(self):
     #     self.assertEqual(get_pdf_text(page, rect), expected_result)
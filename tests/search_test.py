@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest import mock
+from slh_sh.data.models import PdfFile, SearchDocument, Study, Theme
+from slh_sh.modules.extract import find_dist, get_citation
+from slh_sh.modules import search
+from slh_sh.modules.search import (
+    extract_index_dists,
+    index_dists,
+    parse_query,
+    search_index,
+    update_index,
+)
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.db import Base, get_engine, session_scope
+from slh_sh.utils.textcache import get_pages
+from tests.textcache_test import make_pdf
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\npdf_path: pdfs\n")
+        clear_config_cache()
+        Base.metadata.create_all(get_engine())
+        os.mkdir("pdfs")
+        make_pdf(
+            "pdfs/1_Smith_2020.pdf",
+            [["Abstract", "Keywords: social media"], ["Social Media use is rising", "media"]],
+        )
+        make_pdf("pdfs/2_Doe_2021.pdf", [["Media of a social kind"]])
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_parse_query(self):
+        self.assertEqual(
+            parse_query("Social med* AI-based"),
+            [("social", False), ("med", True), ("ai", False), ("based", False)],
+        )
+
+    def test_index_is_updated_incrementally(self):
+        with session_scope():
+            self.assertEqual(update_index()["added"], 2)
+        with session_scope():
+            counts = update_index()
+        self.assertEqual((counts["added"], counts["unchanged"]), (0, 2))
+
+        make_pdf("pdfs/3_Roe_2022.pdf", [["social media again"]])
+        os.remove("pdfs/2_Doe_2021.pdf")
+        make_pdf("pdfs/1_Smith_2020.pdf", [["No longer"]])
+        with session_scope() as dbs:
+            counts = update_index()
+            self.assertEqual(
+                [hit.study for hit in search_index("social media")], ["3"]
+            )
+            studies = dbs.query(PdfFile.study).order_by(PdfFile.study)
+            self.assertEqual([study for study, in studies], ["1", "3"])
+            # the contents of the removed and the replaced file are dropped
+            self.assertEqual(dbs.query(SearchDocument).count(), 2)
+        self.assertEqual(
+            (counts["added"], counts["updated"], counts["removed"], counts["unchanged"]),
+            (1, 1, 1, 0),
+        )
+
+    def test_identical_pdfs_are_indexed_once(self):
+        shutil.copy("pdfs/1_Smith_2020.pdf", "pdfs/4_Copy_2020.pdf")
+        with session_scope() as dbs:
+            counts = update_index()
+            self.assertEqual((counts["added"], counts["indexed"]), (3, 2))
+            self.assertEqual(dbs.query(SearchDocument).count(), 2)
+            self.assertEqual(
+                [hit.study for hit in search_index("social media")], ["1", "1", "4", "4"]
+            )
+
+    def test_phrase_prefix_and_proximity(self):
+        with session_scope():
+            update_index()
+            phrase = search_index("social media")
+            prefix = search_index("soc* med*")
+            near = search_index("social media", near=3)
+            first = search_index("social media", near=3, limit=2)
+            built = []
+            match_sql = search._match_sql
+            with mock.patch.object(
+                search, "_match_sql", side_effect=lambda *args: built.append(match_sql(*args)) or built[-1]
+            ):
+                search_index("media", limit=1)
+            sql, params = built[0]
+
+        self.assertEqual(
+            [(hit.study, hit.page_number, hit.text) for hit in phrase],
+            [("1", 1, "social media"), ("1", 2, "Social Media")],
+        )
+        self.assertEqual(phrase[1].snippet, "Social Media use is rising media")
+        self.assertEqual(len(prefix), 2)
+        self.assertEqual(
+            [(hit.study, hit.text) for hit in near],
+            [("1", "social media"), ("1", "Social Media"), ("2", "Media of a social")],
+        )
+        self.assertEqual([(hit.study, hit.text) for hit in first], [(hit.study, hit.text) for hit in near[:2]])
+        # cut by SQLite, not after fetching every match
+        self.assertTrue(sql.endswith("LIMIT ?"))
+        self.assertEqual(params[-1], 1)
+
+    def test_dist_from_index_without_pdfs(self):
+        with session_scope() as dbs:
+            dbs.add(Study(Covidence=1, title="t", authors="a", abstract="", published_year=2020, citation="(Smith, 2020)"))
+            dbs.add(Study(Covidence=2, title="t", authors="a", abstract="", published_year=2021))
+            dbs.add(Theme(color="Red", term="media", hex="#ff0000"))
+            update_index()
+            expected = find_dist("1", get_pages("pdfs/1_Smith_2020.pdf"), "media", get_citation(dbs, "1"))
+
+        # the index and the text cache are all that is needed
+        os.rename("pdfs", "moved")
+        os.mkdir("pdfs")
+        with session_scope():
+            results = index_dists(["media"])
+        self.assertEqual(results["1"]["media"], expected)
+        self.assertEqual(results["2"]["media"][0], 1)
+
+        os.rmdir("pdfs")
+        os.rename("moved", "pdfs")
+        with session_scope() as dbs:
+            extract_index_dists(["media"], db=True)
+            totals = dbs.query(Study.total_distribution).order_by(Study.Covidence).all()
+        self.assertEqual([total for total, in totals], [3, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
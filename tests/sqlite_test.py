@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.sqlite import bulk_execute, bulk_writes, connect, get_pragmas
+
+
+class TestSQLiteProfile(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text(
+            "sqlite_db: test.db\nsqlite_pragmas:\n    cache_size: -2000\n"
+        )
+        clear_config_cache()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_connect_applies_profile(self):
+        conn = connect()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -2000)
+        conn.close()
+
+    def test_invalid_pragma(self):
+        Path("config.yaml").write_text(
+            "sqlite_db: test.db\nsqlite_pragmas:\n    cache_size: 1; DROP TABLE x\n"
+        )
+        with self.assertRaises(ValueError):
+            get_pragmas()
+
+    def test_bulk_execute(self):
+        conn = connect()
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        count = bulk_execute(
+            conn, "INSERT INTO t VALUES (?)", ((i,) for i in range(25)), batch_size=10
+        )
+        self.assertEqual(count, 25)
+        self.assertEqual(conn.execute("SELECT count(*) FROM t").fetchone()[0], 25)
+        conn.close()
+
+    def test_bulk_writes_rollback(self):
+        conn = connect()
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        with self.assertRaises(RuntimeError):
+            with bulk_writes(conn):
+                conn.execute("INSERT INTO t VALUES (1)")
+                raise RuntimeError()
+        self.assertEqual(conn.execute("SELECT count(*) FROM t").fetchone()[0], 0)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
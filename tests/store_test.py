@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest import mock
+from slh_sh.utils import store
+from slh_sh.utils.store import STORE_DIR, blob_path, file_sha256, prune_store, store_file, store_files
+
+
+class TestPdfStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pdf_dir = self.tmp.name
+        for name, content in (("1_Smith.pdf", b"%PDF-a"), ("2_Doe.pdf", b"%PDF-a"), ("3_Roe.pdf", b"%PDF-b")):
+            Path(self.pdf_dir, name).write_bytes(content)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.pdf_dir, name)
+
+    def test_duplicates_share_one_blob(self):
+        report = store_files(self.pdf_dir, [self.path(n) for n in ("1_Smith.pdf", "2_Doe.pdf", "3_Roe.pdf")], link=True)
+        self.assertEqual([f.status for f in report.files], ["added", "linked", "added"])
+        self.assertEqual(report.errors, {})
+        sha256 = file_sha256(self.path("1_Smith.pdf"))
+        self.assertEqual(report.duplicates, {sha256: ["1_Smith.pdf", "2_Doe.pdf"]})
+        self.assertTrue(os.path.samefile(self.path("2_Doe.pdf"), blob_path(self.pdf_dir, sha256)))
+        self.assertEqual(Path(self.path("2_Doe.pdf")).read_bytes(), b"%PDF-a")
+        # stored files are left as they are
+        self.assertEqual(store_file(self.pdf_dir, self.path("1_Smith.pdf")).status, "stored")
+        self.assertEqual(sorted(os.listdir(self.pdf_dir)), [STORE_DIR, "1_Smith.pdf", "2_Doe.pdf", "3_Roe.pdf"])
+
+    def test_duplicates_are_kept_as_copies_by_default(self):
+        report = store_files(self.pdf_dir, [self.path("1_Smith.pdf"), self.path("2_Doe.pdf")])
+        self.assertEqual([f.status for f in report.files], ["added", "duplicate"])
+        self.assertEqual(len(report.duplicates), 1)
+        self.assertFalse(os.path.samefile(self.path("1_Smith.pdf"), self.path("2_Doe.pdf")))
+
+    def test_blob_edited_in_place_is_not_reused(self):
+        store_files(self.pdf_dir, [self.path("1_Smith.pdf"), self.path("2_Doe.pdf")], link=True)
+        sha256 = file_sha256(self.path("1_Smith.pdf"))
+        # a viewer saves annotations into 1_Smith.pdf in place, 2_Doe.pdf shares them
+        with open(self.path("1_Smith.pdf"), "ab") as f:
+            f.write(b" annotated")
+        Path(self.pdf_dir, "4_New.pdf").write_bytes(b"%PDF-a")
+        stored = store_file(self.pdf_dir, self.path("4_New.pdf"), link=True)
+        self.assertEqual((stored.sha256, stored.status), (sha256, "added"))
+        self.assertEqual(Path(self.path("4_New.pdf")).read_bytes(), b"%PDF-a")
+        self.assertEqual(Path(self.path("2_Doe.pdf")).read_bytes(), b"%PDF-a annotated")
+
+    def test_symlinks_without_hardlink_support(self):
+        with mock.patch.object(store.os, "link", side_effect=OSError("not supported")):
+            first = store_file(self.pdf_dir, self.path("1_Smith.pdf"))
+            second = store_file(self.pdf_dir, self.path("2_Doe.pdf"), link=True)
+        self.assertEqual((first.link, second.link), ("symlink", "symlink"))
+        self.assertTrue(os.path.islink(self.path("1_Smith.pdf")))
+        self.assertEqual(Path(self.path("2_Doe.pdf")).read_bytes(), b"%PDF-a")
+        self.assertEqual(prune_store(self.pdf_dir), [])
+
+    def test_hash_is_memoised_per_inode(self):
+        store_files(self.pdf_dir, [self.path("1_Smith.pdf"), self.path("2_Doe.pdf")], link=True)
+        with mock.patch.object(store.hashlib, "sha256") as sha256:
+            file_sha256(self.path("2_Doe.pdf"))
+        sha256.assert_not_called()
+
+    def test_prune_unlinked_blobs(self):
+        store_files(self.pdf_dir, [self.path("1_Smith.pdf"), self.path("3_Roe.pdf")])
+        sha256 = file_sha256(self.path("3_Roe.pdf"))
+        os.remove(self.path("3_Roe.pdf"))
+        self.assertEqual(prune_store(self.pdf_dir), [blob_path(self.pdf_dir, sha256)])
+        self.assertEqual(prune_store(self.pdf_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
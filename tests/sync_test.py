@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from slh_sh.modules.sync import get_column_ranges, sync_studies_column_sheet
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.sqlite import connect
+
+
+class FakeWorksheet:
+    def __init__(self, columns):
+        self.columns = columns
+        self.requests = []
+
+    def row_values(self, row):
+        return [values[row - 1] for values in self.columns]
+
+    def col_values(self, col):
+        values = list(self.columns[col - 1])
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def batch_update(self, data, **kwargs):
+        self.requests.append(data)
+
+
+class TestColumnSync(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\ngs_header_row_number: '2'\n")
+        clear_config_cache()
+        conn = connect()
+        conn.execute('CREATE TABLE studies ("Covidence" INTEGER, "Keywords" TEXT)')
+        conn.executemany(
+            "INSERT INTO studies VALUES (?, ?)",
+            [(1, "ai"), (2, "law"), (3, None), (4, "media"), (5, "work")],
+        )
+        conn.commit()
+        conn.close()
+        self.ws = FakeWorksheet(
+            [
+                ["Title", "Covidence #", "1", "2", "3", "4", "9", "5"],
+                ["", "Keywords", "", "law", "", "", "", ""],
+            ]
+        )
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_changed_cells_in_one_request(self):
+        counts = sync_studies_column_sheet(self.ws, "Covidence #", "Keywords", apply=True)
+        self.assertEqual(counts, {"updated": 3, "unchanged": 1, "empty": 1, "missing": 1})
+        self.assertEqual(
+            self.ws.requests,
+            [[
+                {"range": "B3:B3", "values": [["ai"]]},
+                {"range": "B6:B6", "values": [["media"]]},
+                {"range": "B8:B8", "values": [["work"]]},
+            ]],
+        )
+
+    def test_dry_run_writes_nothing(self):
+        counts = sync_studies_column_sheet(self.ws, "Covidence #", "Keywords")
+        self.assertEqual(counts["updated"], 3)
+        self.assertEqual(self.ws.requests, [])
+
+    def test_consecutive_rows_are_one_range_in_chunks(self):
+        updates = [(row, str(row), row) for row in range(4, 14)]
+        self.assertEqual(
+            get_column_ranges(updates, 2, chunk_rows=4),
+            [
+                [{"range": "B4:B7", "values": [[4], [5], [6], [7]]}],
+                [{"range": "B8:B11", "values": [[8], [9], [10], [11]]}],
+                [{"range": "B12:B13", "values": [[12], [13]]}],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+
+import fitz
+
+from pathlib import Path
+from unittest import mock
+from slh_sh.utils import textcache
+from slh_sh.utils.config import clear_config_cache
+from slh_sh.utils.db import get_engine, session_scope
+from slh_sh.utils.textcache import get_full_text, get_pages
+
+
+def make_pdf(path, pages):
+    with fitz.open() as doc:
+        for lines in pages:
+            page = doc.new_page()
+            for i, line in enumerate(lines):
+                page.insert_text((72, 72 + i * 40), line)
+        doc.save(path)
+
+
+class TestTextCache(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        Path("config.yaml").write_text("sqlite_db: test.db\n")
+        clear_config_cache()
+        make_pdf("1_Smith_2020.pdf", [["Keywords: social media"], ["Social Media use", "media"]])
+
+    def tearDown(self):
+        get_engine().dispose()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+        clear_config_cache()
+
+    def test_pages_are_parsed_once(self):
+        with mock.patch.object(textcache, "parse_pdf", wraps=textcache.parse_pdf) as parse:
+            with session_scope():
+                pages = get_pages("1_Smith_2020.pdf")
+            with session_scope():
+                cached = get_pages("1_Smith_2020.pdf")
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(cached, pages)
+        self.assertEqual([page.page_number for page in cached], [1, 2])
+        self.assertIn("Keywords: social media", get_full_text(cached))
+
+    def test_changed_file_is_parsed_again(self):
+        with session_scope():
+            get_pages("1_Smith_2020.pdf")
+        make_pdf("1_Smith_2020.pdf", [["Changed"]])
+        with session_scope():
+            pages = get_pages("1_Smith_2020.pdf")
+        self.assertEqual([page.text for page in pages], ["Changed"])
+
+    def test_document_without_pages_is_parsed_once(self):
+        with mock.patch.object(textcache, "parse_pdf", return_value=[]) as parse:
+            with session_scope():
+                self.assertEqual(get_pages("1_Smith_2020.pdf"), [])
+            with session_scope():
+                self.assertEqual(get_pages("1_Smith_2020.pdf"), [])
+            with session_scope() as dbs:
+                sha256 = textcache.file_sha256("1_Smith_2020.pdf")
+                self.assertTrue(textcache.is_cached(dbs.connection(), sha256))
+            self.assertEqual(parse.call_count, 1)
+
+            # the page count is forgotten with the content
+            make_pdf("1_Smith_2020.pdf", [["Changed"]])
+            with session_scope() as dbs:
+                textcache.record_pdf_file(
+                    dbs.connection(),
+                    "1",
+                    "1_Smith_2020.pdf",
+                    os.stat("1_Smith_2020.pdf"),
+                    textcache.file_sha256("1_Smith_2020.pdf"),
+                )
+            with session_scope():
+                get_pages("1_Smith_2020.pdf")
+            self.assertEqual(parse.call_count, 2)
+
+    def test_search_for(self):
+        with session_scope():
+            page = get_pages("1_Smith_2020.pdf")[1]
+        hits = page.search_for("social media")
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(len(page.search_for("MEDIA")), 2)
+        x0, y0, x1, y1 = hits[0]
+        self.assertLess(y1, 72 + 40)
+
+    def test_highlight_text(self):
+        with fitz.open("1_Smith_2020.pdf") as doc:
+            page = doc[1]
+            page.add_highlight_annot(page.search_for("Media use") + page.search_for("media")[-1:])
+            doc.saveIncr()
+        with session_scope():
+            page = get_pages("1_Smith_2020.pdf")[1]
+        annot = page.annots[0]
+        self.assertEqual(annot["type"], "Highlight")
+        self.assertEqual(page.highlight_text(annot), "Media use media")
+        self.assertEqual(page.highlight_text(annot, words=False), "Social Media use")
+
+
+if __name__ == "__main__":
+    unittest.main()